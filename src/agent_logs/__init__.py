@@ -0,0 +1,5 @@
+"""Helpers for writing and reading the session dumps produced by agent_with_dump.
+
+This package only depends on the standard library so that the dump files can
+be inspected from tools that do not have ADK installed.
+"""
@@ -0,0 +1,483 @@
+"""Compact binary encoding for session dumps.
+
+A binary dump file starts with a 6 byte header, `ADKB`, a format version and
+the codec used for its frames (0 = none, 1 = zlib, 2 = zstd). It is followed by
+one frame per record: a little-endian u32 payload length and the (possibly
+compressed) payload. Each frame is self-contained, so a reader can seek to any
+frame offset and decode it on its own.
+
+The format is opt-in (`AGENT_DUMP_FORMAT=binary`): it is smaller on disk,
+especially with compression, but decoding it in Python is not faster than
+`json.loads` of the same records, and the logs viewer only reads JSON dumps.
+
+Inside a payload, values are tagged. Keys and short strings are interned per
+frame: the first occurrence is written in full and later ones as an index into
+the frame's string table. Null fields of objects are not written at all.
+
+Run `python -m agent_logs.binlog --help` for the reader/converter CLI.
+"""
+import argparse
+import base64
+import enum
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+import types
+import zlib
+
+from agent_logs.encoder import iter_fields
+from agent_logs.locking import open_locked
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+MAGIC = b"ADKB"
+VERSION = 1
+CODECS = {"none": 0, "zlib": 1, "zstd": 2}
+CODEC_NAMES = {v: k for k, v in CODECS.items()}
+HEADER_SIZE = 6
+
+_LENGTH = struct.Struct("<I")
+_FLOAT = struct.Struct("<d")
+# Written as the frame length until the frame is complete.
+_INCOMPLETE = 0xFFFFFFFF
+
+T_NULL = 0x00
+T_FALSE = 0x01
+T_TRUE = 0x02
+T_INT = 0x03
+T_FLOAT = 0x04
+T_STR_NEW = 0x05
+T_STR_REF = 0x06
+T_BYTES = 0x07
+T_ARRAY = 0x08
+T_OBJECT = 0x09
+T_END = 0x0A
+T_STR = 0x0B
+
+# Strings longer than this are written inline instead of being interned.
+MAX_INTERNED = 64
+
+_FLUSH_SIZE = 64 * 1024
+
+# filename -> (inode, offset) of the end of the last frame this process checked
+# or wrote, so an append only walks the frames appended by other writers since.
+_checked_ends = {}
+
+
+def _compressor(codec):
+    if codec == CODECS["zlib"]:
+        return zlib.compressobj(6)
+    if codec == CODECS["zstd"]:
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the 'zstandard' package")
+        return zstandard.ZstdCompressor().compressobj()
+    return None
+
+
+def _decompress(codec, payload):
+    if codec == CODECS["zlib"]:
+        return zlib.decompress(payload)
+    if codec == CODECS["zstd"]:
+        if zstandard is None:
+            raise RuntimeError("zstd compressed dumps require the 'zstandard' package")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(payload)
+    return payload
+
+
+def _varint(buf, value):
+    while value > 0x7F:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+class _FrameEncoder:
+    """Encodes one record into a frame, handing out bytes in bounded pieces."""
+
+    def __init__(self, out, blobs=None, exclude=None):
+        self.out = out
+        self.blobs = blobs
+        self.exclude = exclude
+        self.buf = bytearray()
+        self.strings = {}
+
+    def flush(self):
+        if self.buf:
+            self.out(bytes(self.buf))
+            self.buf.clear()
+
+    def string(self, value):
+        buf = self.buf
+        if len(value) <= MAX_INTERNED:
+            index = self.strings.get(value)
+            if index is not None:
+                buf.append(T_STR_REF)
+                _varint(buf, index)
+                return
+            self.strings[value] = len(self.strings)
+            buf.append(T_STR_NEW)
+        else:
+            buf.append(T_STR)
+        data = value.encode("utf-8")
+        _varint(buf, len(data))
+        buf += data
+
+    def value(self, obj, path=""):
+        buf = self.buf
+        if len(buf) >= _FLUSH_SIZE:
+            self.flush()
+        if obj is None:
+            buf.append(T_NULL)
+        elif isinstance(obj, str):
+            if self.blobs is not None and self.blobs.wants(len(obj)):
+                self.object(self.blobs.put(obj).items(), path)
+            else:
+                self.string(obj)
+        elif obj is True:
+            buf.append(T_TRUE)
+        elif obj is False:
+            buf.append(T_FALSE)
+        elif isinstance(obj, int):
+            buf.append(T_INT)
+            _varint(buf, obj * 2 if obj >= 0 else -obj * 2 - 1)
+        elif isinstance(obj, float):
+            buf.append(T_FLOAT)
+            buf += _FLOAT.pack(obj)
+        elif isinstance(obj, enum.Enum):
+            self.value(obj.value, path)
+        elif isinstance(obj, (bytes, bytearray, memoryview)):
+            if self.blobs is not None and self.blobs.wants(len(obj)):
+                self.object(self.blobs.put(obj).items(), path)
+            else:
+                buf.append(T_BYTES)
+                _varint(buf, len(obj))
+                buf += obj
+        elif isinstance(obj, dict):
+            self.object(obj.items(), path)
+        elif isinstance(obj, (list, tuple, types.GeneratorType)):
+            buf.append(T_ARRAY)
+            for item in obj:
+                self.value(item, path)
+            buf.append(T_END)
+        elif hasattr(obj, "dict") or hasattr(obj, "__dict__"):
+            self.object(iter_fields(obj), path)
+        else:
+            self.string(str(obj))
+
+    def object(self, items, path=""):
+        self.buf.append(T_OBJECT)
+        for key, value in items:
+            if value is None:
+                continue
+            key = key if isinstance(key, str) else str(key)
+            child = path
+            if self.exclude:
+                child = f"{path}{key}"
+                if child in self.exclude:
+                    continue
+                child += "."
+            self.string(key)
+            self.value(value, child)
+        self.buf.append(T_END)
+
+
+def _read_header(f):
+    header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or header[:4] != MAGIC:
+        raise ValueError(f"{getattr(f, 'name', 'file')} is not a binary dump")
+    if header[4] != VERSION:
+        raise ValueError(f"unsupported binary dump version {header[4]}")
+    return header[5]
+
+
+def _complete_end(f, start, end):
+    """Offset after the last complete frame, walking the frame headers from `start`."""
+    offset = start
+    while offset + _LENGTH.size <= end:
+        f.seek(offset)
+        (size,) = _LENGTH.unpack(f.read(_LENGTH.size))
+        if size == _INCOMPLETE or offset + _LENGTH.size + size > end:
+            break
+        offset += _LENGTH.size + size
+    return offset
+
+
+def append_binary_record(filename, record, compression="none", blobs=None, exclude=None, on_written=None):
+    """Append `record` as a new frame of the binary dump `filename`.
+
+    The codec is chosen when the file is created; later appends reuse the codec
+    stored in the header. The frame is streamed to disk and its length patched
+    afterwards, so memory use does not depend on the size of the record. If
+    encoding the record fails, the partial frame is cut off again before the
+    error is raised, so later appends stay readable. A frame left incomplete
+    by a killed writer is cut off by the next append, for the same reason.
+
+    `on_written(offset, size)` is called once the frame is complete, before
+    the lock is released.
+
+    Returns:
+        tuple: (offset of the frame in the file, number of bytes of the frame).
+    """
+    fd = open_locked(filename)
+    with os.fdopen(fd, "r+b") as f:
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            codec = CODECS[compression]
+            f.write(MAGIC + bytes([VERSION, codec]))
+        else:
+            f.seek(0)
+            codec = _read_header(f)
+            inode, checked = _checked_ends.get(filename, (None, HEADER_SIZE))
+            if inode != os.fstat(fd).st_ino or checked > end:
+                checked = HEADER_SIZE
+            complete = _complete_end(f, checked, end)
+            if complete < end:
+                f.truncate(complete)
+            f.seek(complete)
+        offset = f.tell()
+        f.write(_LENGTH.pack(_INCOMPLETE))
+
+        compressor = _compressor(codec)
+        if compressor is None:
+            out = f.write
+        else:
+            def out(data):
+                f.write(compressor.compress(data))
+
+        try:
+            encoder = _FrameEncoder(out, blobs, exclude)
+            encoder.value(record)
+            encoder.flush()
+            if compressor is not None:
+                f.write(compressor.flush())
+        except BaseException:
+            # Readers stop at an incomplete frame: it must not stay in front of later ones.
+            f.truncate(offset)
+            raise
+
+        frame_end = f.tell()
+        f.seek(offset)
+        f.write(_LENGTH.pack(frame_end - offset - _LENGTH.size))
+        _checked_ends[filename] = (os.fstat(fd).st_ino, frame_end)
+        if on_written is not None:
+            f.flush()
+            on_written(offset, frame_end - offset)
+    return offset, frame_end - offset
+
+
+def decode_payload(payload):
+    """Decode one uncompressed frame payload into Python objects."""
+    strings = []
+    data = memoryview(payload)
+    pos = 0
+
+    def varint():
+        nonlocal pos
+        result = 0
+        shift = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            result |= (b & 0x7F) << shift
+            if b < 0x80:
+                return result
+            shift += 7
+
+    def text(tag):
+        nonlocal pos
+        if tag == T_STR_REF:
+            return strings[varint()]
+        size = varint()
+        value = str(data[pos:pos + size], "utf-8")
+        pos += size
+        if tag == T_STR_NEW:
+            strings.append(value)
+        return value
+
+    def value():
+        nonlocal pos
+        tag = data[pos]
+        pos += 1
+        if tag == T_OBJECT:
+            obj = {}
+            while data[pos] != T_END:
+                key_tag = data[pos]
+                pos += 1
+                key = text(key_tag)
+                obj[key] = value()
+            pos += 1
+            return obj
+        if tag == T_ARRAY:
+            items = []
+            while data[pos] != T_END:
+                items.append(value())
+            pos += 1
+            return items
+        if tag in (T_STR_NEW, T_STR_REF, T_STR):
+            return text(tag)
+        if tag == T_INT:
+            n = varint()
+            return n >> 1 if not n & 1 else -((n + 1) >> 1)
+        if tag == T_FLOAT:
+            pos += 8
+            return _FLOAT.unpack_from(data, pos - 8)[0]
+        if tag == T_NULL:
+            return None
+        if tag == T_TRUE:
+            return True
+        if tag == T_FALSE:
+            return False
+        if tag == T_BYTES:
+            size = varint()
+            pos += size
+            return {"__bytes__": base64.b64encode(data[pos - size:pos]).decode("utf-8")}
+        raise ValueError(f"unknown tag 0x{tag:02x} at offset {pos - 1}")
+
+    return value()
+
+
+def read_frame(f, offset):
+    """Decode the frame starting at `offset` of an open binary dump."""
+    f.seek(0)
+    codec = _read_header(f)
+    f.seek(offset)
+    (size,) = _LENGTH.unpack(f.read(_LENGTH.size))
+    return decode_payload(_decompress(codec, f.read(size)))
+
+
+def iter_frames(filename, offset=None):
+    """Yield (offset, record) for every complete frame of a binary dump."""
+    with open(filename, "rb") as f:
+        yield from read_frames(f, offset)
+
+
+def read_frames(f, offset=None):
+    """Like `iter_frames`, for an already open (possibly gzip) file object."""
+    codec = _read_header(f)
+    if offset is not None:
+        f.seek(max(offset, HEADER_SIZE))
+    while True:
+        frame_offset = f.tell()
+        head = f.read(_LENGTH.size)
+        if len(head) < _LENGTH.size:
+            return
+        (size,) = _LENGTH.unpack(head)
+        if size == _INCOMPLETE:
+            return
+        payload = f.read(size)
+        if len(payload) < size:
+            return
+        yield frame_offset, decode_payload(_decompress(codec, payload))
+
+
+def iter_records(filename):
+    """Yield the records of a binary dump one at a time."""
+    for _, record in iter_frames(filename):
+        yield record
+
+
+def is_binary_dump(filename):
+    with open(filename, "rb") as f:
+        return f.read(4) == MAGIC
+
+
+def _cmd_cat(args):
+    out = sys.stdout
+    if args.array:
+        out.write("[\n")
+    first = True
+    for record in iter_records(args.file):
+        if args.blobs:
+            from agent_logs.blobs import resolve_blobs
+            record = resolve_blobs(record, args.blobs)
+        if args.array and not first:
+            out.write(",\n")
+        first = False
+        out.write(json.dumps(record))
+        if not args.array:
+            out.write("\n")
+    if args.array:
+        out.write("\n]\n")
+
+
+def _cmd_convert(args):
+    if is_binary_dump(args.src):
+        with open(args.dst, "w") as out:
+            out.write("[\n")
+            for i, record in enumerate(iter_records(args.src)):
+                if i:
+                    out.write(",\n")
+                json.dump(record, out)
+            out.write("\n]\n")
+        return
+    with open(args.src) as f:
+        records = json.load(f)
+    if os.path.exists(args.dst):
+        os.remove(args.dst)
+    for record in records:
+        append_binary_record(args.dst, record, args.compression)
+
+
+def _cmd_bench(args):
+    with open(args.file, "rb") as f:
+        raw = f.read()
+    records = json.loads(raw)
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        json.loads(raw)
+    json_time = (time.perf_counter() - start) / args.repeat
+    mb = len(raw) / 1e6
+    print(f"{'format':<12}{'bytes':>12}{'decode ms':>12}{'MB/s (json)':>14}{'records/s':>12}")
+    print(f"{'json':<12}{len(raw):>12}{json_time * 1e3:>12.2f}{mb / json_time:>14.1f}"
+          f"{len(records) / json_time:>12.0f}")
+
+    codecs = ["none", "zlib"] + (["zstd"] if zstandard is not None else [])
+    with tempfile.TemporaryDirectory() as tmp:
+        for codec in codecs:
+            path = os.path.join(tmp, f"bench.{codec}.adkb")
+            for record in records:
+                append_binary_record(path, record, codec)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for _ in iter_records(path):
+                    pass
+            elapsed = (time.perf_counter() - start) / args.repeat
+            # Throughput is expressed against the size of the JSON input so the
+            # numbers are comparable across formats.
+            print(f"{'adkb/' + codec:<12}{os.path.getsize(path):>12}{elapsed * 1e3:>12.2f}"
+                  f"{mb / elapsed:>14.1f}{len(records) / elapsed:>12.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read, convert and benchmark binary session dumps.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    cat = sub.add_parser("cat", help="Stream the records of a binary dump as JSON.")
+    cat.add_argument("file")
+    cat.add_argument("--array", action="store_true", help="Write a JSON array instead of JSON lines.")
+    cat.add_argument("--blobs", help="Blob directory used to inline blob references.")
+    cat.set_defaults(func=_cmd_cat)
+
+    convert = sub.add_parser("convert", help="Convert between a JSON array dump and a binary dump.")
+    convert.add_argument("src")
+    convert.add_argument("dst")
+    convert.add_argument("--compression", choices=sorted(CODECS), default="none")
+    convert.set_defaults(func=_cmd_convert)
+
+    bench = sub.add_parser("bench", help="Compare decode speed of a JSON dump and its binary encodings.")
+    bench.add_argument("file", help="A JSON array dump, e.g. logs/<timestamp>/events.json.")
+    bench.add_argument("--repeat", type=int, default=5)
+    bench.set_defaults(func=_cmd_bench)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
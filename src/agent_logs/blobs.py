@@ -0,0 +1,113 @@
+"""Content-addressed sidecar store for large dump payloads.
+
+Payloads above a size threshold (inline images, long prompts, big tool
+responses) are written once to `<root>/<sha256[:2]>/<sha256>` and the dump
+record only keeps a reference:
+
+    {"__blob__": "<sha256>", "length": <bytes>, "type": "bytes" | "text"}
+"""
+import base64
+import hashlib
+import os
+from collections import OrderedDict
+
+DEFAULT_THRESHOLD = 16 * 1024
+
+# Recently stored payloads are remembered by identity, so the same event payload
+# is not hashed again on every dump of the session. The cache keeps the payloads
+# alive, so it is bounded by their total size.
+_SEEN_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class BlobStore:
+    """Stores payloads by SHA-256 and hands back references for the dump records."""
+
+    def __init__(self, root: str, threshold: int = DEFAULT_THRESHOLD):
+        self.root = root
+        self.threshold = threshold
+        self._known = set()
+        self._seen = OrderedDict()
+        self._seen_bytes = 0
+        os.makedirs(root, exist_ok=True)
+
+    def wants(self, size: int) -> bool:
+        return self.threshold > 0 and size >= self.threshold
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, payload) -> dict:
+        """Store `payload` (str or bytes-like) and return its reference."""
+        cached = self._seen.get(id(payload))
+        if cached is not None and cached[0] is payload:
+            self._seen.move_to_end(id(payload))
+            return cached[1]
+
+        if isinstance(payload, str):
+            data = memoryview(payload.encode("utf-8"))
+            kind = "text"
+        else:
+            data = memoryview(payload).cast("B")
+            kind = "bytes"
+        digest = hashlib.sha256(data).hexdigest()
+        if digest not in self._known:
+            self._write(digest, data)
+            self._known.add(digest)
+
+        ref = {"__blob__": digest, "length": data.nbytes, "type": kind}
+        previous = self._seen.pop(id(payload), None)
+        if previous is not None:
+            self._seen_bytes -= previous[1]["length"]
+        self._seen[id(payload)] = (payload, ref)
+        self._seen_bytes += ref["length"]
+        while self._seen_bytes > _SEEN_CACHE_BYTES and self._seen:
+            _, (_, old_ref) = self._seen.popitem(last=False)
+            self._seen_bytes -= old_ref["length"]
+        return ref
+
+    def _write(self, digest, data):
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            offset = 0
+            while offset < data.nbytes:
+                offset += os.write(fd, data[offset:])
+        finally:
+            os.close(fd)
+        os.replace(tmp, path)
+
+
+def is_blob_ref(obj) -> bool:
+    return isinstance(obj, dict) and "__blob__" in obj
+
+
+def load_blob(root: str, ref: dict):
+    """Read the payload behind `ref`; text blobs are returned as str."""
+    digest = ref["__blob__"]
+    with open(os.path.join(root, digest[:2], digest), "rb") as f:
+        data = f.read()
+    if ref.get("type") == "text":
+        return data.decode("utf-8")
+    return data
+
+
+def resolve_blobs(obj, root: str):
+    """Replace blob references in a decoded record by their inline form.
+
+    Bytes come back as `{"__bytes__": <base64>}` so the result matches a dump
+    written without a blob store.
+    """
+    if is_blob_ref(obj):
+        payload = load_blob(root, obj)
+        if isinstance(payload, bytes):
+            return {"__bytes__": base64.b64encode(payload).decode("utf-8")}
+        return payload
+    if isinstance(obj, dict):
+        return {k: resolve_blobs(v, root) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [resolve_blobs(v, root) for v in obj]
+    return obj
@@ -0,0 +1,295 @@
+"""Columnar export of dumped sessions for fleet-wide analysis.
+
+Flattens the `events` and `state` dumps of one or many log directories into
+three tables, saved as NumPy `.npz` files:
+
+- `events.npz`: one row per event (each event once, although every events
+  record repeats its session's history). `size` is the JSON size of the event
+  in its dump, -1 for binary dumps.
+- `calls.npz`: one row per function call and per function response.
+- `state.npz`: one row per state key change (`actions.state_delta` of the
+  events) and per key of every `state` record snapshot.
+
+String columns are dictionary-encoded: `<column>` holds int32 codes into the
+`<column>.dict` array of distinct values. Numeric columns are plain arrays, so
+aggregations are NumPy operations over columns:
+
+    python -m agent_logs.columnar export logs analytics/
+    python -m agent_logs.columnar summary analytics/
+
+    tables = load_tables("analytics/")
+    events = tables["events"]
+    user_turns = np.bincount(events["session_id"], weights=events["author"] == code_of(events, "author", "user"))
+
+Rows are built with the standard library; NumPy is only needed to save and
+load the tables (`pip install numpy`).
+"""
+import argparse
+import json
+import os
+from array import array
+from datetime import datetime
+
+from agent_logs.merge import dump_files, iter_events, iter_file, log_dirs
+
+try:
+    import numpy as np
+except ImportError:  # only needed to save and load tables
+    np = None
+
+# table -> {column: "str" | typecode of `array`}
+SCHEMA = {
+    "events": {
+        "log_dir": "str", "session_id": "str", "event_id": "str", "invocation_id": "str", "author": "str",
+        "timestamp": "d", "size": "q", "parts": "l", "function_calls": "l", "function_responses": "l",
+        "text_chars": "q", "state_keys": "l", "transfer_to_agent": "str",
+    },
+    "calls": {
+        "log_dir": "str", "session_id": "str", "event_id": "str", "invocation_id": "str", "author": "str",
+        "timestamp": "d", "kind": "str", "name": "str", "call_id": "str", "payload_bytes": "q",
+    },
+    "state": {
+        "log_dir": "str", "session_id": "str", "event_id": "str", "invocation_id": "str", "author": "str",
+        "timestamp": "d", "source": "str", "key": "str", "value_bytes": "q",
+    },
+}
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("the columnar export needs NumPy: pip install numpy")
+
+
+class TableBuilder:
+    """Accumulates the rows of one table as typed arrays and string codes."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.data = {}
+        self.vocab = {}
+        for name, kind in columns.items():
+            if kind == "str":
+                self.data[name] = array("l")
+                self.vocab[name] = {}
+            else:
+                self.data[name] = array(kind)
+
+    def __len__(self):
+        return len(self.data["timestamp"])
+
+    def add(self, **row):
+        for name, kind in self.columns.items():
+            value = row.get(name)
+            if kind == "str":
+                vocab = self.vocab[name]
+                text = "" if value is None else str(value)
+                code = vocab.get(text)
+                if code is None:
+                    code = vocab[text] = len(vocab)
+                self.data[name].append(code)
+            elif kind == "d":
+                self.data[name].append(float("nan") if value is None else float(value))
+            else:
+                self.data[name].append(-1 if value is None else int(value))
+
+    def save(self, path):
+        _require_numpy()
+        arrays = {}
+        for name, kind in self.columns.items():
+            if kind == "str":
+                arrays[name] = np.frombuffer(self.data[name], dtype=np.dtype(f"i{self.data[name].itemsize}")).astype(np.int32)
+                arrays[f"{name}.dict"] = np.array(list(self.vocab[name]), dtype=str)
+            else:
+                arrays[name] = np.frombuffer(self.data[name], dtype=np.dtype(self.data[name].typecode))
+        np.savez_compressed(path, **arrays)
+
+
+def _timestamp(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _json_size(value):
+    return len(json.dumps(value, separators=(",", ":"), default=str))
+
+
+def _add_event(tables, log_dir, session_id, size, event):
+    content = event.get("content") or {}
+    parts = content.get("parts") or []
+    actions = event.get("actions") or {}
+    state_delta = actions.get("state_delta") or {}
+    common = dict(
+        log_dir=log_dir,
+        session_id=session_id,
+        event_id=event.get("id"),
+        invocation_id=event.get("invocation_id"),
+        author=event.get("author"),
+        timestamp=_timestamp(event.get("timestamp")),
+    )
+    calls = responses = text_chars = 0
+    for part in parts:
+        text_chars += len(part.get("text") or "")
+        call = part.get("function_call")
+        if call:
+            calls += 1
+            tables["calls"].add(kind="call", name=call.get("name"), call_id=call.get("id"),
+                                payload_bytes=_json_size(call.get("args")), **common)
+        response = part.get("function_response")
+        if response:
+            responses += 1
+            tables["calls"].add(kind="response", name=response.get("name"), call_id=response.get("id"),
+                                payload_bytes=_json_size(response.get("response")), **common)
+    for key, value in state_delta.items():
+        tables["state"].add(source="delta", key=key, value_bytes=_json_size(value), **common)
+    tables["events"].add(size=size, parts=len(parts), function_calls=calls, function_responses=responses,
+                         text_chars=text_chars, state_keys=len(state_delta),
+                         transfer_to_agent=actions.get("transfer_to_agent"), **common)
+
+
+def _add_snapshot(tables, log_dir, session_id, record):
+    state = record.get("state")
+    if not isinstance(state, dict):
+        return
+    # Snapshot timestamps are in the dump format; keep them comparable with events.
+    timestamp = _dump_timestamp(record.get("timestamp"))
+    for key, value in state.items():
+        tables["state"].add(log_dir=log_dir, session_id=session_id,
+                            invocation_id=record.get("invocation_id"), author=record.get("agent"),
+                            timestamp=timestamp, source="snapshot", key=key, value_bytes=_json_size(value))
+
+
+def _dump_timestamp(value):
+    """Epoch seconds of a `%Y-%m-%d_%H-%M-%S-%f` dump timestamp (local time)."""
+    try:
+        return datetime.strptime(value[:19], "%Y-%m-%d_%H-%M-%S").timestamp() + int(value[20:] or 0) / 1000
+    except (TypeError, ValueError):
+        return None
+
+
+def build_tables(root):
+    """Flatten the dumps under `root` into `TableBuilder`s keyed by table name."""
+    tables = {name: TableBuilder(columns) for name, columns in SCHEMA.items()}
+    for log_dir in log_dirs(root):
+        label = os.path.basename(os.path.normpath(log_dir))
+        seen = set()
+        # Older records have no session id; every record of a session starts
+        # with the same first event. The state record of a dump has the
+        # timestamp and agent of its events record, so it gets the same key.
+        dump_sessions = {}
+        files = list(dump_files(log_dir))
+        for stream, path in files:
+            if stream != "events":
+                continue
+            first_events = {}
+            for record_offset, record, _, size, event in iter_events(path):
+                if record_offset not in first_events:
+                    first_events[record_offset] = event.get("id")
+                    if not record.get("session_id"):
+                        dump_sessions[(record.get("timestamp"), record.get("agent"))] = event.get("id")
+                if event.get("id") in seen:
+                    continue
+                seen.add(event.get("id"))
+                _add_event(tables, label, record.get("session_id") or first_events[record_offset], size, event)
+        for stream, path in files:
+            if stream == "state":
+                for record in iter_file(path):
+                    session_id = record.get("session_id") or dump_sessions.get((record.get("timestamp"),
+                                                                                record.get("agent")))
+                    _add_snapshot(tables, label, session_id, record)
+    return tables
+
+
+def export(root, out_dir):
+    """Write `events.npz`, `calls.npz` and `state.npz` to `out_dir`; return the row counts."""
+    _require_numpy()
+    tables = build_tables(root)
+    os.makedirs(out_dir, exist_ok=True)
+    for name, table in tables.items():
+        table.save(os.path.join(out_dir, f"{name}.npz"))
+    return {name: len(table) for name, table in tables.items()}
+
+
+def load_tables(out_dir):
+    """Load the exported tables as {table: {column: ndarray}}."""
+    _require_numpy()
+    tables = {}
+    for name in SCHEMA:
+        path = os.path.join(out_dir, f"{name}.npz")
+        if os.path.exists(path):
+            with np.load(path) as data:
+                tables[name] = {column: data[column] for column in data.files}
+    return tables
+
+
+def code_of(table, column, value):
+    """Code of `value` in a dictionary-encoded column, or -1 if absent."""
+    matches = np.flatnonzero(table[f"{column}.dict"] == value)
+    return int(matches[0]) if matches.size else -1
+
+
+def summary(tables):
+    """A few fleet-wide aggregates, computed over columns."""
+    events, calls, state = tables["events"], tables["calls"], tables["state"]
+    report = {}
+
+    sessions = events["session_id"]
+    user = code_of(events, "author", "user")
+    turns = np.bincount(sessions, weights=(events["author"] == user), minlength=len(events["session_id.dict"]))
+    report["sessions"] = int(np.count_nonzero(np.bincount(sessions)))
+    report["events"] = int(sessions.size)
+    report["mean_user_turns_per_session"] = float(turns[turns > 0].mean()) if np.any(turns > 0) else 0.0
+
+    # Time between an event and the previous event of the same session is
+    # charged to the author of the later one.
+    order = np.lexsort((events["timestamp"], sessions))
+    ts, sess, author = events["timestamp"][order], sessions[order], events["author"][order]
+    gaps = np.diff(ts)
+    same = sess[1:] == sess[:-1]
+    authors = author[1:][same]
+    seconds = np.bincount(authors, weights=gaps[same], minlength=len(events["author.dict"]))
+    counts = np.bincount(authors, minlength=len(events["author.dict"]))
+    slowest = np.argsort(-seconds)
+    report["time_by_author"] = [
+        {"author": str(events["author.dict"][i]), "seconds": float(seconds[i]), "events": int(counts[i])}
+        for i in slowest if counts[i]
+    ]
+
+    names = calls["name"][calls["kind"] == code_of(calls, "kind", "call")]
+    call_counts = np.bincount(names, minlength=len(calls["name.dict"]))
+    report["function_calls"] = {
+        str(calls["name.dict"][i]): int(call_counts[i]) for i in np.argsort(-call_counts) if call_counts[i]
+    }
+
+    snapshots = state["source"] == code_of(state, "source", "snapshot")
+    keys = state["key"][snapshots]
+    largest = np.zeros(len(state["key.dict"]), dtype=np.int64)
+    np.maximum.at(largest, keys, state["value_bytes"][snapshots])
+    report["largest_state_keys"] = {
+        str(state["key.dict"][i]): int(largest[i]) for i in np.argsort(-largest)[:20] if largest[i]
+    }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export dumped sessions to column-oriented NumPy files.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = sub.add_parser("export", help="Flatten the dumps into events.npz, calls.npz and state.npz.")
+    export_cmd.add_argument("root", help="The logs directory, or one logs/<timestamp> directory.")
+    export_cmd.add_argument("out_dir")
+
+    summary_cmd = sub.add_parser("summary", help="Print fleet-wide aggregates of an export.")
+    summary_cmd.add_argument("out_dir")
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        for name, rows in export(args.root, args.out_dir).items():
+            print(f"{name}: {rows} rows")
+    else:
+        print(json.dumps(summary(load_tables(args.out_dir)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
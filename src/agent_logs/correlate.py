@@ -0,0 +1,366 @@
+"""Join the `adk web` text logs with the dumped sessions and invocations.
+
+The text logs written by `process_log.py` (`logs/agent_events_*.log`) are
+stamped with local wall-clock times; the dumped events carry epoch seconds.
+Both are put on one time axis (the UTC offset of the logs is recovered from
+the events that `adk web` logs as it streams them, which carry their epoch
+timestamp) and merged into one time-ordered index. Every log line is then
+attached to a session, an invocation and an agent turn:
+
+- `id`: the line names the invocation (`e-<uuid>`);
+- `session`: the line names a session (e.g. `/sessions/<id>` in an access
+  line), and the invocation of that session running at that time is used;
+- `window`: the invocation running at that time, the innermost one when
+  invocations run through an `AgentTool` are nested.
+
+Each `POST /run` or `/run_sse` access line is matched with the top-level
+invocation it ran (started at a `/run_sse` line, finished at a `/run` line),
+so a slow request maps in one step to its agent turns:
+
+    python -m agent_logs.correlate requests logs --slowest 5
+    python -m agent_logs.correlate timeline logs --invocation e-2e05797d-...
+"""
+import argparse
+import bisect
+import glob
+import heapq
+import json
+import os
+import re
+from datetime import datetime, timezone
+
+from agent_logs import merge
+from agent_logs.latency import KINDS, load_invocations
+
+# Seconds a line may fall outside of the invocation it is attached to.
+DEFAULT_SLACK = 1.0
+
+_LINE = re.compile(r'^\[(?P<stamp>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})\](?P<tag>\[[EP]\])? ?(?P<text>.*)$')
+_INVOCATION_ID = re.compile(r'\be-[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b')
+_SESSION_PATH = re.compile(r'/sessions?/(?P<session>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})')
+_ACCESS = re.compile(r'^[A-Z]+:\s+\S+ - "(?P<method>[A-Z]+) (?P<path>[^\s?]+)\S* HTTP/[\d.]+" (?P<status>\d{3})')
+_STREAMED_EVENT = re.compile(r'Generated event in agent run streaming: (?P<json>\{.*\})$')
+_AGENT_NAME = re.compile(r'Your internal name is "(?P<agent>[^"]+)"')
+# First line of a Python logging or uvicorn record; other lines continue the
+# previous record of the same stream (e.g. the body of an `LLM Request:`).
+_RECORD_START = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3} - |[A-Z]+:\s)')
+_RUN_PATHS = ("/run", "/run_sse")
+
+
+def _local_epoch(stamp):
+    """Seconds of a `%Y-%m-%d %H:%M:%S.mmm` log stamp, as if it were UTC."""
+    naive = datetime.strptime(stamp[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return naive.timestamp() + int(stamp[20:23]) / 1000
+
+
+def text_logs(root):
+    """The `agent_events_*.log` files of a logs directory (or of the parent of a dump directory)."""
+    paths = sorted(glob.glob(os.path.join(root, "agent_events_*.log")))
+    if not paths:
+        paths = sorted(glob.glob(os.path.join(os.path.dirname(os.path.normpath(root)), "agent_events_*.log")))
+    return paths
+
+
+def read_log(path):
+    """Parse a text log into line dicts, and (local stamp, epoch) samples for the UTC offset.
+
+    Continuation lines point to the first line of their record in `record`,
+    and the agent named in a record is set on its first line.
+    """
+    lines, samples = [], []
+    records = {}
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for lineno, raw in enumerate(f, 1):
+            match = _LINE.match(raw.rstrip("\n"))
+            if match is None:
+                continue
+            text = match.group("text")
+            line = {"path": path, "lineno": lineno, "stamp": match.group("stamp"),
+                    "local": _local_epoch(match.group("stamp")),
+                    "stream": "stderr" if match.group("tag") == "[E]" else "stdout", "text": text}
+            if _RECORD_START.match(text):
+                records[line["stream"]] = line
+            elif line["stream"] in records:
+                line["record"] = records[line["stream"]]
+            ids = _INVOCATION_ID.findall(text)
+            if ids:
+                line["invocation_ids"] = ids
+            session = _SESSION_PATH.search(text)
+            if session:
+                line["session_id"] = session.group("session")
+            access = _ACCESS.match(text)
+            if access:
+                line["request"] = {"method": access.group("method"), "path": access.group("path"),
+                                   "status": int(access.group("status"))}
+            agent = _AGENT_NAME.search(text)
+            if agent:
+                line.get("record", line)["agent"] = agent.group("agent")
+            streamed = _STREAMED_EVENT.search(text)
+            if streamed:
+                try:
+                    event = json.loads(streamed.group("json"))
+                except ValueError:
+                    event = {}
+                if event.get("timestamp"):
+                    samples.append((line["local"], float(event["timestamp"])))
+                if event.get("author"):
+                    line["agent"] = event["author"]
+            lines.append(line)
+    return lines, samples
+
+
+def load_logs(paths, utc_offset=None):
+    """The lines of `paths` in time order, with their epoch `time`, and the UTC offset used.
+
+    Args:
+        utc_offset: Seconds east of UTC of the machine that wrote the logs;
+            recovered from the streamed events when None, else the local one.
+    """
+    lines, samples = [], []
+    for path in paths:
+        path_lines, path_samples = read_log(path)
+        lines += path_lines
+        samples += path_samples
+    if utc_offset is None:
+        if samples:
+            utc_offset = merge.utc_offset(samples)
+        else:
+            utc_offset = datetime.now().astimezone().utcoffset().total_seconds()
+    for line in lines:
+        line["time"] = line["local"] - utc_offset
+    # The stamps of the two pipes of older logs are not in file order.
+    lines.sort(key=lambda line: line["time"])
+    return lines, utc_offset
+
+
+def _end(invocation):
+    return invocation.end if invocation.end is not None else invocation.events[-1].timestamp
+
+
+def _depth(invocation):
+    depth = 0
+    while invocation.parent is not None:
+        invocation = invocation.parent
+        depth += 1
+    return depth
+
+
+def _innermost(invocation, time):
+    # Invocations that contain `time` first, not the ones within the slack.
+    return invocation.start <= time <= _end(invocation), _depth(invocation), invocation.start
+
+
+def _attach(line, invocation, how, turns):
+    line["invocation_id"] = invocation.invocation_id
+    line["session_id"] = line.get("session_id") or invocation.session_id
+    line["how"] = how
+    if invocation.invocation_id not in turns:
+        turns[invocation.invocation_id] = invocation.turns()
+    for i, turn in enumerate(turns[invocation.invocation_id]):
+        if turn["start"] <= line["time"] <= turn["start"] + turn["seconds"]:
+            line["turn"] = i
+            line["turn_agent"] = turn["agent"]
+            break
+
+
+def correlate(lines, invocations, slack=DEFAULT_SLACK):
+    """Attach every line (sorted by time) to the session, invocation and turn running then.
+
+    Sweeps the lines and the invocations ordered by start once, keeping the
+    invocations running at the time of the current line.
+    """
+    pending = sorted(invocations.values(), key=lambda invocation: invocation.start)
+    active = []  # heap of (end, start, id, invocation)
+    turns = {}
+    i = 0
+    for line in lines:
+        record = line.get("record")
+        if record is not None:
+            for key in ("invocation_id", "session_id", "how", "turn", "turn_agent", "ambiguous"):
+                if key in record:
+                    line[key] = record[key]
+            continue
+        time = line["time"]
+        while i < len(pending) and pending[i].start - slack <= time:
+            invocation = pending[i]
+            heapq.heappush(active, (_end(invocation), invocation.start, id(invocation), invocation))
+            i += 1
+        while active and active[0][0] + slack < time:
+            heapq.heappop(active)
+        running = [entry[3] for entry in active]
+        named = [invocations[iid] for iid in line.get("invocation_ids", ()) if iid in invocations]
+        if named:
+            _attach(line, named[0], "id", turns)
+            continue
+        if line.get("session_id"):
+            in_session = [inv for inv in running if inv.session_id == line["session_id"]]
+            if in_session:
+                _attach(line, max(in_session, key=lambda inv: _innermost(inv, time)), "session", turns)
+            else:
+                line["how"] = "session"
+            continue
+        if line.get("agent"):
+            by_agent = [inv for inv in running if line["agent"] in {e.author for e in inv.events}]
+            running = by_agent or running
+        if running:
+            _attach(line, max(running, key=lambda inv: _innermost(inv, time)), "window", turns)
+            if len({inv.session_id for inv in running}) > 1:
+                line["ambiguous"] = True
+    return lines
+
+
+def match_requests(lines, invocations, slack=DEFAULT_SLACK):
+    """Pair each `/run` and `/run_sse` access line with the top-level invocation it ran.
+
+    `/run_sse` lines are logged when the stream starts and `/run` lines when
+    the response is sent, so they are matched with the closest invocation
+    start or end respectively.
+    """
+    roots = sorted((inv for inv in invocations.values() if inv.parent is None), key=lambda inv: inv.start)
+    starts = [inv.start for inv in roots]
+    used = set()
+    requests = []
+    for line in lines:
+        request = line.get("request")
+        if not request or request["method"] != "POST" or request["path"] not in _RUN_PATHS:
+            continue
+        time = line["time"]
+        if request["path"] == "/run_sse":
+            lo, hi = bisect.bisect_left(starts, time - slack), bisect.bisect_right(starts, time + slack)
+            candidates = [(abs(roots[k].start - time), roots[k]) for k in range(lo, hi)]
+        else:
+            candidates = [(abs(_end(inv) - time), inv) for inv in roots if abs(_end(inv) - time) <= slack]
+        candidates = [(gap, inv) for gap, inv in candidates if inv.invocation_id not in used]
+        invocation = min(candidates, key=lambda candidate: candidate[0])[1] if candidates else None
+        if invocation is not None:
+            used.add(invocation.invocation_id)
+            line["invocation_id"] = invocation.invocation_id
+            line["session_id"] = invocation.session_id
+            line["how"] = "request"
+        requests.append((line, invocation))
+    return requests
+
+
+def _nested(invocation):
+    yield invocation
+    for children in invocation.children.values():
+        for child in children:
+            yield from _nested(child)
+
+
+def request_json(line, invocation):
+    data = {"stamp": line["stamp"], "log": f"{line['path']}:{line['lineno']}", **line["request"],
+            "invocation_id": None, "session_id": None, "seconds": None, "turns": []}
+    if invocation is None:
+        return data
+    data.update(invocation_id=invocation.invocation_id, session_id=invocation.session_id,
+                agent=invocation.agent, seconds=invocation.duration, critical_path=invocation.critical_path())
+    for inv in _nested(invocation):
+        for turn in inv.turns():
+            data["turns"].append({"invocation_id": inv.invocation_id, "offset": turn["start"] - invocation.start,
+                                  **{key: value for key, value in turn.items() if key != "start"}})
+    data["turns"].sort(key=lambda turn: turn["offset"])
+    return data
+
+
+def merged_index(lines, invocations):
+    """Log lines and dumped events in one time-ordered list of entries."""
+    entries = []
+    for line in lines:
+        entry = {"time": line["time"], "type": "log", **{k: v for k, v in line.items() if k not in ("local", "record")}}
+        if "record" in line:
+            entry["record_lineno"] = line["record"]["lineno"]
+        entries.append(entry)
+    for invocation in invocations.values():
+        for event in invocation.events:
+            entries.append({"time": event.timestamp, "type": "event", "event_id": event.id,
+                            "invocation_id": invocation.invocation_id, "session_id": invocation.session_id,
+                            "agent": event.author, "calls": [name for _, name in event.calls],
+                            "responses": [name for _, name in event.responses], "transfer": event.transfer})
+    entries.sort(key=lambda entry: entry["time"])
+    return entries
+
+
+def _load(args):
+    invocations = load_invocations(args.root)
+    paths = args.log or text_logs(args.root)
+    offset = args.utc_offset * 3600 if args.utc_offset is not None else None
+    lines, offset = load_logs(paths, offset)
+    requests = match_requests(lines, invocations, args.slack)
+    correlate([line for line in lines if line.get("how") != "request"], invocations, args.slack)
+    return lines, invocations, requests, offset
+
+
+def _cmd_requests(args):
+    _, _, requests, _ = _load(args)
+    requests = [request_json(line, invocation) for line, invocation in requests]
+    if args.slowest:
+        requests = sorted(requests, key=lambda r: -(r["seconds"] or 0))[:args.slowest]
+    if args.json:
+        print(json.dumps(requests, indent=2))
+        return
+    for request in requests:
+        seconds = "not found in the dumps" if request["seconds"] is None else f"{request['seconds']:.3f}s"
+        print(f"{request['stamp']} {request['method']} {request['path']} {request['status']} ({request['log']}): "
+              f"{seconds}")
+        if request["invocation_id"] is None:
+            continue
+        print(f"  invocation {request['invocation_id']} [{request['agent']}] session {request['session_id']}")
+        for turn in request["turns"]:
+            detail = " ".join(f"{kind} {turn[kind]:.3f}" for kind in KINDS if turn[kind])
+            print(f"  turn {turn['agent']:<24} +{turn['offset']:8.3f}s {turn['seconds']:8.3f}s  {detail}")
+
+
+def _cmd_timeline(args):
+    lines, invocations, _, offset = _load(args)
+    for entry in merged_index(lines, invocations):
+        if args.session and entry.get("session_id") != args.session:
+            continue
+        if args.invocation and entry.get("invocation_id") != args.invocation:
+            continue
+        if args.json:
+            print(json.dumps(entry))
+            continue
+        # In the local time of the logs.
+        stamp = datetime.fromtimestamp(entry["time"] + offset, timezone.utc).strftime("%H:%M:%S.%f")[:-3]
+        where = f"{entry.get('invocation_id') or '-'}"
+        if entry["type"] == "event":
+            what = " ".join(filter(None, [
+                f"calls {','.join(entry['calls'])}" if entry["calls"] else "",
+                f"responses {','.join(entry['responses'])}" if entry["responses"] else "",
+                f"transfer {entry['transfer']}" if entry["transfer"] else ""])) or "event"
+            print(f"{stamp} {where} event  {entry['agent']}: {what}")
+        else:
+            how = entry.get("how", "-") + ("?" if entry.get("ambiguous") else "")
+            agent = entry.get("turn_agent") or ""
+            print(f"{stamp} {where} {how:<7} {agent} {entry['text'][:200]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Correlate adk web text logs with dumped sessions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    requests = sub.add_parser("requests", help="Map every /run and /run_sse request to its invocation and turns.")
+    requests.add_argument("--slowest", type=int, help="Only the N slowest requests.")
+    requests.add_argument("--json", action="store_true")
+    requests.set_defaults(func=_cmd_requests)
+
+    timeline = sub.add_parser("timeline", help="Print log lines and dumped events in time order.")
+    timeline.add_argument("--session", help="Only this session.")
+    timeline.add_argument("--invocation", help="Only this invocation.")
+    timeline.add_argument("--json", action="store_true", help="One JSON entry per line.")
+    timeline.set_defaults(func=_cmd_timeline)
+
+    for command in (requests, timeline):
+        command.add_argument("root", help="The logs directory, or one logs/<timestamp> directory.")
+        command.add_argument("--log", action="append", help="Text log to read (default: agent_events_*.log in root).")
+        command.add_argument("--utc-offset", type=float, help="Hours east of UTC of the machine that wrote the logs.")
+        command.add_argument("--slack", type=float, default=DEFAULT_SLACK,
+                             help="Seconds a line may fall outside of its invocation.")
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Streaming JSON encoder for ADK sessions.
+
+`iter_json` walks ADK objects (Pydantic models, plain objects, dicts, lists and
+generators) and yields encoded JSON text chunk by chunk, so a dump never needs
+a second, JSON-safe copy of the session in memory. The conversion rules are the
+same as `safe_serialize`: bytes become `{"__bytes__": <base64>}` (or a blob
+reference, see `agent_logs.blobs`), models are expanded field by field and
+anything unknown falls back to `str()`.
+"""
+import base64
+import enum
+import json
+import logging
+import os
+import types
+from datetime import datetime
+
+from agent_logs.locking import open_locked
+
+_encode_str = json.encoder.encode_basestring_ascii
+
+# Flush the write buffer once this many characters are pending.
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_fields(obj):
+    """Yield the (name, value) pairs of a model or plain object without copying it."""
+    model_fields = getattr(type(obj), "model_fields", None)  # Pydantic v2
+    if model_fields is None:
+        model_fields = getattr(type(obj), "__fields__", None)  # Pydantic v1
+    if isinstance(model_fields, dict):
+        for name in model_fields:
+            yield name, getattr(obj, name, None)
+        return
+    if hasattr(obj, "dict") and callable(obj.dict):
+        yield from obj.dict().items()
+        return
+    yield from obj.__dict__.items()
+
+
+def _encode_float(value):
+    if value != value:
+        return "NaN"
+    if value == float("inf"):
+        return "Infinity"
+    if value == -float("inf"):
+        return "-Infinity"
+    return float.__repr__(value)
+
+
+def _encode_key(key):
+    if isinstance(key, str):
+        return _encode_str(key)
+    if key is True:
+        return '"true"'
+    if key is False:
+        return '"false"'
+    if key is None:
+        return '"null"'
+    return _encode_str(str(key))
+
+
+def iter_json(obj, blobs=None, exclude=None, path=""):
+    """Yield the JSON encoding of `obj` as a sequence of string chunks.
+
+    Args:
+        obj: The value to encode.
+        blobs: Optional `BlobStore`; strings and bytes above its threshold are
+            replaced by a reference to the stored payload.
+        exclude: Optional set of dotted field paths to leave out, relative to
+            the encoded value (e.g. `events.content.parts.text`). List items do
+            not add a path component.
+        path: Path of `obj` inside the encoded value, used with `exclude`.
+    """
+    if obj is None:
+        yield "null"
+    elif isinstance(obj, str):
+        if blobs is not None and blobs.wants(len(obj)):
+            yield from _iter_object(blobs.put(obj).items())
+        else:
+            yield _encode_str(obj)
+    elif obj is True:
+        yield "true"
+    elif obj is False:
+        yield "false"
+    elif isinstance(obj, int):
+        yield int.__repr__(obj)
+    elif isinstance(obj, float):
+        yield _encode_float(obj)
+    elif isinstance(obj, enum.Enum):
+        yield from iter_json(obj.value, blobs, exclude, path)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        if blobs is not None and blobs.wants(len(obj)):
+            yield from _iter_object(blobs.put(obj).items())
+        else:
+            yield '{"__bytes__": "'
+            yield base64.b64encode(obj).decode("ascii")
+            yield '"}'
+    elif isinstance(obj, dict):
+        yield from _iter_object(obj.items(), blobs, exclude, path)
+    elif isinstance(obj, (list, tuple, types.GeneratorType)):
+        yield from _iter_array(obj, blobs, exclude, path)
+    elif hasattr(obj, "dict") or hasattr(obj, "__dict__"):
+        yield from _iter_object(iter_fields(obj), blobs, exclude, path)
+    else:
+        yield _encode_str(str(obj))
+
+
+def _iter_object(items, blobs=None, exclude=None, path=""):
+    yield "{"
+    first = True
+    for key, value in items:
+        child = path
+        if exclude:
+            child = f"{path}{key}"
+            if child in exclude:
+                continue
+            child += "."
+        if first:
+            first = False
+        else:
+            yield ", "
+        yield _encode_key(key)
+        yield ": "
+        yield from iter_json(value, blobs, exclude, child)
+    yield "}"
+
+
+def _iter_array(values, blobs=None, exclude=None, path=""):
+    yield "["
+    first = True
+    for value in values:
+        if first:
+            first = False
+        else:
+            yield ", "
+        yield from iter_json(value, blobs, exclude, path)
+    yield "]"
+
+
+def write_json(obj, fp, blobs=None, exclude=None):
+    """Encode `obj` into the binary file `fp` in bounded chunks.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    pending = []
+    size = 0
+    written = 0
+    for chunk in iter_json(obj, blobs, exclude):
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            written += fp.write("".join(pending).encode("ascii"))
+            pending.clear()
+            size = 0
+    if pending:
+        written += fp.write("".join(pending).encode("ascii"))
+    return written
+
+
+def _find_closing_bracket(fp, end):
+    """Locate the closing `]` of the JSON array stored in `fp`.
+
+    Returns:
+        tuple: (position just after the last element or the opening `[`, True if
+        the array already has elements), or None if the file does not end with
+        an array.
+    """
+    found = False
+    pos = end
+    while pos > 0:
+        start = max(0, pos - 256)
+        fp.seek(start)
+        block = fp.read(pos - start)
+        for i in range(len(block) - 1, -1, -1):
+            ch = block[i:i + 1]
+            if ch.isspace():
+                continue
+            if not found:
+                if ch != b"]":
+                    return None
+                found = True
+            else:
+                return start + i + 1, ch != b"["
+        pos = start
+    return None
+
+
+def append_json_record(filename, record, blobs=None, exclude=None, on_written=None):
+    """Append `record` to the JSON array in `filename` without loading the file.
+
+    The closing bracket is overwritten in place, so the file stays a valid JSON
+    array after every call and the cost of an append does not depend on how much
+    history is already stored. The file is locked for the duration of the
+    append, so several processes can share it. A file that does not end with an
+    array is moved aside instead of being silently discarded. If encoding the
+    record fails, the partial record is cut off again before the error is
+    raised, so the file is left as it was.
+
+    `on_written(offset, size)` is called once the record is complete, before
+    the lock is released.
+
+    Returns:
+        tuple: (offset of the record in the file, number of bytes of the record).
+    """
+    fd = open_locked(filename)
+    with os.fdopen(fd, "r+b") as f:
+        end = f.seek(0, os.SEEK_END)
+        tail = _find_closing_bracket(f, end) if end else None
+        if end and tail is None:
+            aside = f"{filename}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            logging.warning(f"{filename} is not a JSON array, moving it to {aside}")
+            os.replace(filename, aside)
+            return append_json_record(filename, record, blobs, exclude, on_written)
+        if tail is None:
+            pos = None
+            f.seek(0)
+            f.write(b"[\n")
+        else:
+            pos, has_items = tail
+            f.seek(pos)
+            f.write(b",\n" if has_items else b"\n")
+        offset = f.tell()
+        try:
+            size = write_json(record, f, blobs, exclude)
+        except BaseException:
+            if pos is None:
+                f.truncate(0)
+            else:
+                f.seek(pos)
+                f.write(b"\n]\n")
+                f.truncate()
+            raise
+        f.write(b"\n]\n")
+        f.truncate()
+        if on_written is not None:
+            f.flush()
+            on_written(offset, size)
+    return offset, size
@@ -0,0 +1,384 @@
+"""Sidecar index of the records of a log directory.
+
+`DumpWriter` appends one line per record to `index.jsonl` (`index.<tag>.jsonl`
+with the per-process layout) with the stream, file, byte offset and size of the
+record, plus its session id, agent, invocation id and timestamp:
+
+    {"stream": "events", "file": "events.json", "offset": 5021, "size": 8133,
+     "session_id": "...", "agent": "poi_agent", "invocation_id": "e-...",
+     "timestamp": "2025-09-08_10-13-02-117"}
+
+When a segment is rolled over, a `{"rename": "events.json", "to":
+"events.000001.json"}` line redirects the entries written before it. Segments
+compressed afterwards are found through their `.gz` suffix.
+
+`LogIndex` loads the index files of a directory and reads matching records
+straight from their offsets through mmap, so a lookup does not depend on the
+size of the dumps. Compressed segments are decompressed up to the offset
+instead. `LogIndex.scan` answers a single query by streaming the index files,
+without loading them. `rebuild_index` recreates the index of a directory
+written without one, e.g. by older versions; with the per-process layout each
+process tag has its own index, rebuilt from the files of that tag only:
+
+    python -m agent_logs.index rebuild logs/2025-09-08_10-12-15
+    python -m agent_logs.index query logs/2025-09-08_10-12-15 --agent poi_agent \\
+        --start 2025-09-08_10-00-00 --end 2025-09-08_10-05-00
+"""
+import argparse
+import bisect
+import json
+import mmap
+import os
+import re
+import sys
+
+from agent_logs.binlog import HEADER_SIZE, MAGIC, _decompress, _LENGTH, decode_payload, read_frames
+from agent_logs.jsonstream import iter_elements
+from agent_logs.locking import open_locked
+from agent_logs.manifest import MANIFEST, end_bound, manifest_lock, open_segment
+
+INDEX = "index.jsonl"
+_INDEX_RE = re.compile(r"^index(\.p[\w-]+)?\.jsonl$")
+# Dump files: `<stream>[.<process tag>][.<segment>].(json|adkb)[.gz]`.
+_DUMP_RE = re.compile(r"^(?P<stream>[^.]+)(\.(?P<tag>p\d+-\d{14}))?(?P<segment>\.\d{6})?\.(json|adkb)(\.gz)?$")
+# Files of a log directory that match `_DUMP_RE` but are not dumps.
+_NOT_DUMPS = {"manifest", "metrics", "trace", "index"}
+
+
+def index_entry(stream, file, offset, size, record):
+    """Index line of `record`, written at `offset` of `file`."""
+    record = record if isinstance(record, dict) else {}
+    invocation_id = record.get("invocation_id")
+    events = record.get("events")
+    if invocation_id is None and isinstance(events, list) and events and isinstance(events[-1], dict):
+        # Older dumps do not record the invocation; it is the one of the last event.
+        invocation_id = events[-1].get("invocation_id")
+    return {
+        "stream": stream,
+        "file": file,
+        "offset": offset,
+        "size": size,
+        "session_id": record.get("session_id"),
+        "agent": record.get("agent"),
+        "invocation_id": invocation_id,
+        "timestamp": record.get("timestamp"),
+    }
+
+
+class IndexWriter:
+    """Appends index lines; shared index files are locked like the dumps."""
+
+    def __init__(self, log_dir, name=INDEX):
+        self.path = os.path.join(log_dir, name)
+
+    def _append(self, line):
+        # Reopened if `rebuild_index` replaces the file while this waits for the lock.
+        fd = open_locked(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, (json.dumps(line) + "\n").encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def add(self, stream, path, offset, size, record):
+        self._append(index_entry(stream, os.path.basename(path), offset, size, record))
+
+    def rename(self, old, new):
+        self._append({"rename": old, "to": new})
+
+
+def iter_entries(path):
+    """Yield the entries of one index file, with file names resolved across rollovers.
+
+    The file is read twice, first for its rename lines only, so that entries
+    can be yielded one at a time. Torn lines of a killed writer are skipped.
+    """
+    renames = {}
+    for number, entry in _lines(path):
+        if "rename" in entry:
+            renames.setdefault(entry["rename"], []).append((number, entry["to"]))
+    for number, entry in _lines(path):
+        if "rename" in entry:
+            continue
+        # A rename line only moves the entries written before it.
+        moves = renames.get(entry["file"], ())
+        later = bisect.bisect_left(moves, (number,))
+        if later < len(moves):
+            entry["file"] = moves[later][1]
+        yield entry
+
+
+def load_entries(path):
+    """Entries of one index file, with file names resolved across rollovers."""
+    return list(iter_entries(path))
+
+
+def _lines(path):
+    with open(path) as f:
+        for number, line in enumerate(f):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict):
+                yield number, entry
+
+
+def _index_paths(log_dir):
+    return [os.path.join(log_dir, name) for name in sorted(os.listdir(log_dir)) if _INDEX_RE.match(name)]
+
+
+def _matches(entry, session_id, agent, invocation_id, stream):
+    return ((session_id is None or entry["session_id"] == session_id)
+            and (agent is None or entry["agent"] == agent)
+            and (invocation_id is None or entry["invocation_id"] == invocation_id)
+            and (stream is None or entry["stream"] == stream))
+
+
+class LogIndex:
+    """Lookups over the index files of a log directory."""
+
+    def __init__(self, log_dir):
+        self.log_dir = log_dir
+        self._entries = None
+        self._maps = {}
+
+    @property
+    def entries(self):
+        """Every index entry of the directory in timestamp order, loaded on first use."""
+        if self._entries is None:
+            entries = []
+            for path in _index_paths(self.log_dir):
+                entries += load_entries(path)
+            entries.sort(key=lambda e: e["timestamp"] or "")
+            self._timestamps = [e["timestamp"] or "" for e in entries]
+            self._keys = {}
+            for position, entry in enumerate(entries):
+                for key in ("session_id", "agent", "invocation_id", "stream"):
+                    self._keys.setdefault((key, entry[key]), []).append(position)
+            self._entries = entries
+        return self._entries
+
+    def query(self, session_id=None, agent=None, invocation_id=None, stream=None, start=None, end=None):
+        """Index entries matching every given criterion, in timestamp order.
+
+        `start` and `end` are inclusive bounds in the dump timestamp format; a
+        shorter `end` such as `2025-09-08_10-05-00` covers that whole second.
+        """
+        end = end_bound(end)
+        entries = self.entries
+        low = bisect.bisect_left(self._timestamps, start) if start is not None else 0
+        high = bisect.bisect_right(self._timestamps, end) if end is not None else len(entries)
+        candidates = None
+        for key, value in (("session_id", session_id), ("agent", agent),
+                           ("invocation_id", invocation_id), ("stream", stream)):
+            if value is None:
+                continue
+            positions = self._keys.get((key, value), [])
+            if candidates is None or len(positions) < len(candidates):
+                candidates = positions
+        if candidates is None:
+            candidates = range(low, high)
+        for position in candidates:
+            if not low <= position < high:
+                continue
+            entry = entries[position]
+            if _matches(entry, session_id, agent, invocation_id, stream):
+                yield entry
+
+    def scan(self, session_id=None, agent=None, invocation_id=None, stream=None, start=None, end=None):
+        """Like `query`, streaming the index files instead of loading them.
+
+        Only the matching entries are held, to be sorted; use it for a single
+        lookup, and `query` for repeated ones.
+        """
+        end = end_bound(end)
+        matched = []
+        for path in _index_paths(self.log_dir):
+            for entry in iter_entries(path):
+                timestamp = entry["timestamp"] or ""
+                if start is not None and timestamp < start or end is not None and timestamp > end:
+                    continue
+                if _matches(entry, session_id, agent, invocation_id, stream):
+                    matched.append(entry)
+        matched.sort(key=lambda e: e["timestamp"] or "")
+        return iter(matched)
+
+    def _map(self, path, end):
+        mapped = self._maps.get(path)
+        if mapped is None or len(mapped) < end:
+            # The live file grows between lookups; remap it when needed.
+            if mapped is not None:
+                mapped.close()
+            with open(path, "rb") as f:
+                mapped = self._maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped
+
+    def read(self, entry):
+        """Decode the record of an index entry."""
+        path = os.path.join(self.log_dir, entry["file"])
+        offset, size = entry["offset"], entry["size"]
+        if os.path.exists(path) and not path.endswith(".gz"):
+            data = self._map(path, offset + size)
+            if data[:len(MAGIC)] == MAGIC:
+                return decode_payload(_decompress(data[HEADER_SIZE - 1], data[offset + _LENGTH.size:offset + size]))
+            return json.loads(data[offset:offset + size])
+        with open_segment(path) as f:
+            head = f.read(HEADER_SIZE)
+            f.seek(offset)
+            chunk = f.read(size)
+        if head[:len(MAGIC)] == MAGIC:
+            return decode_payload(_decompress(head[HEADER_SIZE - 1], chunk[_LENGTH.size:]))
+        return json.loads(chunk)
+
+    def records(self, **criteria):
+        """Yield the records matching `criteria` (see `query`)."""
+        for entry in self.query(**criteria):
+            yield self.read(entry)
+
+    def close(self):
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
+
+
+def rebuild_index(log_dir, tag=None):
+    """Recreate `index.jsonl` of `log_dir` from its dump files.
+
+    Only the index of `tag` is replaced: `index.<tag>.jsonl`, rebuilt from the
+    files of that process tag, or `index.jsonl` from the untagged files when
+    `tag` is None. The new index is written to a temporary file and swapped in
+    under the manifest lock, which holds off rollovers, and under the locks of
+    the live files and of the index, so running writers neither append to the
+    replaced index nor write records missing from the new one. The entries of
+    live files created after the listing are carried over from the old index.
+
+    Returns:
+        int: The number of indexed records.
+    """
+    name = f"index.{tag}.jsonl" if tag else INDEX
+    with manifest_lock(log_dir, f"manifest.{tag}.json" if tag else MANIFEST):
+        dumps = _owned_dumps(log_dir, tag)
+        entries = []
+        for dump, match in dumps:
+            if match.group("segment") is not None or dump.endswith(".gz"):
+                entries += _dump_entries(log_dir, dump, match)
+        # Appends to the live files are held off from here on.
+        live = [(dump, match) for dump, match in dumps if match.group("segment") is None and not dump.endswith(".gz")]
+        fds = [open_locked(os.path.join(log_dir, dump)) for dump, _ in live]
+        try:
+            for dump, match in live:
+                entries += _dump_entries(log_dir, dump, match)
+            path = os.path.join(log_dir, name)
+            fds.append(open_locked(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT))
+            # Files created since the listing were indexed by their writers.
+            scanned = {dump for dump, _ in dumps}
+            created = {dump for dump, match in _owned_dumps(log_dir, tag)
+                       if dump not in scanned and match.group("segment") is None and not dump.endswith(".gz")}
+            if created and os.path.exists(path):
+                entries += [entry for entry in iter_entries(path) if entry["file"] in created]
+            entries.sort(key=lambda e: e["timestamp"] or "")
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp, path)
+        finally:
+            for fd in fds:
+                os.close(fd)
+    return len(entries)
+
+
+def dump_tags(log_dir):
+    """Process tags of the dump files of `log_dir`, None for the untagged files."""
+    return sorted({match.group("tag") for _, match in _owned_dumps(log_dir, None, all_tags=True)},
+                  key=lambda tag: tag or "")
+
+
+def _owned_dumps(log_dir, tag, all_tags=False):
+    """(name, match) of the dump files of `tag`; a closed segment once, compressed or not."""
+    names = set(os.listdir(log_dir))
+    dumps = []
+    for name in sorted(names):
+        match = _DUMP_RE.match(name)
+        if match is None or match.group("stream") in _NOT_DUMPS:
+            continue
+        if not all_tags and match.group("tag") != tag:
+            continue
+        if name + ".gz" in names:
+            continue  # compressed while listing; the `.json` is about to be removed
+        dumps.append((name, match))
+    return dumps
+
+
+def _dump_entries(log_dir, name, match):
+    path = os.path.join(log_dir, name)
+    entries = []
+    try:
+        if _starts_with_magic(path):
+            return _binary_entries(path, name, match.group("stream"))
+        with open_segment(path) as f:
+            for offset, size, record in iter_elements(f):
+                if isinstance(record, dict) and "timestamp" in record:
+                    entries.append(index_entry(match.group("stream"), name, offset, size, record))
+    except ValueError:
+        return []  # not a dump
+    return entries
+
+
+def _starts_with_magic(path):
+    with open_segment(path) as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _binary_entries(path, name, stream):
+    with open_segment(path) as f:
+        frames = list(read_frames(f))
+        end = f.tell()
+    entries = []
+    for i, (offset, record) in enumerate(frames):
+        next_offset = frames[i + 1][0] if i + 1 < len(frames) else end
+        entries.append(index_entry(stream, name, offset, next_offset - offset, record))
+    return entries
+
+
+def _cmd_rebuild(args):
+    for tag in [args.tag] if args.tag else dump_tags(args.log_dir):
+        count = rebuild_index(args.log_dir, tag)
+        print(f"indexed {count} records in {os.path.join(args.log_dir, f'index.{tag}.jsonl' if tag else INDEX)}")
+
+
+def _cmd_query(args):
+    index = LogIndex(args.log_dir)
+    criteria = dict(session_id=args.session, agent=args.agent, invocation_id=args.invocation,
+                    stream=args.stream, start=args.start, end=args.end)
+    for entry in index.scan(**criteria):
+        sys.stdout.write(json.dumps(entry if args.entries else index.read(entry)) + "\n")
+    index.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the record index of a log directory.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = sub.add_parser("rebuild", help="Recreate the index files from the dump files.")
+    rebuild.add_argument("log_dir")
+    rebuild.add_argument("--tag", help="Only rebuild the index of this process tag, e.g. p4242-20250908101215.")
+    rebuild.set_defaults(func=_cmd_rebuild)
+
+    query = sub.add_parser("query", help="Print matching records as JSON lines.")
+    query.add_argument("log_dir")
+    query.add_argument("--session", help="Session id.")
+    query.add_argument("--agent", help="Agent name.")
+    query.add_argument("--invocation", help="Invocation id.")
+    query.add_argument("--stream", help="events, state or an agent name.")
+    query.add_argument("--start", help="Inclusive lower bound, e.g. 2025-09-08_10-00-00.")
+    query.add_argument("--end", help="Inclusive upper bound; 2025-09-08_10-05-00 includes that second.")
+    query.add_argument("--entries", action="store_true", help="Print index entries instead of records.")
+    query.set_defaults(func=_cmd_query)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Streaming reader for the JSON array dumps (`events.json`, `state.json`, ...).
+
+`json.load` needs the whole file, and the events dumps of long sessions hold
+the full event history in every record. These readers scan the file in chunks
+and only decode one element at a time, so memory use is bounded by the largest
+element (`iter_elements`) or the largest event (`iter_nested`), whatever the
+size of the file or of the records.
+
+Both readers report byte offsets and can resume from one. With `follow=True`
+they do not stop at the closing bracket but wait for the records appended in
+place by `agent_logs.encoder.append_json_record`, like `tail -f`:
+
+    with open("logs/2025-09-08_10-12-15/events.json", "rb") as f:
+        for offset, size, record in iter_elements(f, follow=True):
+            ...
+
+From the command line, `python -m agent_logs.jsonstream events.json --events
+--follow` prints every event as a JSON line as it is dumped.
+"""
+import argparse
+import codecs
+import json
+import re
+import sys
+import time
+from collections import namedtuple
+
+CHUNK_SIZE = 1 << 16
+
+_VALUE = re.compile(rb"[^ \t\r\n,]")
+_AFTER_KEY = re.compile(rb"[^ \t\r\n:]")
+
+# One element of the `key` array of a top-level record, see `iter_nested`.
+Nested = namedtuple("Nested", "record_offset record offset size value")
+
+
+def _byte_length(text, end):
+    head = text[:end]
+    return end if head.isascii() else len(head.encode("utf-8"))
+
+
+class _NeedMore(Exception):
+    """The data ends before the value being read."""
+
+
+class _Reader:
+    """Decodes JSON values at absolute byte offsets of a file read in chunks.
+
+    Data before the offset passed to `release` may be dropped from the buffer.
+    """
+
+    def __init__(self, f, pos=0, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.rewind(pos)
+
+    def rewind(self, pos):
+        """Restart reading at `pos`, re-reading the file from there."""
+        self.f.seek(pos)
+        self.buf = bytearray()
+        self.base = self.keep = pos
+
+    def release(self, pos):
+        self.keep = pos
+
+    def _fill(self):
+        if self.keep > self.base:
+            del self.buf[:self.keep - self.base]
+            self.base = self.keep
+        # Grow reads with the buffer, so a huge value is not re-decoded once per chunk.
+        data = self.f.read(max(self.chunk_size, len(self.buf)))
+        if not data:
+            raise _NeedMore()
+        self.buf += data
+
+    def skip(self, pos, pattern=_VALUE):
+        """Return (offset, byte) of the first byte at or after `pos` matching `pattern`."""
+        while True:
+            match = pattern.search(self.buf, max(pos - self.base, 0))
+            if match is not None:
+                return self.base + match.start(), self.buf[match.start()]
+            self._fill()
+
+    def decode(self, pos):
+        """Decode the value starting at `pos`; return (value, end offset)."""
+        window = self.chunk_size
+        while True:
+            rel = pos - self.base
+            available = len(self.buf) - rel
+            if available > 0:
+                # Decode a growing window first, so a small value after a large
+                # one does not copy the whole buffer.
+                chunk = bytes(self.buf[rel:rel + min(window, available)])
+                text, _ = codecs.utf_8_decode(chunk, "strict", False)
+                try:
+                    value, end = self.decoder.raw_decode(text)
+                except json.JSONDecodeError:
+                    if window < available:
+                        window *= 2
+                        continue
+                else:
+                    # A number is only complete once the byte after it is known.
+                    if (not isinstance(value, (int, float)) or isinstance(value, bool)
+                            or (end < len(text) and text[end] in " \t\r\n,]}")):
+                        return value, pos + _byte_length(text, end)
+                    if window < available:
+                        window *= 2
+                        continue
+                    try:
+                        self._fill()
+                    except _NeedMore:
+                        return value, pos + _byte_length(text, end)
+                    window = max(window, len(self.buf) - (pos - self.base))
+                    continue
+            self._fill()
+            window = max(window, len(self.buf) - (pos - self.base))
+
+    def open_array(self):
+        """Return the offset just after the opening bracket of the top-level array."""
+        pos, c = self.skip(0, _VALUE)
+        if c != ord("["):
+            raise ValueError(f"{getattr(self.f, 'name', 'file')} is not a JSON array")
+        return pos + 1
+
+
+def iter_elements(f, offset=None, follow=False, poll=0.5, chunk_size=CHUNK_SIZE):
+    """Yield (offset, size, element) for the elements of the top-level array.
+
+    Args:
+        f: File opened in binary mode (plain or gzip).
+        offset: Byte offset to resume from: the offset of an element, or the
+            offset plus size of the last element seen.
+        follow: Keep waiting for appended elements instead of stopping at the
+            end of the array.
+        poll: Seconds between checks for new data in follow mode.
+    """
+    reader = _Reader(f, offset or 0, chunk_size)
+    # Offset right after the last complete element (or the opening bracket).
+    pos = offset
+    while True:
+        try:
+            if not pos:
+                pos = reader.open_array()
+            while True:
+                start, c = reader.skip(pos)
+                if c == ord("]"):
+                    raise _NeedMore()
+                value, end = reader.decode(start)
+                yield start, end - start, value
+                pos = end
+                reader.release(pos)
+        except _NeedMore:
+            if not follow:
+                return
+            # The appender rewrites the closing bracket, and a partly written
+            # element is read again from its start.
+            reader.rewind(pos or 0)
+            time.sleep(poll)
+
+
+def _skip_fields(reader, pos):
+    """Skip the remaining fields of an object; return the offset after its `}`."""
+    while True:
+        pos, c = reader.skip(pos)
+        if c == ord("}"):
+            return pos + 1
+        _, pos = reader.decode(pos)
+        pos, _ = reader.skip(pos, _AFTER_KEY)
+        _, pos = reader.decode(pos)
+
+
+def iter_nested(f, key="events", offset=None, follow=False, poll=0.5, chunk_size=CHUNK_SIZE):
+    """Yield the items of the `key` array of every top-level record, one at a time.
+
+    Each item is a `Nested(record_offset, record, offset, size, value)`, where
+    `record` holds the fields of the record that precede `key` (`agent`,
+    `timestamp`, `session_id`, ...). Records without `key` yield nothing.
+    `offset` resumes from a record offset, as for `iter_elements`.
+    """
+    reader = _Reader(f, offset or 0, chunk_size)
+    # Resume point: right after a record, or after an item of the nested array
+    # of `record_start` when `record` is set.
+    pos, record_start, record = offset, None, None
+    while True:
+        try:
+            if not pos:
+                pos = reader.open_array()
+            while True:
+                if record is None:
+                    start, c = reader.skip(pos)
+                    if c == ord("]"):
+                        raise _NeedMore()
+                    if c != ord("{"):
+                        _, pos = reader.decode(start)
+                        reader.release(pos)
+                        continue
+                    fields = {}
+                    p = start + 1
+                    while True:
+                        p, c = reader.skip(p)
+                        if c == ord("}"):
+                            pos = p + 1
+                            break
+                        name, p = reader.decode(p)
+                        p, c = reader.skip(p, _AFTER_KEY)
+                        if name == key and c == ord("["):
+                            pos, record_start, record = p + 1, start, fields
+                            break
+                        fields[name], p = reader.decode(p)
+                    reader.release(pos)
+                    continue
+
+                start, c = reader.skip(pos)
+                if c == ord("]"):
+                    pos, record = _skip_fields(reader, start + 1), None
+                    reader.release(pos)
+                    continue
+                value, end = reader.decode(start)
+                yield Nested(record_start, record, start, end - start, value)
+                pos = end
+                reader.release(pos)
+        except _NeedMore:
+            if not follow:
+                return
+            reader.rewind(pos or 0)
+            time.sleep(poll)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream the records of a JSON array dump as JSON lines.")
+    parser.add_argument("file")
+    parser.add_argument("--events", action="store_true", help="Print the events of each record one by one.")
+    parser.add_argument("--offset", type=int, help="Byte offset of the record to start from.")
+    parser.add_argument("--follow", action="store_true", help="Wait for new records, like tail -f.")
+    args = parser.parse_args(argv)
+
+    with open(args.file, "rb") as f:
+        if args.events:
+            for item in iter_nested(f, offset=args.offset, follow=args.follow):
+                sys.stdout.write(json.dumps(item.value) + "\n")
+                sys.stdout.flush()
+        else:
+            for _, _, record in iter_elements(f, offset=args.offset, follow=args.follow):
+                sys.stdout.write(json.dumps(record) + "\n")
+                sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+"""Offline latency and token profile of dumped sessions.
+
+Rebuilds the timeline of every invocation from the events dumps of a log
+directory (or of every `logs/<timestamp>` directory below `logs`) and splits
+it into consecutive segments:
+
+- `model`: from a model response event to the next event. ADK stamps a
+  model response event when it sends the request, so this is the model call.
+- `tool`: from the event holding function calls to the event holding their
+  responses. This includes the generation of the call by the model.
+- `transfer`: a `transfer_to_agent` round trip, and the hand-over from its
+  response to the first event of the target agent.
+- `framework`: from a user message or a function response to the next model
+  request: callbacks and request preparation.
+
+The end of an invocation is the time its last events record was dumped (in
+the after_agent callback). Dump timestamps are local wall-clock times, so the
+UTC offset of the writing machine is recovered from the events, which carry
+epoch seconds and are dumped seconds before their record.
+
+Invocations run through an `AgentTool` are nested under the tool call that
+ran them, so their time shows up in the critical path and in the folded
+stacks of the calling invocation:
+
+    python -m agent_logs.latency report logs/2025-09-08_10-12-15
+    python -m agent_logs.latency folded logs > latency.folded
+    flamegraph.pl --countname us latency.folded > latency.svg
+"""
+import argparse
+import json
+import os
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from agent_logs.merge import dump_files, iter_events, log_dirs, utc_offset
+
+KINDS = ("model", "tool", "transfer", "framework")
+TOKEN_FIELDS = ("prompt_token_count", "candidates_token_count", "thoughts_token_count",
+                "cached_content_token_count", "total_token_count")
+# Nested invocations must start within this many seconds of the tool call.
+_NESTING_SLACK = 1.0
+
+Segment = namedtuple("Segment", "start end kind agent name call_ids")
+
+
+class _Event:
+    __slots__ = ("id", "timestamp", "author", "calls", "responses", "transfer", "usage")
+
+    def __init__(self, event):
+        self.id = event.get("id")
+        self.timestamp = float(event["timestamp"])
+        self.author = event.get("author")
+        self.calls, self.responses = [], []
+        for part in (event.get("content") or {}).get("parts") or []:
+            if part.get("function_call"):
+                self.calls.append((part["function_call"].get("id"), part["function_call"].get("name")))
+            if part.get("function_response"):
+                self.responses.append((part["function_response"].get("id"), part["function_response"].get("name")))
+        self.transfer = (event.get("actions") or {}).get("transfer_to_agent")
+        self.usage = event.get("usage_metadata") or {}
+
+
+class Invocation:
+    """The timeline of one invocation."""
+
+    def __init__(self, invocation_id, log_dir):
+        self.invocation_id = invocation_id
+        self.log_dir = log_dir
+        self.session_id = None
+        self.events = []
+        self.end = None
+        self.segments = []
+        self.calls = {}
+        self.children = {}
+        self.parent = None
+
+    @property
+    def start(self):
+        return self.events[0].timestamp
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else self.events[-1].timestamp) - self.start
+
+    @property
+    def agent(self):
+        """The first agent that ran in the invocation."""
+        return next((e.author for e in self.events if e.author != "user"), None)
+
+    def build(self):
+        self.events.sort(key=lambda e: e.timestamp)
+        for event in self.events:
+            for call_id, name in event.calls:
+                self.calls[call_id] = {"name": name, "agent": event.author, "start": event.timestamp, "end": None}
+            for call_id, _ in event.responses:
+                if call_id in self.calls:
+                    self.calls[call_id]["end"] = event.timestamp
+        following = self.events[1:] + [None]
+        for event, next_event in zip(self.events, following):
+            end = next_event.timestamp if next_event is not None else self.end
+            if end is None:
+                continue
+            self.segments.append(self._segment(event, next_event, end))
+
+    def _segment(self, event, next_event, end):
+        if next_event is not None and next_event.responses:
+            kind = "transfer" if next_event.transfer else "tool"
+            ids = tuple(call_id for call_id, _ in next_event.responses)
+            names = ",".join(sorted({name for _, name in next_event.responses}))
+            return Segment(event.timestamp, end, kind, next_event.author, names, ids)
+        if event.transfer:
+            agent = next_event.author if next_event is not None else event.transfer
+            return Segment(event.timestamp, end, "transfer", agent, event.transfer, ())
+        if event.author == "user" or event.responses:
+            agent = next_event.author if next_event is not None else event.author
+            return Segment(event.timestamp, end, "framework", agent, None, ())
+        if event.calls:
+            # Calls answered later, e.g. long-running tools.
+            names = ",".join(sorted({name for _, name in event.calls}))
+            return Segment(event.timestamp, end, "tool", event.author, names, tuple(i for i, _ in event.calls))
+        return Segment(event.timestamp, end, "model", event.author, None, ())
+
+    def turns(self):
+        """Consecutive segments of the same agent, with their time per kind."""
+        turns = []
+        for segment in self.segments:
+            if not turns or turns[-1]["agent"] != segment.agent:
+                turns.append({"agent": segment.agent, "start": segment.start, "seconds": 0.0,
+                              **{kind: 0.0 for kind in KINDS}})
+            seconds = segment.end - segment.start
+            turns[-1]["seconds"] += seconds
+            turns[-1][segment.kind] += seconds
+        return turns
+
+    def round_trips(self):
+        """Function call round trips, from the call event to the response event."""
+        return [
+            {"call_id": call_id, "name": call["name"], "agent": call["agent"], "start": call["start"],
+             "seconds": None if call["end"] is None else call["end"] - call["start"],
+             "nested": [child.invocation_id for child in self.children.get(call_id, ())]}
+            for call_id, call in self.calls.items()
+        ]
+
+    def transfers(self):
+        """Transfers, from the transfer call to the first event of the target agent."""
+        transfers = []
+        for i, event in enumerate(self.events):
+            if not event.transfer:
+                continue
+            target = next((e for e in self.events[i + 1:] if e.author == event.transfer), None)
+            started = max((self.calls[call_id]["start"] for call_id, _ in event.responses if call_id in self.calls),
+                          default=event.timestamp)
+            transfers.append({"from": event.author, "to": event.transfer, "start": started,
+                              "seconds": None if target is None else target.timestamp - started})
+        return transfers
+
+    def tokens(self):
+        """Token counts per agent, from the `usage_metadata` of the events."""
+        totals = {}
+        for event in self.events:
+            for field in TOKEN_FIELDS:
+                if event.usage.get(field):
+                    agent = totals.setdefault(event.author, {})
+                    agent[field] = agent.get(field, 0) + event.usage[field]
+        return totals
+
+    def stacks(self, prefix=()):
+        """Yield (frames, seconds) of the folded stacks of the invocation and its nested invocations."""
+        for segment in self.segments:
+            frames = prefix + (segment.agent, segment.kind if segment.name is None else f"{segment.kind}:{segment.name}")
+            seconds = segment.end - segment.start
+            children = [child for call_id in segment.call_ids for child in self.children.get(call_id, ())]
+            for child in children:
+                yield from child.stacks(frames)
+            nested = max((child.duration for child in children), default=0.0)
+            yield frames, max(seconds - nested, 0.0)
+
+    def critical_path(self):
+        """Seconds per kind along the longest chain of segments, through nested invocations."""
+        totals = dict.fromkeys(KINDS, 0.0)
+        for segment in self.segments:
+            seconds = segment.end - segment.start
+            children = [child for call_id in segment.call_ids for child in self.children.get(call_id, ())]
+            if children:
+                longest = max(children, key=lambda child: child.duration)
+                for kind, nested in longest.critical_path().items():
+                    totals[kind] += nested
+                seconds = max(seconds - longest.duration, 0.0)
+            totals[segment.kind] += seconds
+        return totals
+
+    def to_json(self):
+        return {
+            "invocation_id": self.invocation_id,
+            "session_id": self.session_id,
+            "log_dir": self.log_dir,
+            "agent": self.agent,
+            "parent": None if self.parent is None else self.parent.invocation_id,
+            "start": self.start,
+            "seconds": self.duration,
+            "end_known": self.end is not None,
+            "critical_path": self.critical_path(),
+            "turns": self.turns(),
+            "round_trips": self.round_trips(),
+            "transfers": self.transfers(),
+            "tokens": self.tokens(),
+        }
+
+
+def _dump_epoch(value):
+    """Seconds of a `%Y-%m-%d_%H-%M-%S-%f` dump timestamp, as if it were UTC."""
+    try:
+        naive = datetime.strptime(value[:19], "%Y-%m-%d_%H-%M-%S").replace(tzinfo=timezone.utc)
+        return naive.timestamp() + int(value[20:] or 0) / 1000
+    except (TypeError, ValueError):
+        return None
+
+
+def load_invocations(root):
+    """Rebuild the invocations dumped under `root`, keyed by invocation id."""
+    invocations = {}
+    for log_dir in log_dirs(root):
+        label = os.path.basename(os.path.normpath(log_dir))
+        seen = set()
+        # (invocation id, dump epoch, last event timestamp) of each record.
+        ends = []
+        for stream, path in dump_files(log_dir):
+            if stream != "events":
+                continue
+            records = {}
+            for record_offset, record, _, _, event in iter_events(path):
+                if "timestamp" not in event:
+                    continue
+                parsed = _Event(event)
+                invocation_id = event.get("invocation_id")
+                records[record_offset] = (record, invocation_id, parsed.timestamp)
+                if parsed.id in seen:
+                    continue
+                seen.add(parsed.id)
+                invocation = invocations.get(invocation_id)
+                if invocation is None:
+                    invocation = invocations[invocation_id] = Invocation(invocation_id, label)
+                invocation.events.append(parsed)
+            for record, last_invocation, last_timestamp in records.values():
+                invocation_id = record.get("invocation_id") or last_invocation
+                if invocation_id in invocations and record.get("session_id"):
+                    invocations[invocation_id].session_id = record["session_id"]
+                dumped = _dump_epoch(record.get("timestamp"))
+                if dumped is not None:
+                    ends.append((invocation_id, dumped, last_timestamp))
+        offset = utc_offset([(dumped, last) for _, dumped, last in ends])
+        for invocation_id, dumped, _ in ends:
+            invocation = invocations.get(invocation_id)
+            if invocation is None:
+                continue
+            end = dumped - offset
+            if end >= invocation.events[-1].timestamp and (invocation.end is None or end > invocation.end):
+                invocation.end = end
+    for invocation in invocations.values():
+        invocation.build()
+    _nest(invocations.values())
+    return invocations
+
+
+def _nest(invocations):
+    """Attach the invocations run by an AgentTool to the tool call that ran them."""
+    calls = {}
+    for invocation in invocations:
+        for call_id, call in invocation.calls.items():
+            calls.setdefault(call["name"], []).append((invocation, call_id, call))
+    for child in invocations:
+        best = None
+        for parent, call_id, call in calls.get(child.agent, ()):
+            if parent is child or parent.log_dir != child.log_dir:
+                continue
+            if not call["start"] <= child.start <= (call["end"] or child.start) + _NESTING_SLACK:
+                continue
+            if best is None or call["start"] > best[2]["start"]:
+                best = (parent, call_id, call)
+        if best is not None:
+            parent, call_id, _ = best
+            parent.children.setdefault(call_id, []).append(child)
+            child.parent = parent
+
+
+def folded_stacks(invocations):
+    """{`frame;frame;...`: microseconds} of `invocations`, nested ones under their caller."""
+    folded = {}
+    selected = set(map(id, invocations))
+    for invocation in invocations:
+        if id(invocation.parent) in selected:
+            continue
+        for frames, seconds in invocation.stacks():
+            stack = ";".join(str(frame) for frame in frames)
+            folded[stack] = folded.get(stack, 0) + int(round(seconds * 1e6))
+    return {stack: micros for stack, micros in folded.items() if micros}
+
+
+def _quantile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def aggregate(invocations):
+    """Latency distributions per agent turn, tool round trip and transfer."""
+    turns, tools, transfers = {}, {}, {}
+    for invocation in invocations:
+        for turn in invocation.turns():
+            turns.setdefault(turn["agent"], []).append(turn["seconds"])
+        for trip in invocation.round_trips():
+            if trip["seconds"] is not None:
+                tools.setdefault(trip["name"], []).append(trip["seconds"])
+        for transfer in invocation.transfers():
+            if transfer["seconds"] is not None:
+                transfers.setdefault(f"{transfer['from']} -> {transfer['to']}", []).append(transfer["seconds"])
+
+    def stats(groups):
+        return {
+            key: {"count": len(values), "total": sum(values), "p50": _quantile(values, 0.5),
+                  "p90": _quantile(values, 0.9), "max": max(values)}
+            for key, values in sorted(groups.items(), key=lambda item: -sum(item[1]))
+        }
+
+    return {"agent_turns": stats(turns), "round_trips": stats(tools), "transfers": stats(transfers)}
+
+
+def _select(invocations, session_id=None, invocation_id=None):
+    return [
+        invocation for invocation in sorted(invocations.values(), key=lambda i: i.start)
+        if (session_id is None or invocation.session_id == session_id)
+        and (invocation_id is None or invocation.invocation_id == invocation_id)
+    ]
+
+
+def _print_report(invocations):
+    for invocation in invocations:
+        end = "" if invocation.end is not None else " (end not dumped)"
+        parent = f", run by {invocation.parent.invocation_id}" if invocation.parent is not None else ""
+        print(f"{invocation.invocation_id} [{invocation.agent}] session {invocation.session_id} "
+              f"{invocation.log_dir}: {invocation.duration:.3f}s{end}{parent}")
+        path = invocation.critical_path()
+        total = sum(path.values()) or 1.0
+        print("  critical path: " + ", ".join(f"{kind} {path[kind]:.3f}s ({path[kind] / total:.0%})" for kind in KINDS))
+        for turn in invocation.turns():
+            detail = " ".join(f"{kind} {turn[kind]:.3f}" for kind in KINDS if turn[kind])
+            print(f"  turn {turn['agent']:<24} +{turn['start'] - invocation.start:8.3f}s {turn['seconds']:8.3f}s  {detail}")
+        for trip in invocation.round_trips():
+            seconds = "no response" if trip["seconds"] is None else f"{trip['seconds']:.3f}s"
+            nested = f" (runs {', '.join(trip['nested'])})" if trip["nested"] else ""
+            print(f"  call {trip['name']:<24} by {trip['agent']}: {seconds}{nested}")
+        for transfer in invocation.transfers():
+            seconds = "target never ran" if transfer["seconds"] is None else f"{transfer['seconds']:.3f}s"
+            print(f"  transfer {transfer['from']} -> {transfer['to']}: {seconds}")
+        for agent, counts in invocation.tokens().items():
+            print(f"  tokens {agent}: " + ", ".join(f"{field} {count}" for field, count in counts.items()))
+    summary = aggregate(invocations)
+    for section, groups in summary.items():
+        if groups:
+            print(section.replace("_", " ") + ":")
+        for key, stat in groups.items():
+            print(f"  {key:<40} n={stat['count']:<4} total {stat['total']:.3f}s  p50 {stat['p50']:.3f}s  "
+                  f"p90 {stat['p90']:.3f}s  max {stat['max']:.3f}s")
+
+
+def _cmd_report(args):
+    invocations = _select(load_invocations(args.root), args.session, args.invocation)
+    if args.json:
+        print(json.dumps({"invocations": [i.to_json() for i in invocations], "summary": aggregate(invocations)},
+                         indent=2))
+    else:
+        _print_report(invocations)
+
+
+def _cmd_folded(args):
+    invocations = _select(load_invocations(args.root), args.session, args.invocation)
+    for stack, micros in sorted(folded_stacks(invocations).items()):
+        print(f"{stack} {micros}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency and token profile of dumped sessions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    report = sub.add_parser("report", help="Print the timeline breakdown of every invocation.")
+    report.add_argument("--json", action="store_true", help="Print the breakdowns as JSON.")
+    report.set_defaults(func=_cmd_report)
+
+    folded = sub.add_parser("folded", help="Print folded stacks in microseconds, for flamegraph.pl or speedscope.")
+    folded.set_defaults(func=_cmd_folded)
+
+    for command in (report, folded):
+        command.add_argument("root", help="The logs directory, or one logs/<timestamp> directory.")
+        command.add_argument("--session", help="Only this session.")
+        command.add_argument("--invocation", help="Only this invocation.")
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Advisory file locking for dump files shared between server workers."""
+import os
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; appends are then unlocked
+    fcntl = None
+
+
+def lock_exclusive(fd):
+    """Block until this process holds the exclusive lock of `fd`.
+
+    The lock is released when the file is closed.
+    """
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+
+def open_locked(filename, flags=os.O_RDWR | os.O_CREAT):
+    """Open `filename` and lock it, returning the file descriptor.
+
+    A shared dump file can be renamed away by another process (a rollover)
+    while this one waits for its lock; the file is then opened again, so the
+    caller always holds the lock of the file currently at `filename`.
+    """
+    while True:
+        fd = os.open(filename, flags, 0o644)
+        lock_exclusive(fd)
+        try:
+            if os.stat(filename).st_ino == os.fstat(fd).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
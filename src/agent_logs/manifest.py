@@ -0,0 +1,174 @@
+"""Segment manifest of a rotated log directory.
+
+When rotation is enabled, `DumpWriter` keeps the live records of each stream in
+`<stream>.json` (or `.adkb`) and renames it to `<stream>.<NNNNNN>.json` once it
+reaches its size or age limit. Closed segments are compressed to `.gz` in the
+background. `manifest.json` lists every segment with its time range and the
+sessions it contains, so readers can open only the segments they need.
+
+With the per-process layout every worker has its own files and manifest, e.g.
+`events.p4242-20250908101215.json` and `manifest.p4242-20250908101215.json`.
+
+The manifest is an index, not the source of truth: segments found on disk but
+missing from it (e.g. after a crash between the rename and the manifest update)
+are still read, with their time range and sessions taken from their records.
+"""
+import gzip
+import json
+import os
+import re
+
+from agent_logs.binlog import MAGIC, read_frames
+from agent_logs.jsonstream import iter_elements
+from agent_logs.locking import lock_exclusive
+
+MANIFEST = "manifest.json"
+_MANIFEST_RE = re.compile(r"^manifest(\.p[\w-]+)?\.json$")
+# Latest dump timestamp; its tail completes a shorter upper bound.
+_LAST_TIMESTAMP = "9999-12-31_23-59-59-999"
+
+
+def end_bound(end):
+    """Inclusive upper bound `end`, completed to the last millisecond it covers.
+
+    `2025-09-08_10-05-00` becomes `2025-09-08_10-05-00-999`, so the records of
+    that second are kept when compared with full record timestamps.
+    """
+    if end is None or len(end) >= len(_LAST_TIMESTAMP):
+        return end
+    return end + _LAST_TIMESTAMP[len(end):]
+
+
+def manifest_lock(log_dir, name=MANIFEST):
+    """Hold the lock serialising the rollovers and updates of manifest `name`.
+
+    Returns the open lock file; closing it releases the lock.
+    """
+    lock = open(os.path.join(log_dir, name + ".lock"), "a")
+    lock_exclusive(lock.fileno())
+    return lock
+
+
+def load_manifest(log_dir, name=MANIFEST):
+    path = os.path.join(log_dir, name)
+    if not os.path.exists(path):
+        return {"segments": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_manifests(log_dir):
+    """Merge the manifests of every process that wrote into `log_dir`."""
+    merged = {"segments": [], "live": []}
+    for name in sorted(os.listdir(log_dir)):
+        if _MANIFEST_RE.match(name):
+            manifest = load_manifest(log_dir, name)
+            merged["segments"] += manifest["segments"]
+            merged["live"] += manifest.get("live", [])
+    return merged
+
+
+def save_manifest(log_dir, manifest, name=MANIFEST):
+    """Atomically replace a manifest of `log_dir`."""
+    path = os.path.join(log_dir, name)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def select_segments(log_dir, stream, start=None, end=None, session_id=None):
+    """Return the paths of the segments of `stream` that may hold matching records.
+
+    Args:
+        log_dir: The rotated log directory.
+        stream: `events`, `state` or an agent name.
+        start, end: Optional bounds in the dump timestamp format
+            (`%Y-%m-%d_%H-%M-%S-%f`, as in the records).
+        session_id: Only keep segments that contain this session.
+    """
+    end = end_bound(end)
+    manifest = load_manifests(log_dir)
+    segments = [segment for segment in manifest["segments"] + manifest["live"] if segment["stream"] == stream]
+    listed = {_uncompressed(segment["file"]) for segment in segments}
+    for name in closed_files(log_dir, stream):
+        if _uncompressed(name) not in listed:
+            listed.add(_uncompressed(name))
+            segment = {"file": name}
+            if start is not None or end is not None or session_id is not None:
+                try:
+                    segment = segment_summary(os.path.join(log_dir, name), name)
+                except (OSError, EOFError, ValueError):
+                    pass  # unreadable: let the reader decide
+            segments.append(segment)
+    paths = []
+    for segment in segments:
+        first, last = segment.get("first_timestamp"), segment.get("last_timestamp")
+        if start is not None and last is not None and last < start:
+            continue
+        if end is not None and first is not None and first > end:
+            continue
+        if session_id is not None and session_id not in segment.get("session_ids", [session_id]):
+            continue
+        paths.append(os.path.join(log_dir, segment["file"]))
+    # The live files of running writers are only listed once they close.
+    paths += [os.path.join(log_dir, name) for name in live_files(log_dir, stream)
+              if name not in listed]
+    return paths
+
+
+def live_files(log_dir, stream):
+    """Names of the live (not rolled over) files of `stream`, for every process."""
+    pattern = re.compile(re.escape(stream) + r"(\.p\d+-\d{14})?\.(json|adkb)$")
+    return sorted(name for name in os.listdir(log_dir) if pattern.match(name))
+
+
+def closed_files(log_dir, stream):
+    """Names of the rolled over segments of `stream` on disk, for every process.
+
+    A segment being compressed is listed once, by its uncompressed name.
+    """
+    pattern = re.compile(re.escape(stream) + r"(\.p\d+-\d{14})?\.\d{6}\.(json|adkb)(\.gz)?$")
+    names = {}
+    for name in sorted(os.listdir(log_dir)):
+        if pattern.match(name):
+            names.setdefault(_uncompressed(name), name)
+    return sorted(names.values())
+
+
+def segment_summary(path, name):
+    """Manifest entry of a segment missing from the manifest, read from its records."""
+    segment = {"file": name, "first_timestamp": None, "last_timestamp": None, "session_ids": [], "records": 0}
+    with open_segment(path) as f:
+        head = f.read(len(MAGIC))
+        f.seek(0)
+        if head == MAGIC:
+            records = (record for _, record in read_frames(f))
+        else:
+            records = (record for _, _, record in iter_elements(f))
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            segment["records"] += 1
+            timestamp = record.get("timestamp")
+            if timestamp is not None:
+                # Writers sharing a file append in lock order, not quite in time order.
+                segment["first_timestamp"] = min(segment["first_timestamp"] or timestamp, timestamp)
+                segment["last_timestamp"] = max(segment["last_timestamp"] or timestamp, timestamp)
+            session_id = record.get("session_id")
+            if session_id is not None and session_id not in segment["session_ids"]:
+                segment["session_ids"].append(session_id)
+    return segment
+
+
+def _uncompressed(name):
+    return name[:-len(".gz")] if name.endswith(".gz") else name
+
+
+def open_segment(path):
+    """Open a segment for binary reading, decompressing closed `.gz` segments."""
+    if not os.path.exists(path) and os.path.exists(path + ".gz"):
+        path += ".gz"  # compressed since the manifest was read
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
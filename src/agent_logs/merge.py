@@ -0,0 +1,110 @@
+"""Merge-on-read of the dump files written by several processes or segments.
+
+Records are stamped before their writer takes the file lock, so the records
+of a file are only roughly in time order: in the shared layout several
+processes append in lock order, and threads of one process may too. Each file
+is therefore sorted on its own (the selected records only, and cheaply since
+they are nearly sorted) before the files of a stream are interleaved by
+timestamp with `heapq.merge`.
+"""
+import heapq
+import os
+import re
+
+from agent_logs.binlog import MAGIC, read_frames
+from agent_logs.jsonstream import iter_elements, iter_nested
+from agent_logs.manifest import end_bound, open_segment, select_segments
+
+DUMP_FILE = re.compile(r"^(?P<stream>events|state)(\.p\d+-\d{14})?(\.\d{6})?\.(json|adkb)(\.gz)?$")
+LOG_DIR = re.compile(r"^\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}$")
+
+
+def dump_files(log_dir):
+    """Yield (stream, path) of the `events` and `state` dumps of `log_dir`, by name."""
+    for name in sorted(os.listdir(log_dir)):
+        match = DUMP_FILE.match(name)
+        if match:
+            yield match.group("stream"), os.path.join(log_dir, name)
+
+
+def log_dirs(root):
+    """`root` itself if it holds dumps, else its `<timestamp>` subdirectories."""
+    if any(DUMP_FILE.match(name) for name in os.listdir(root)):
+        return [root]
+    return [os.path.join(root, name) for name in sorted(os.listdir(root))
+            if LOG_DIR.match(name) and os.path.isdir(os.path.join(root, name))]
+
+
+def utc_offset(samples):
+    """Median UTC offset of (local epoch, UTC epoch) pairs, to the quarter hour.
+
+    Dump and log stamps are local wall-clock times; pairing them with the
+    epoch timestamps of the events written at the same time recovers the
+    offset of the machine that wrote them.
+    """
+    offsets = sorted(round((local - utc) / 900) * 900 for local, utc in samples)
+    return offsets[len(offsets) // 2] if offsets else 0
+
+
+def iter_file(path):
+    """Yield the records of one dump file (JSON array or binary, plain or gzipped)."""
+    with open_segment(path) as f:
+        head = f.read(len(MAGIC))
+        f.seek(0)
+        if head != MAGIC:
+            for _, _, record in iter_elements(f):
+                yield record
+            return
+        for _, record in read_frames(f):
+            yield record
+
+
+def iter_events(path, offset=None):
+    """Yield (record_offset, record, event_offset, event_size, event) of an events dump.
+
+    JSON dumps are read event by event; event offsets are only known for them
+    and are None for binary dumps. `offset` is the offset of a record to start
+    from.
+    """
+    with open_segment(path) as f:
+        if f.read(len(MAGIC)) == MAGIC:
+            f.seek(0)
+            for record_offset, record in read_frames(f, offset or None):
+                for event in record.get("events") or []:
+                    yield record_offset, record, None, None, event
+            return
+        f.seek(0)
+        for item in iter_nested(f, "events", offset or None):
+            yield item.record_offset, item.record, item.offset, item.size, item.value
+
+
+def iter_stream(log_dir, stream, start=None, end=None, session_id=None):
+    """Yield the records of `stream` from every process and segment, by timestamp.
+
+    The selected records of each file are held in memory to be sorted; narrow
+    large reads with the bounds or the session.
+
+    Args:
+        log_dir: A `logs/<timestamp>` directory.
+        stream: `events`, `state` or an agent name.
+        start, end: Optional inclusive bounds in the dump timestamp format.
+        session_id: Only yield records of this session.
+    """
+    end = end_bound(end)
+
+    def selected(path):
+        for record in iter_file(path):
+            timestamp = record.get("timestamp") or ""
+            if start is not None and timestamp < start:
+                continue
+            if end is not None and timestamp > end:
+                continue
+            if session_id is not None and record.get("session_id") != session_id:
+                continue
+            yield record
+
+    def timestamp(record):
+        return record.get("timestamp") or ""
+
+    paths = select_segments(log_dir, stream, start, end, session_id)
+    yield from heapq.merge(*(iter(sorted(selected(p), key=timestamp)) for p in paths), key=timestamp)
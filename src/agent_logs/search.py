@@ -0,0 +1,445 @@
+"""Full-text search over the conversation content of events dumps.
+
+The index covers the text parts of every dumped event, the name and arguments
+of its function calls, and the name and payload of its function responses.
+Each event is indexed once, by id, although every record of the `events`
+stream repeats the history of its session. Hits point back to the session,
+the event and its location in the dump file.
+
+The index lives in `<root>/search/`, where `root` is the `logs` directory
+(every `logs/<timestamp>` directory below it is indexed) or a single log
+directory. `update` only reads what was appended since its last run and
+writes the new postings as a segment; segments are merged once there are
+more than `MAX_SEGMENTS`. A segment is `seg-<n>.json`, with its docs and a
+table of the offset and size of each term's postings, and `seg-<n>.postings`,
+from which a query reads the postings of its terms only. Dump files are recognised by their first bytes, so
+the progress in a file is kept when a rollover renames it (and compresses it)
+and starts over when a new file takes its name:
+
+    python -m agent_logs.search update logs
+    python -m agent_logs.search query logs 'marrakech AND "jemaa el-fna" -hotel'
+
+Queries combine terms, "quoted phrases", `AND` (also implied between terms),
+`OR`, `NOT` or a leading `-`, and parentheses.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+from agent_logs.manifest import open_segment
+from agent_logs.merge import iter_events
+
+SEARCH_DIR = "search"
+MAX_SEGMENTS = 16
+
+_TOKEN = re.compile(r"\w+")
+_EVENTS_FILE = re.compile(r"^events(\.p\d+-\d{14})?(\.\d{6})?\.(json|adkb)(\.gz)?$")
+_SEGMENT = re.compile(r"^seg-(\d{6})\.json$")
+_POSTINGS_SUFFIX = ".postings"
+# Positions skipped between two fields, so phrases do not match across them.
+_FIELD_GAP = 16
+# Bytes at the start of a dump that identify it: the first record's timestamp and session.
+_HEAD_SIZE = 256
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+def _strings(value):
+    """Keys and string leaves of a JSON value, skipping encoded binary data."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        if "__bytes__" in value or "__blob__" in value:
+            return
+        for key, item in value.items():
+            if item is not None:
+                yield key
+                yield from _strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _strings(item)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield str(value)
+
+
+def event_fields(event):
+    """Searchable fields of a dumped event, as a list of strings."""
+    fields = []
+    content = event.get("content") or {}
+    for part in content.get("parts") or []:
+        if part.get("text"):
+            fields.append(part["text"])
+        call = part.get("function_call")
+        if call:
+            fields.append(call.get("name") or "")
+            fields.append(" ".join(_strings(call.get("args"))))
+        response = part.get("function_response")
+        if response:
+            fields.append(response.get("name") or "")
+            fields.append(" ".join(_strings(response.get("response"))))
+    return [field for field in fields if field]
+
+
+def _postings(fields):
+    """{term: [positions]} of the fields of one event."""
+    terms = {}
+    position = 0
+    for field in fields:
+        for token in tokenize(field):
+            terms.setdefault(token, []).append(position)
+            position += 1
+        position += _FIELD_GAP
+    return terms
+
+
+def _events_files(root):
+    """Relative paths of the events dumps under `root` and its log directories."""
+    paths = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and name != SEARCH_DIR:
+            paths += [os.path.join(name, sub) for sub in sorted(os.listdir(path)) if _EVENTS_FILE.match(sub)]
+        elif _EVENTS_FILE.match(name):
+            paths.append(name)
+    return paths
+
+
+def _read_head(path):
+    with open_segment(path) as f:
+        head = f.read(_HEAD_SIZE)
+    # The closing bracket of a short JSON dump is overwritten by its next record.
+    return head[:-3] if len(head) < _HEAD_SIZE and head.endswith(b"\n]\n") else head
+
+
+def _same_file(head, state):
+    """Whether a file starting with `head` is the one `state` was saved for."""
+    size = state.get("head_size")
+    return bool(size) and len(head) >= size and hashlib.sha1(head[:size]).hexdigest() == state["head"]
+
+
+class SearchIndex:
+    """An inverted index of the events dumped under `root`.
+
+    `files` maps the relative path of each dump to its progress: the offset of
+    the record to resume from, the hash of its first bytes and the `key` its
+    events are indexed under, which stays the same across renames.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.dir = os.path.join(root, SEARCH_DIR)
+        self.docs = []
+        self.files = {}
+        self.segments = []
+        # Term table of each segment: {term: [offset, size]} in its postings file.
+        self._terms = {}
+        # Postings held in the segment itself, by older versions.
+        self._inline = {}
+        if os.path.exists(os.path.join(self.dir, "state.json")):
+            with open(os.path.join(self.dir, "state.json")) as f:
+                # Older states only hold offsets; those files are read again.
+                self.files = {relpath: state for relpath, state in json.load(f)["files"].items()
+                              if isinstance(state, dict)}
+        if os.path.isdir(self.dir):
+            for name in sorted(os.listdir(self.dir)):
+                if _SEGMENT.match(name):
+                    with open(os.path.join(self.dir, name)) as f:
+                        self._add_segment(name, json.load(f))
+        self.event_ids = {doc["event_id"] for doc in self.docs}
+        self._paths = {state["key"]: relpath for relpath, state in self.files.items()}
+
+    def _add_segment(self, name, segment):
+        self.segments.append(name)
+        self.docs += segment["docs"]
+        if "postings" in segment:
+            self._inline[name] = segment["postings"]
+        else:
+            self._terms[name] = segment["terms"]
+
+    def _postings_path(self, name):
+        return os.path.join(self.dir, name[:-len(".json")] + _POSTINGS_SUFFIX)
+
+    def postings(self, term):
+        """[[doc, positions], ...] of `term` in every segment, in doc order."""
+        result = []
+        for name in self.segments:
+            if name in self._inline:
+                result += self._inline[name].get(term, [])
+                continue
+            location = self._terms[name].get(term)
+            if location is not None:
+                with open(self._postings_path(name), "rb") as f:
+                    f.seek(location[0])
+                    result += json.loads(f.read(location[1]))
+        return result
+
+    def update(self):
+        """Index the events dumped since the last update.
+
+        Returns:
+            int: The number of newly indexed events.
+        """
+        segment = {"docs": [], "postings": {}}
+        files = {}
+        keys = set()
+        for relpath in _events_files(self.root):
+            path = os.path.join(self.root, relpath)
+            head = _read_head(path)
+            state = self.files.get(relpath)
+            if state is None or not _same_file(head, state):
+                # Renamed by a rollover, or a new file under a known name.
+                known = [s for s in self.files.values() if s["key"] not in keys and _same_file(head, s)]
+                state = max(known, key=lambda s: s["head_size"], default=None)
+            resume = state["offset"] if state is not None else 0
+            if not relpath.endswith(".gz") and os.path.getsize(path) < resume:
+                resume = 0
+            key = state["key"] if state is not None else f"{relpath}:{hashlib.sha1(head).hexdigest()[:12]}"
+            keys.add(key)
+            state = files[relpath] = {"offset": resume, "head": hashlib.sha1(head).hexdigest(),
+                                      "head_size": len(head), "key": key}
+            for record_offset, record, offset, size, event in iter_events(path, resume):
+                # The last record may still be growing; it is read again next time.
+                state["offset"] = record_offset
+                event_id = event.get("id")
+                if event_id in self.event_ids:
+                    continue
+                self.event_ids.add(event_id)
+                doc = len(self.docs) + len(segment["docs"])
+                segment["docs"].append({
+                    "file": relpath,
+                    "file_key": key,
+                    "record_offset": record_offset,
+                    "offset": offset,
+                    "size": size,
+                    "session_id": record.get("session_id"),
+                    "event_id": event_id,
+                    "invocation_id": event.get("invocation_id"),
+                    "author": event.get("author"),
+                    "timestamp": event.get("timestamp"),
+                })
+                for term, positions in _postings(event_fields(event)).items():
+                    segment["postings"].setdefault(term, []).append([doc, positions])
+        if segment["docs"]:
+            os.makedirs(self.dir, exist_ok=True)
+            postings = segment["postings"]
+            name, terms = self._write_segment(segment["docs"], ((term, postings[term]) for term in sorted(postings)))
+            self._add_segment(name, {"docs": segment["docs"], "terms": terms})
+        # The state is saved after the segment, so a crash in between only
+        # makes the next update re-read (and skip) the same events.
+        self.files = files
+        self._paths = {state["key"]: relpath for relpath, state in files.items()}
+        os.makedirs(self.dir, exist_ok=True)
+        _write_json(os.path.join(self.dir, "state.json"), {"files": files})
+        if len(self.segments) > MAX_SEGMENTS:
+            self.compact()
+        return len(segment["docs"])
+
+    def _next_segment(self):
+        return max((int(_SEGMENT.match(n).group(1)) for n in self.segments), default=0) + 1
+
+    def _write_segment(self, docs, postings):
+        """Write a segment of `docs` with the (term, postings) pairs of `postings`.
+
+        The postings file is written first; a segment only exists once its
+        `.json` file does.
+
+        Returns:
+            tuple: The segment name and its term table.
+        """
+        name = f"seg-{self._next_segment():06d}.json"
+        path = self._postings_path(name)
+        terms = {}
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            for term, term_postings in postings:
+                data = json.dumps(term_postings, separators=(",", ":")).encode("utf-8")
+                terms[term] = [f.tell(), len(data)]
+                f.write(data)
+        os.replace(tmp, path)
+        _write_json(os.path.join(self.dir, name), {"docs": docs, "terms": terms})
+        return name, terms
+
+    def compact(self):
+        """Merge every segment into one."""
+        old = list(self.segments)
+        terms = set()
+        for name in old:
+            terms.update(self._inline[name] if name in self._inline else self._terms[name])
+        # Postings are read one term at a time, in segment order, so docs stay sorted.
+        merged = ((term, self.postings(term)) for term in sorted(terms))
+        name, merged_terms = self._write_segment(self.docs, merged)
+        for name_old in old:
+            os.remove(os.path.join(self.dir, name_old))
+            if name_old in self._terms:
+                os.remove(self._postings_path(name_old))
+        self.segments = [name]
+        self._terms = {name: merged_terms}
+        self._inline = {}
+
+    def _term(self, term):
+        return {doc for doc, _ in self.postings(term)}
+
+    def _phrase(self, tokens):
+        if not tokens:
+            return set()
+        if len(tokens) == 1:
+            return self._term(tokens[0])
+        positions = [{doc: set(p) for doc, p in self.postings(token)} for token in tokens]
+        docs = set(positions[0]).intersection(*positions[1:])
+        return {
+            doc for doc in docs
+            if any(all(start + i in positions[i][doc] for i in range(1, len(tokens)))
+                   for start in positions[0][doc])
+        }
+
+    def search(self, query):
+        """Docs matching `query`, most recent first."""
+        matches = _QueryParser(query, self).parse()
+        hits = (dict(self.docs[doc], file=self.path_of(self.docs[doc])) for doc in matches)
+        return sorted(hits, key=lambda d: d["timestamp"] or "", reverse=True)
+
+    def path_of(self, doc):
+        """Relative path of the dump of a doc now, after any rollover."""
+        return self._paths.get(doc.get("file_key"), doc["file"])
+
+    def read(self, doc):
+        """Load the event of a search hit from its dump."""
+        path = os.path.join(self.root, self.path_of(doc))
+        with open_segment(path) as f:
+            if doc["offset"] is not None:
+                f.seek(doc["offset"])
+                return json.loads(f.read(doc["size"]))
+        for _, _, _, _, event in iter_events(path, doc["record_offset"]):
+            if event.get("id") == doc["event_id"]:
+                return event
+        return None
+
+
+class _QueryParser:
+    """expr := and (OR and)*; and := unary (AND? unary)*; unary := (NOT|-) unary | ( expr ) | phrase | term"""
+
+    _LEXER = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|(-)|([^\s()"]+))')
+
+    def __init__(self, query, index):
+        self.index = index
+        self.tokens = []
+        pos = 0
+        while pos < len(query):
+            match = self._LEXER.match(query, pos)
+            if match is None or match.end() == pos:
+                break
+            pos = match.end()
+            lparen, rparen, phrase, minus, word = match.groups()
+            if lparen:
+                self.tokens.append(("(", None))
+            elif rparen:
+                self.tokens.append((")", None))
+            elif phrase is not None:
+                self.tokens.append(("phrase", phrase))
+            elif minus:
+                self.tokens.append(("NOT", None))
+            elif word in ("AND", "OR", "NOT"):
+                self.tokens.append((word, None))
+            else:
+                self.tokens.append(("phrase", word))
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def parse(self):
+        result = self._or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"unexpected {self.tokens[self.pos][0]!r} in query")
+        return result
+
+    def _or(self):
+        result = self._and()
+        while self._peek() == "OR":
+            self.pos += 1
+            result = result | self._and()
+        return result
+
+    def _and(self):
+        result = self._unary()
+        while self._peek() not in (None, "OR", ")"):
+            if self._peek() == "AND":
+                self.pos += 1
+            result = result & self._unary()
+        return result
+
+    def _unary(self):
+        kind = self._peek()
+        if kind is None:
+            raise ValueError("incomplete query")
+        self.pos += 1
+        if kind == "NOT":
+            return set(range(len(self.index.docs))) - self._unary()
+        if kind == "(":
+            result = self._or()
+            if self._peek() != ")":
+                raise ValueError("missing ) in query")
+            self.pos += 1
+            return result
+        if kind == "phrase":
+            return self.index._phrase(tokenize(self.tokens[self.pos - 1][1]))
+        raise ValueError(f"unexpected {kind!r} in query")
+
+
+def _write_json(path, obj):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _cmd_update(args):
+    index = SearchIndex(args.root)
+    while True:
+        count = index.update()
+        print(f"indexed {count} new events", flush=True)
+        if not args.watch:
+            return
+        time.sleep(args.watch)
+
+
+def _cmd_query(args):
+    index = SearchIndex(args.root)
+    if args.update:
+        index.update()
+    for doc in index.search(args.query)[:args.limit]:
+        hit = dict(doc)
+        if args.events:
+            hit["event"] = index.read(doc)
+        sys.stdout.write(json.dumps(hit) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Full-text search over dumped events.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    update = sub.add_parser("update", help="Index the events dumped since the last update.")
+    update.add_argument("root", help="The logs directory, or one logs/<timestamp> directory.")
+    update.add_argument("--watch", type=float, metavar="SECONDS", help="Keep updating at this interval.")
+    update.set_defaults(func=_cmd_update)
+
+    query = sub.add_parser("query", help="Print matching events as JSON lines, most recent first.")
+    query.add_argument("root")
+    query.add_argument("query")
+    query.add_argument("--limit", type=int, default=50)
+    query.add_argument("--update", action="store_true", help="Update the index first.")
+    query.add_argument("--events", action="store_true", help="Include the matching events.")
+    query.set_defaults(func=_cmd_query)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Routing of dump records to the files of a log directory."""
+import gzip
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from agent_logs.binlog import append_binary_record
+from agent_logs.encoder import append_json_record
+from agent_logs.index import INDEX, IndexWriter
+from agent_logs.locking import open_locked
+from agent_logs.manifest import MANIFEST, load_manifest, manifest_lock, save_manifest, segment_summary
+
+FORMATS = {"json": ".json", "binary": ".adkb"}
+
+
+class DumpWriter:
+    """Appends records to one file per stream (`events`, `state`, `<agent>`).
+
+    Args:
+        log_dir: Directory of the dump files.
+        fmt: `json` for the JSON arrays read by the logs viewer, or `binary` for
+            the compact format of `agent_logs.binlog`.
+        compression: Frame codec of binary dumps (`none`, `zlib` or `zstd`).
+        blobs: Optional `BlobStore` for large payloads.
+        max_bytes: Roll a stream over to a new segment once its file reaches
+            this size. 0 disables the size limit.
+        max_age: Roll a stream over once its segment is this many seconds old.
+            0 disables the age limit.
+        segment_compression: `gzip` to compress closed segments in the
+            background, or `none`.
+        process_tag: When set, every file of this writer carries the tag
+            (`events.<tag>.json`, `manifest.<tag>.json`) so several server
+            workers can dump into the same directory without sharing files.
+            Use `process_tag()` to build one.
+        index: Whether to maintain `index.jsonl`, see `agent_logs.index`.
+
+    Without a process tag, the files and the manifest are shared with the
+    other writers of the directory. Rollovers then run under the lock of the
+    manifest: the segment number is allocated and the manifest merged from
+    disk under it, and a live file that another writer already rolled over is
+    not rolled again. Each writer only sees its own records, so the time range
+    and sessions of a shared segment are read back from it once it is closed.
+    """
+
+    def __init__(self, log_dir, fmt="json", compression="none", blobs=None,
+                 max_bytes=0, max_age=0, segment_compression="gzip", process_tag=None, index=False):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown dump format {fmt!r}, expected one of {sorted(FORMATS)}")
+        self.log_dir = log_dir
+        self.fmt = fmt
+        self.compression = compression
+        self.blobs = blobs
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.segment_compression = segment_compression
+        self.process_tag = process_tag
+        self._manifest_name = f"manifest.{process_tag}.json" if process_tag else MANIFEST
+        self.index = IndexWriter(log_dir, f"index.{process_tag}.jsonl" if process_tag else INDEX) if index else None
+        self._segments = {}
+        # Called as listener(stream, path, offset, size) after every write.
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._compressor = None
+        if self.rotating:
+            self._manifest = load_manifest(log_dir, self._manifest_name)
+            self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dump-compress")
+
+    @property
+    def shared(self):
+        return self.process_tag is None
+
+    @property
+    def rotating(self):
+        return self.max_bytes > 0 or self.max_age > 0
+
+    def file_stem(self, stream):
+        return f"{stream}.{self.process_tag}" if self.process_tag else stream
+
+    def path_for(self, stream):
+        return os.path.join(self.log_dir, self.file_stem(stream) + FORMATS[self.fmt])
+
+    def write(self, stream, record, exclude=None):
+        """Append `record` to `stream`, rolling the stream over first if needed.
+
+        Args:
+            stream: Name of the dump file without extension.
+            record: The record to encode.
+            exclude: Optional set of dotted field paths to leave out.
+
+        Returns:
+            tuple: (path, offset, size) of the written record.
+        """
+        path = self.path_for(stream)
+        if self.rotating:
+            segment = self._segments.get(stream)
+            if segment is not None and self._should_roll(segment):
+                with self._manifest_lock():
+                    self._roll(stream, segment)
+                segment = None
+            if segment is None:
+                segment = self._segments[stream] = _new_segment(path)
+
+        on_written = None
+        if self.index is not None:
+            # Indexed under the lock of the file, so the line is in order with the
+            # rename line of a rollover by another writer.
+            def on_written(offset, size):
+                self.index.add(stream, path, offset, size, record)
+
+        if self.fmt == "binary":
+            offset, size = append_binary_record(path, record, self.compression, self.blobs, exclude, on_written)
+        else:
+            offset, size = append_json_record(path, record, self.blobs, exclude, on_written)
+
+        if self.rotating:
+            if segment["inode"] is None:
+                segment["inode"] = _inode(path)
+            segment["bytes"] = offset + size
+            segment["records"] += 1
+            timestamp = record.get("timestamp") if isinstance(record, dict) else None
+            if timestamp is not None:
+                segment["first_timestamp"] = segment["first_timestamp"] or timestamp
+                segment["last_timestamp"] = timestamp
+            session_id = record.get("session_id") if isinstance(record, dict) else None
+            if session_id is not None and session_id not in segment["session_ids"]:
+                segment["session_ids"].append(session_id)
+        for listener in self.listeners:
+            listener(stream, path, offset, size)
+        return path, offset, size
+
+    def _should_roll(self, segment):
+        if self.max_bytes and segment["bytes"] >= self.max_bytes:
+            return True
+        return bool(self.max_age) and time.time() - segment["opened_at"] >= self.max_age
+
+    def _manifest_lock(self):
+        """Lock serialising the rollovers and manifest updates of the writers of the directory."""
+        return manifest_lock(self.log_dir, self._manifest_name)
+
+    def _update_manifest(self, update):
+        """Apply `update(manifest)` to the manifest on disk; call with the manifest lock held."""
+        with self._lock:
+            manifest = load_manifest(self.log_dir, self._manifest_name)
+            update(manifest)
+            save_manifest(self.log_dir, manifest, self._manifest_name)
+            self._manifest = manifest
+
+    def _roll(self, stream, segment):
+        """Close the live segment of `stream`; call with the manifest lock held."""
+        path = self.path_for(stream)
+        if self.shared and (segment["inode"] != _inode(path) or _size(path) < segment["bytes"]):
+            return  # already rolled over by another writer
+        index = _next_index(self.log_dir, self.file_stem(stream))
+        closed = f"{self.file_stem(stream)}.{index:06d}{FORMATS[self.fmt]}"
+        # Holding the lock of the live file, no append of another writer is half
+        # done, and every index line of the closed segment precedes the rename line.
+        fd = open_locked(path)
+        try:
+            if self.index is not None:
+                self.index.rename(os.path.basename(path), closed)
+            os.replace(path, os.path.join(self.log_dir, closed))
+        finally:
+            os.close(fd)
+        entry = dict(segment, stream=stream, process=self.process_tag, file=closed, index=index,
+                     closed=datetime.now().isoformat(timespec="milliseconds"))
+        entry.pop("opened_at")
+        entry.pop("inode")
+        if self.shared:
+            # Filled in from the segment itself by _close_segment.
+            entry.update(first_timestamp=None, last_timestamp=None, records=None)
+            entry.pop("session_ids")
+        self._update_manifest(lambda manifest: manifest["segments"].append(entry))
+        if self.shared or self.segment_compression == "gzip":
+            self._compressor.submit(self._close_segment, entry)
+
+    def _close_segment(self, entry):
+        source = os.path.join(self.log_dir, entry["file"])
+        changes = {}
+        if self.shared:
+            summary = segment_summary(source, entry["file"])
+            changes.update(summary, bytes=os.path.getsize(source))
+        if self.segment_compression == "gzip":
+            with open(source, "rb") as src, gzip.open(source + ".gz.tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(source + ".gz.tmp", source + ".gz")
+            changes.update(file=entry["file"] + ".gz", compressed=True)
+
+        def update(manifest):
+            for segment in manifest["segments"]:
+                if segment["file"] == entry["file"] and segment["stream"] == entry["stream"]:
+                    segment.update(changes)
+
+        with self._manifest_lock():
+            self._update_manifest(update)
+        if self.segment_compression == "gzip":
+            os.remove(source)
+
+    def close(self):
+        """Record the live segments in the manifest and finish pending compressions.
+
+        Live files shared with other writers are not recorded: readers list
+        them from the directory.
+        """
+        if not self.rotating:
+            return
+        self._compressor.shutdown(wait=True)
+        live = []
+        if not self.shared:
+            for stream, segment in self._segments.items():
+                entry = dict(segment, stream=stream, process=self.process_tag,
+                             file=os.path.basename(self.path_for(stream)), closed=None)
+                entry.pop("opened_at")
+                entry.pop("inode")
+                live.append(entry)
+
+        def update(manifest):
+            manifest["live"] = live
+
+        with self._manifest_lock():
+            self._update_manifest(update)
+
+
+def process_tag():
+    """Tag identifying this process: pid plus start time, e.g. `p4242-20250908101215`."""
+    return f"p{os.getpid()}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+
+def _new_segment(path):
+    return {
+        "opened": datetime.now().isoformat(timespec="milliseconds"),
+        "opened_at": time.time(),
+        "first_timestamp": None,
+        "last_timestamp": None,
+        "session_ids": [],
+        "records": 0,
+        "bytes": _size(path),
+        "compressed": False,
+        # The live file this segment is about, set once it exists.
+        "inode": _inode(path),
+    }
+
+
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _next_index(log_dir, stem):
+    pattern = re.compile(re.escape(stem) + r"\.(\d{6})\.")
+    indexes = [int(m.group(1)) for m in map(pattern.match, os.listdir(log_dir)) if m]
+    return max(indexes, default=0) + 1
@@ -0,0 +1,267 @@
+"""Sets up the dumper from the environment and patches the agents of PROJECT_DIR.
+
+Imported on first access to `agent_with_dump.agent` (or `root_agent`): it
+creates `logs/<timestamp>` in PROJECT_DIR, patches the agents found there and
+changes directory to PROJECT_DIR.
+"""
+import itertools
+import logging
+
+from agent_with_dump.cassette import Cassette, use_cassettes
+from agent_with_dump.hooks import chain_callback, wrap_run_async
+from agent_with_dump.live import DEFAULT_ORIGINS, LiveBuffer
+from agent_with_dump.metrics import Metrics, MetricsFlusher
+from agent_with_dump.profiler import InvocationProfiler
+from agent_with_dump.policy import ErrorBuffer, load_policy
+from agent_with_dump.tracing import Tracer, instrument_agent, make_exporter
+from agent_with_dump.tree import find_root_agent, iter_agents
+from agent_with_dump.watchdog import LoopWatchdog
+from agent_logs.blobs import BlobStore
+from agent_logs.writer import DumpWriter, process_tag
+from google.adk.agents.callback_context import CallbackContext
+from datetime import datetime
+
+def _event_fields(event):
+    """Select the dumped fields of an event; values are referenced, not copied."""
+    return {
+        "id": event.id,
+        "timestamp": str(event.timestamp),
+        "author": event.author,
+        "content": event.content,
+        "invocation_id": event.invocation_id,
+        "long_running_tool_ids": event.long_running_tool_ids,
+        "actions": event.actions,
+        "usage_metadata": event.usage_metadata,
+    }
+
+
+def _dump_records(session, agent_name, invocation_id=None, first_event=0):
+    """Yield the (stream, record) pairs of one dump of `session`.
+
+    With `first_event`, the events record only holds the events from that index
+    on and says so in its `first_event` field.
+    """
+    timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S-%f')[:-3]
+    yield agent_name, {
+        "agent": agent_name,
+        "timestamp": timestamp,
+        "session_id": session.id,
+        "invocation_id": invocation_id,
+    }
+
+    yield "state", {
+        "agent": agent_name,
+        "timestamp": timestamp,
+        "session_id": session.id,
+        "invocation_id": invocation_id,
+        "state": session.state.to_dict() if hasattr(session.state, "to_dict") else session.state,
+    }
+
+    events = {
+        "agent": agent_name,
+        "timestamp": timestamp,
+        "session_id": session.id,
+        "invocation_id": invocation_id,
+        "events": (_event_fields(event) for event in itertools.islice(session.events, first_event, None)),
+    }
+    if first_event:
+        events["first_event"] = first_event
+    yield "events", events
+
+
+def _write_dump(session, agent_name, invocation_id=None):
+    for stream, record in _dump_records(session, agent_name, invocation_id):
+        dump_writer.write(stream, record, capture_policy.exclude(agent_name, stream))
+
+
+async def dump_context_callback(callback_context: CallbackContext, agent_name: str):
+    """Dump session state/events of a given agent into its own file.
+
+    Records are streamed straight from the live session into the dump files by
+    `dump_writer`, so no JSON-safe copy of the events or state is built. With an
+    `on_error` capture policy they go to `error_buffer` instead.
+    """
+    session = callback_context._invocation_context.session
+    if not capture_policy.sampled(agent_name, session.id):
+        return
+    if capture_policy.on_error(agent_name):
+        event_count = len(session.events)
+        first_event = error_buffer.first_event(session.id, event_count)
+        for stream, record in _dump_records(session, agent_name, callback_context.invocation_id, first_event):
+            error_buffer.add(session.id, stream, record, capture_policy.exclude(agent_name, stream),
+                             event_count if stream == "events" else None)
+        return
+    _write_dump(session, agent_name, callback_context.invocation_id)
+
+
+def _flush_on_error(session, agent_name, invocation_id):
+    """Write the buffered dumps of a failing session, then its current state."""
+    if not capture_policy.sampled(agent_name, session.id):
+        return
+    logging.info(f"Invocation of {agent_name} failed, flushing dumps of session {session.id}")
+    error_buffer.flush(session.id, dump_writer)
+    _write_dump(session, agent_name, invocation_id)
+
+import importlib
+from pathlib import Path  
+
+
+
+def _instrument(agent_obj, agent_name):
+    """Attach the tracing, watchdog, profiling and live view hooks, independently of the capture policy."""
+    if tracer.active:
+        instrument_agent(tracer, agent_obj, agent_name)
+    if loop_watchdog is not None:
+        loop_watchdog.instrument(agent_obj, agent_name)
+    if invocation_profiler is not None:
+        invocation_profiler.instrument(agent_obj, agent_name)
+    if live_buffer is not None:
+        live_buffer.instrument(agent_obj, agent_name)
+
+
+def patch_agent(agent_obj, agent_name: str):
+    """Attach a combined callback that includes the dumper for this agent."""
+    if not capture_policy.enabled(agent_name):
+        _instrument(agent_obj, agent_name)
+        return agent_obj
+    original_cb = getattr(agent_obj, "after_agent_callback", None)
+
+    async def combined_callback(callback_context: CallbackContext, _original_cb=original_cb):
+        with tracer.span("dump", agent_name, callback_context.invocation_id):
+            await dump_context_callback(callback_context, agent_name)
+        if _original_cb is not None:
+            await _original_cb(callback_context)
+
+    agent_obj.after_agent_callback = combined_callback
+
+    if capture_policy.on_error(agent_name):
+        def model_error_hook(callback_context, llm_response):
+            if getattr(llm_response, "error_code", None):
+                _flush_on_error(callback_context._invocation_context.session, agent_name,
+                                callback_context.invocation_id)
+
+        def tool_error_hook(tool, args, tool_context, tool_response):
+            if isinstance(tool_response, dict) and "error" in tool_response:
+                _flush_on_error(tool_context._invocation_context.session, agent_name,
+                                tool_context.invocation_id)
+
+        chain_callback(agent_obj, "after_model_callback", model_error_hook)
+        chain_callback(agent_obj, "after_tool_callback", tool_error_hook)
+        def run_error_hook(parent_context, exc):
+            # The error goes up through the run_async of every ancestor; the
+            # innermost failing agent flushes the session once.
+            if getattr(exc, "_agent_dump_flushed", False):
+                return
+            exc._agent_dump_flushed = True
+            _flush_on_error(parent_context.session, agent_name, parent_context.invocation_id)
+
+        wrap_run_async(agent_obj, run_error_hook)
+    _instrument(agent_obj, agent_name)
+    return agent_obj
+
+
+
+# Expose only root_agent as `agent` for ADK entrypoint
+import atexit
+import os
+import sys
+project_dir = os.environ.get('PROJECT_DIR')
+timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+log_dir = os.path.join(project_dir, "logs", timestamp)
+os.makedirs(log_dir, exist_ok=True)
+# Payloads of at least AGENT_DUMP_BLOB_THRESHOLD bytes go to logs/<timestamp>/blobs. Off (0) by
+# default: the logs viewer and the Gemini analysis read events.json as it is.
+blob_threshold = int(os.environ.get('AGENT_DUMP_BLOB_THRESHOLD', 0))
+blob_store = BlobStore(os.path.join(log_dir, "blobs"), blob_threshold) if blob_threshold > 0 else None
+dump_writer = DumpWriter(
+    log_dir,
+    fmt=os.environ.get('AGENT_DUMP_FORMAT', 'json'),
+    compression=os.environ.get('AGENT_DUMP_COMPRESSION', 'none'),
+    blobs=blob_store,
+    max_bytes=int(os.environ.get('AGENT_DUMP_SEGMENT_MAX_BYTES', 0)),
+    max_age=float(os.environ.get('AGENT_DUMP_SEGMENT_MAX_AGE', 0)),
+    segment_compression=os.environ.get('AGENT_DUMP_SEGMENT_COMPRESSION', 'gzip'),
+    # With several server workers, `per_process` gives each worker its own files;
+    # the default `shared` layout serialises appends with advisory file locks.
+    process_tag=process_tag() if os.environ.get('AGENT_DUMP_LAYOUT', 'shared') == 'per_process' else None,
+    # index.jsonl maps session, agent, invocation and timestamp to record offsets.
+    index=os.environ.get('AGENT_DUMP_INDEX', '1') != '0',
+)
+atexit.register(dump_writer.close)
+# Per-agent enable/disable, session sampling, projection and on-error capture, see policy.py.
+capture_policy = load_policy()
+error_buffer = ErrorBuffer(capture_policy.ring_buffer_size, capture_policy.ring_buffer_sessions, blob_store)
+# AGENT_DUMP_TRACE=chrome|otlp records agent, model, tool and dump spans in log_dir.
+tracer = Tracer(make_exporter(os.environ.get('AGENT_DUMP_TRACE'), log_dir, dump_writer.file_stem))
+# AGENT_DUMP_METRICS=<seconds> keeps latency/token/dump aggregates and rewrites
+# metrics.prom and metrics.json at that interval.
+metrics_interval = float(os.environ.get('AGENT_DUMP_METRICS', 0))
+if metrics_interval > 0:
+    metrics = Metrics()
+    tracer.add_listener(metrics.observe_span)
+    dump_writer.listeners.append(metrics.observe_write)
+    metrics_flusher = MetricsFlusher(metrics, log_dir, dump_writer.file_stem("metrics"), metrics_interval).start()
+    atexit.register(metrics_flusher.close)
+# AGENT_DUMP_LOOP_WATCHDOG=<ms> logs the stack of any call blocking the event
+# loop for longer than that to loop_lag.log.
+loop_watchdog_ms = float(os.environ.get('AGENT_DUMP_LOOP_WATCHDOG', 0))
+loop_watchdog = LoopWatchdog(os.path.join(log_dir, dump_writer.file_stem("loop_lag") + ".log"),
+                             loop_watchdog_ms / 1000) if loop_watchdog_ms > 0 else None
+# AGENT_DUMP_PROFILE=<rate> profiles CPU, allocations and GC of that fraction of
+# invocations into logs/<timestamp>/profiles.
+profile_rate = float(os.environ.get('AGENT_DUMP_PROFILE', 0))
+invocation_profiler = InvocationProfiler(os.path.join(log_dir, "profiles"), profile_rate) if profile_rate > 0 else None
+# AGENT_DUMP_LIVE=<port> keeps the recent events and state deltas of each session
+# in memory and serves them on 127.0.0.1:<port> (HTTP and WebSocket).
+# AGENT_DUMP_LIVE_ORIGINS=<origin>,... replaces the origins allowed to subscribe.
+live_port = int(os.environ.get('AGENT_DUMP_LIVE', 0))
+live_origins = os.environ.get('AGENT_DUMP_LIVE_ORIGINS')
+live_buffer = LiveBuffer(_event_fields, int(os.environ.get('AGENT_DUMP_LIVE_BUFFER', 1000)), port=live_port,
+                         origins=live_origins.split(',') if live_origins else DEFAULT_ORIGINS) if live_port > 0 else None
+sys.path.append(project_dir)
+# `walk` imports only the module defining root_agent and patches every agent
+# reachable from it; `scan` (default) parses PROJECT_DIR and patches the agents
+# found in the sources by their variable name.
+discovery = os.environ.get('AGENT_DUMP_DISCOVERY', 'scan')
+if discovery == 'walk':
+    root_agent = find_root_agent(project_dir, os.environ.get('AGENT_DUMP_ROOT_MODULE'))
+    for agent_obj in iter_agents(root_agent):
+        patch_agent(agent_obj, agent_obj.name)
+else:
+    # Imported here: walk mode does not need libcst.
+    from agent_with_dump.analysis import build_registry
+    registry = build_registry(project_dir)['agents'].items()
+
+    for item in registry:
+        name = item[0]
+        file = item[1]['file']
+        kind = item[1]['kind']
+        if (kind == 'agent') and (name =='root_agent'):
+            file=os.path.relpath(file,project_dir)
+            file_path = Path(file)
+            file_path_no_suffix_no_slash=file_path.with_suffix("").as_posix().replace('/','.')
+            module = importlib.import_module(file_path_no_suffix_no_slash)
+            root_agent = getattr(module, name, None)
+            root_agent = patch_agent(root_agent, name)
+        else: # If not root_agent, then it's another agent, so we need to import it and patch it
+            if (kind == 'agent'):
+                file=os.path.relpath(file,project_dir)
+                file_path = Path(file)
+                file_path_no_suffix_no_slash=file_path.with_suffix("").as_posix().replace('/','.')
+                module = importlib.import_module(file_path_no_suffix_no_slash)
+                current_agent = getattr(module, name, None)
+                current_agent = patch_agent(current_agent, name)
+
+# AGENT_DUMP_CASSETTE=<dir> records the model calls of every agent there and/or
+# replays them (AGENT_DUMP_CASSETTE_MODE=record|append|replay|auto, see cassette.py).
+cassette_dir = os.environ.get('AGENT_DUMP_CASSETTE')
+if cassette_dir:
+    use_cassettes(root_agent, Cassette(
+        os.path.abspath(cassette_dir),
+        mode=os.environ.get('AGENT_DUMP_CASSETTE_MODE', 'auto'),
+        latency=float(os.environ.get('AGENT_DUMP_CASSETTE_LATENCY', 0)),
+    ))
+
+os.chdir(project_dir)
+agent = root_agent
+
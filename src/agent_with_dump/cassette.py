@@ -0,0 +1,206 @@
+"""Record and replay of model calls, for deterministic offline runs.
+
+`use_cassettes` wraps the model of every agent in a `CassetteLlm`, which keys
+each request by a hash of its canonical form and looks it up in a cassette
+directory (one `<key>.json` file per distinct request):
+
+- `record`: always call the model and store the responses, replacing those
+  recorded by earlier runs;
+- `append`: like `record`, adding the responses to the recorded ones;
+- `replay`: only serve stored responses; an unknown request raises
+  `CassetteMiss`, so a run cannot silently reach the network;
+- `auto`: replay what is stored and record the rest.
+
+The canonical request is the model, the contents, the system instruction and
+the tool declarations, without the parts that change from run to run: the ids
+of function calls and responses, thought signatures, and the timestamps that
+instructions embed (e.g. the `{_time}` of a prompt). Identical requests
+recorded several times (in one `record` run, or over `append` runs) are
+replayed in turn.
+
+Replayed responses are yielded at once, or after the recorded delays scaled by
+`latency`, so benchmarks can either measure the agents' own overhead or keep
+the pacing of the model.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+
+from agent_logs.encoder import iter_json
+from agent_with_dump.tree import iter_agents
+
+MODES = ("record", "append", "replay", "auto")
+# Timestamps such as `2025-09-08 10:12:15.123456` or `2025-09-08T10:12:15Z`.
+DEFAULT_IGNORE = r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?"
+# Keys dropped anywhere in the canonical request.
+_VOLATILE_KEYS = {"thought_signature", "labels", "http_options"}
+
+
+class CassetteMiss(LookupError):
+    """A request without recorded responses, in `replay` mode."""
+
+
+class Cassette:
+    """
+    Args:
+        path: Directory of the recorded requests.
+        mode: `record`, `append`, `replay` or `auto`.
+        latency: Factor applied to the recorded response delays on replay;
+            0 replays at once.
+        ignore: Regex of text left out of the request key.
+    """
+
+    def __init__(self, path, mode="auto", latency=0.0, ignore=DEFAULT_IGNORE):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.ignore = re.compile(ignore) if ignore else None
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._played = {}
+        # Keys recorded by this run, whose earlier episodes are already replaced.
+        self._recorded_keys = set()
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    @property
+    def recording(self):
+        """Whether every request calls the model, without looking up the cassette."""
+        return self.mode in ("record", "append")
+
+    def canonical(self, llm_request):
+        """JSON-safe form of `llm_request` that is stable across runs."""
+        config = getattr(llm_request, "config", None)
+        request = json.loads("".join(iter_json({
+            "model": getattr(llm_request, "model", None),
+            "system_instruction": getattr(config, "system_instruction", None),
+            "tools": getattr(config, "tools", None),
+            "response_schema": getattr(config, "response_schema", None),
+            "contents": getattr(llm_request, "contents", None),
+        })))
+        return self._scrub(request)
+
+    def _scrub(self, value, parent=None):
+        if isinstance(value, dict):
+            return {
+                key: self._scrub(item, key) for key, item in value.items()
+                if item is not None and key not in _VOLATILE_KEYS
+                and not (key == "id" and parent in ("function_call", "function_response"))
+            }
+        if isinstance(value, list):
+            return [self._scrub(item, parent) for item in value]
+        if isinstance(value, str) and self.ignore is not None:
+            return self.ignore.sub("<ignored>", value)
+        return value
+
+    @staticmethod
+    def key(canonical):
+        data = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.json")
+
+    def _load(self, key):
+        try:
+            with open(self._file(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def lookup(self, key):
+        """The next recorded episode (list of responses) of `key`, or None."""
+        entry = self._load(key)
+        if not entry or not entry["episodes"]:
+            self.misses += 1
+            return None
+        with self._lock:
+            played = self._played.get(key, 0)
+            self._played[key] = played + 1
+        self.hits += 1
+        return entry["episodes"][played % len(entry["episodes"])]
+
+    def record(self, key, canonical, agent_name, episode):
+        with self._lock:
+            entry = self._load(key)
+            if entry is None or (self.mode == "record" and key not in self._recorded_keys):
+                entry = {"key": key, "agent": agent_name, "request": canonical, "episodes": []}
+            self._recorded_keys.add(key)
+            entry["episodes"].append(episode)
+            tmp = f"{self._file(key)}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(entry, f, indent=1)
+            os.replace(tmp, self._file(key))
+            self.recorded += 1
+
+
+class CassetteLlm(BaseLlm):
+    """Serves the requests of one agent from a `Cassette`, calling `inner` to record."""
+
+    model: str = "cassette"
+    cassette: Any = None
+    inner: Any = None
+    agent_name: str = ""
+
+    @classmethod
+    def supported_models(cls):
+        return []
+
+    def _inner_llm(self):
+        if isinstance(self.inner, str):
+            from google.adk.models.registry import LLMRegistry
+
+            self.inner = LLMRegistry.new_llm(self.inner)
+        return self.inner
+
+    async def generate_content_async(self, llm_request, stream=False):
+        cassette = self.cassette
+        canonical = cassette.canonical(llm_request)
+        key = cassette.key(canonical)
+        episode = cassette.lookup(key) if not cassette.recording else None
+        if episode is not None:
+            start = time.monotonic()
+            for item in episode:
+                if cassette.latency:
+                    await asyncio.sleep(max(start + item["delay"] * cassette.latency - time.monotonic(), 0))
+                yield LlmResponse.model_validate_json(json.dumps(item["response"]))
+            return
+        if cassette.mode == "replay":
+            raise CassetteMiss(f"No recorded response for a request of {self.agent_name} "
+                               f"(key {key}) in {cassette.path}")
+
+        episode = []
+        start = time.monotonic()
+        async for response in self._inner_llm().generate_content_async(llm_request, stream):
+            episode.append({"delay": time.monotonic() - start,
+                            "response": json.loads(response.model_dump_json(exclude_none=True))})
+            yield response
+        cassette.record(key, canonical, self.agent_name, episode)
+        logging.info(f"Recorded a model response of {self.agent_name} as {key}")
+
+
+def use_cassettes(root_agent, cassette):
+    """Wrap the model of every agent reachable from `root_agent` in a `CassetteLlm`.
+
+    Agents without their own model inherit the wrapped model of their parent.
+    """
+    for agent in iter_agents(root_agent):
+        if "model" not in getattr(type(agent), "model_fields", {}) or not agent.model:
+            continue
+        if isinstance(agent.model, CassetteLlm):
+            continue
+        inner = agent.model
+        agent.model = CassetteLlm(model=getattr(inner, "model", inner), cassette=cassette,
+                                  inner=inner, agent_name=agent.name)
@@ -0,0 +1,48 @@
+"""Helpers to attach extra callbacks to ADK agents without replacing their own."""
+
+
+def chain_callback(agent_obj, attr, hook, last=False):
+    """Run `hook` before the callbacks already set on `agent_obj.<attr>`.
+
+    ADK accepts a single callback or a list for each callback field and stops
+    at the first callback that returns a value, so hooks are placed first and
+    must return None. Agents without the field (e.g. workflow agents have no
+    model or tool callbacks) are left untouched.
+
+    With `last=True` the hook runs after the existing callbacks instead, and is
+    skipped when one of them returns a value.
+
+    Returns:
+        bool: True if the hook was attached.
+    """
+    if attr not in getattr(type(agent_obj), "model_fields", {}) and not hasattr(agent_obj, attr):
+        return False
+    existing = getattr(agent_obj, attr, None)
+    if existing is None:
+        existing = []
+    elif not isinstance(existing, list):
+        existing = [existing]
+    callbacks = [*existing, hook] if last else [hook, *existing]
+    setattr(agent_obj, attr, callbacks)
+    return True
+
+
+def wrap_run_async(agent_obj, on_error=None, on_exit=None):
+    """Call `on_error(parent_context, exc)` when a run of the agent raises, and
+    `on_exit(parent_context)` once a run is over, however it ended."""
+    original = agent_obj.run_async
+
+    async def run_async(parent_context):
+        try:
+            async for event in original(parent_context):
+                yield event
+        except Exception as exc:
+            if on_error is not None:
+                on_error(parent_context, exc)
+            raise
+        finally:
+            if on_exit is not None:
+                on_exit(parent_context)
+
+    # Agents are Pydantic models; run_async is a method, not a field.
+    object.__setattr__(agent_obj, "run_async", run_async)
@@ -0,0 +1,361 @@
+"""Live view of the running sessions, kept in memory and served on loopback.
+
+The agent callbacks copy the events appended to each session since the last
+callback, and the state deltas they carry, into a bounded ring buffer per
+session. The oldest items of a session are dropped once it holds `capacity`
+of them, and the least recently updated session once there are more than
+`max_sessions`. Nothing is read from or written to disk.
+
+A small HTTP server on 127.0.0.1 serves the buffer, started lazily on the
+server's event loop like the loop watchdog:
+
+- `GET /sessions`: the buffered sessions, with their first and last sequence
+  numbers.
+- `GET /events?session=<id>&since=<seq>&wait=<seconds>`: the items after
+  `since`, waiting up to `wait` seconds for new ones (long polling).
+- `GET /stream?session=<id>&since=<seq>` with a WebSocket upgrade: every
+  item after `since` and then each new one, as one JSON text message each.
+
+Only requests addressed to the loopback host are served, and WebSocket
+upgrades are only accepted from the origins in `origins` (by default the
+extension's webviews and the `adk web` page it opens), so other web pages
+open in a browser cannot subscribe to the sessions.
+
+`session` is optional; without it all sessions are served. Every item has a
+global, increasing `seq`. Subscribers only hold a cursor into the buffer and
+each one is sent to at the pace its socket drains, so a slow subscriber never
+delays the agents nor grows memory: if the items it has not read yet are
+dropped from the buffer, it receives `{"type": "gap", "lost_until": <seq>}`
+and goes on with the oldest buffered item.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import struct
+import time
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs, urlsplit
+
+from agent_logs.encoder import iter_json
+from agent_with_dump.hooks import chain_callback
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# Per-subscriber socket buffer; `drain()` waits above it.
+_WRITE_BUFFER = 256 * 1024
+_MAX_HEADER = 16 * 1024
+# Clients only send control frames, which are at most 125 bytes.
+_MAX_CLIENT_FRAME = 4096
+# Origins allowed to open a WebSocket; one ending with `://` allows the whole scheme.
+DEFAULT_ORIGINS = ("vscode-webview://", "http://127.0.0.1:5000", "http://localhost:5000")
+_LOOPBACK_HOSTS = ("127.0.0.1", "localhost")
+
+
+class _Item:
+    __slots__ = ("seq", "session_id", "_json")
+
+    def __init__(self, seq, session_id, payload):
+        self.seq = seq
+        self.session_id = session_id
+        # Encoded when published, once for every subscriber: the state values
+        # of a delta are the session's own objects and change afterwards.
+        self._json = "".join(iter_json({"seq": seq, "session_id": session_id, **payload}))
+
+    def json(self):
+        return self._json
+
+
+class _SessionBuffer:
+    __slots__ = ("items", "seen", "evicted_seq", "agent", "updated")
+
+    def __init__(self, capacity):
+        self.items = deque(maxlen=capacity)
+        # Number of session events already copied.
+        self.seen = 0
+        # Seq of the last item dropped from `items`.
+        self.evicted_seq = 0
+        self.agent = None
+        self.updated = None
+
+    def after(self, seq):
+        items = []
+        for item in reversed(self.items):
+            if item.seq <= seq:
+                break
+            items.append(item)
+        items.reverse()
+        return items
+
+
+class LiveBuffer:
+    """
+    Args:
+        event_fields: Selects the fields of an ADK event to publish.
+        capacity: Items kept per session.
+        max_sessions: Sessions kept.
+        port: Loopback port of the HTTP/WebSocket server; None serves nothing.
+        origins: Origins allowed to open a WebSocket, see `DEFAULT_ORIGINS`.
+    """
+
+    def __init__(self, event_fields, capacity=1000, max_sessions=64, port=None, origins=DEFAULT_ORIGINS):
+        self.event_fields = event_fields
+        self.capacity = capacity
+        self.max_sessions = max_sessions
+        self.port = port
+        self.origins = tuple(origins)
+        self.seq = 0
+        self.sessions = OrderedDict()
+        # Highest seq of the sessions dropped from the buffer.
+        self.dropped_seq = 0
+        self._wakeup = None
+        self._loop = None
+        self._server = None
+
+    def _session(self, session_id):
+        buffer = self.sessions.get(session_id)
+        if buffer is None:
+            buffer = self.sessions[session_id] = _SessionBuffer(self.capacity)
+            while len(self.sessions) > self.max_sessions:
+                _, dropped = self.sessions.popitem(last=False)
+                if dropped.items:
+                    self.dropped_seq = max(self.dropped_seq, dropped.items[-1].seq)
+        else:
+            self.sessions.move_to_end(session_id)
+        return buffer
+
+    def _append(self, buffer, session_id, payload):
+        self.seq += 1
+        if len(buffer.items) == buffer.items.maxlen:
+            buffer.evicted_seq = buffer.items[0].seq
+        buffer.items.append(_Item(self.seq, session_id, payload))
+
+    def sync(self, session, agent_name, invocation_id=None):
+        """Publish the events appended to `session` since the last call."""
+        events = session.events
+        buffer = self._session(session.id)
+        if len(events) < buffer.seen:
+            buffer.seen = 0  # a new session object with the same id
+        if len(events) == buffer.seen:
+            return
+        for event in events[buffer.seen:]:
+            self._append(buffer, session.id, {"type": "event", "agent": agent_name,
+                                              "event": self.event_fields(event)})
+            state_delta = getattr(getattr(event, "actions", None), "state_delta", None)
+            if state_delta:
+                self._append(buffer, session.id, {"type": "state_delta", "agent": agent_name,
+                                                  "invocation_id": getattr(event, "invocation_id", invocation_id),
+                                                  "event_id": event.id, "author": event.author,
+                                                  "delta": dict(state_delta)})
+        buffer.seen = len(events)
+        buffer.agent = agent_name
+        buffer.updated = time.time()
+        self._notify()
+
+    def _notify(self):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+        self._wakeup = None
+
+    async def wait(self, seq, timeout=None):
+        """Wait until an item after `seq` is published, or `timeout` seconds."""
+        if self.seq > seq:
+            return
+        if self._wakeup is None:
+            self._wakeup = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._wakeup), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def allowed_origin(self, origin):
+        """Whether a WebSocket may be opened from `origin` (None for non-browser clients)."""
+        return origin is None or any(origin == allowed or (allowed.endswith("://") and origin.startswith(allowed))
+                                     for allowed in self.origins)
+
+    def since(self, seq, session_id=None):
+        """Return (items after `seq`, highest seq after `seq` dropped from the buffer or 0)."""
+        if session_id is not None:
+            buffer = self.sessions.get(session_id)
+            if buffer is None:
+                return [], 0
+            return buffer.after(seq), buffer.evicted_seq if buffer.evicted_seq > seq else 0
+        items = []
+        lost = self.dropped_seq
+        for buffer in self.sessions.values():
+            items += buffer.after(seq)
+            lost = max(lost, buffer.evicted_seq)
+        items.sort(key=lambda item: item.seq)
+        return items, lost if lost > seq else 0
+
+    def describe(self):
+        return [
+            {"session_id": session_id, "agent": buffer.agent, "updated": buffer.updated,
+             "items": len(buffer.items),
+             "first_seq": buffer.items[0].seq if buffer.items else None,
+             "last_seq": buffer.items[-1].seq if buffer.items else None}
+            for session_id, buffer in self.sessions.items()
+        ]
+
+    def ensure_started(self):
+        """Start the server on the running loop; cheap no-op once started."""
+        if self.port is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._wakeup = None
+        loop.create_task(self._serve())
+
+    async def _serve(self):
+        try:
+            self._server = await asyncio.start_server(self._handle, "127.0.0.1", self.port)
+        except OSError as exc:
+            logging.warning(f"Live session endpoint not started on 127.0.0.1:{self.port}: {exc}")
+            return
+        logging.info(f"Live session endpoint on http://127.0.0.1:{self.port}")
+
+    async def _handle(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=_WRITE_BUFFER)
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            if len(head) > _MAX_HEADER:
+                return
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, target, _ = request_line.split(" ", 2)
+            headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            url = urlsplit(target)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            session_id = query.get("session")
+            since = int(query.get("since", 0))
+            host = urlsplit("//" + headers["host"]).hostname if "host" in headers else None
+            if method != "GET":
+                await _respond(writer, 405, {"error": "only GET is supported"})
+            elif host is not None and host not in _LOOPBACK_HOSTS:
+                # A DNS name rebound to 127.0.0.1 by another web page.
+                await _respond(writer, 403, {"error": f"host {host} is not served"})
+            elif url.path == "/sessions":
+                await _respond(writer, 200, self.describe())
+            elif url.path == "/events":
+                deadline = time.monotonic() + float(query.get("wait", 0))
+                items, lost = self.since(since, session_id)
+                # Items of other sessions wake the wait up too.
+                while not items and not lost and time.monotonic() < deadline:
+                    await self.wait(max(since, self.seq), deadline - time.monotonic())
+                    items, lost = self.since(since, session_id)
+                body = '{"seq": %d, "gap": %s, "items": [%s]}' % (
+                    self.seq, "true" if lost else "false", ", ".join(item.json() for item in items))
+                await _respond(writer, 200, body)
+            elif url.path == "/stream" and headers.get("upgrade", "").lower() == "websocket":
+                if not self.allowed_origin(headers.get("origin")):
+                    await _respond(writer, 403, {"error": f"origin {headers['origin']} is not allowed"})
+                    return
+                await self._stream(reader, writer, headers, session_id, since)
+            else:
+                await _respond(writer, 404, {"error": f"unknown path {url.path}"})
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream(self, reader, writer, headers, session_id, since):
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        closed = asyncio.get_running_loop().create_future()
+        client = asyncio.get_running_loop().create_task(_read_client(reader, writer, closed))
+        cursor = reported = since
+        try:
+            while not closed.done():
+                head = self.seq
+                items, lost = self.since(cursor, session_id)
+                if lost > reported:
+                    _send_text(writer, json.dumps({"type": "gap", "after": cursor, "lost_until": lost}))
+                    reported = lost
+                for item in items:
+                    _send_text(writer, item.json())
+                    # Backpressure: wait for the socket rather than buffering.
+                    await writer.drain()
+                cursor = max(cursor, head)
+                waiter = asyncio.get_running_loop().create_task(self.wait(cursor))
+                await asyncio.wait([closed, waiter], return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+        finally:
+            client.cancel()
+
+    def instrument(self, agent_obj, agent_name):
+        """Publish the new events of the session from every agent callback."""
+
+        def publish(context):
+            self.ensure_started()
+            self.sync(context._invocation_context.session, agent_name, getattr(context, "invocation_id", None))
+
+        chain_callback(agent_obj, "before_agent_callback", lambda callback_context: publish(callback_context))
+        chain_callback(agent_obj, "before_model_callback",
+                       lambda callback_context, llm_request: publish(callback_context))
+        chain_callback(agent_obj, "before_tool_callback",
+                       lambda tool, args, tool_context: publish(tool_context))
+        chain_callback(agent_obj, "after_agent_callback",
+                       lambda callback_context: publish(callback_context), last=True)
+
+
+async def _respond(writer, status, body):
+    if not isinstance(body, str):
+        body = json.dumps(body)
+    data = body.encode("utf-8")
+    reason = {200: "OK", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed"}[status]
+    writer.write((f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n").encode() + data)
+    await writer.drain()
+
+
+def _frame(opcode, payload):
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def _send_text(writer, text):
+    writer.write(_frame(0x1, text.encode("utf-8")))
+
+
+async def _read_client(reader, writer, closed):
+    """Answer pings and notice the close of a WebSocket client; other messages are ignored."""
+    try:
+        while True:
+            first, second = await reader.readexactly(2)
+            length = second & 0x7F
+            if length == 126:
+                length, = struct.unpack("!H", await reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack("!Q", await reader.readexactly(8))
+            if length > _MAX_CLIENT_FRAME:
+                writer.write(_frame(0x8, struct.pack("!H", 1009)))  # message too big
+                break
+            mask = await reader.readexactly(4) if second & 0x80 else b"\0\0\0\0"
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(await reader.readexactly(length)))
+            opcode = first & 0x0F
+            if opcode == 0x8:
+                writer.write(_frame(0x8, payload[:2]))
+                break
+            if opcode == 0x9:
+                writer.write(_frame(0xA, payload))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        if not closed.done():
+            closed.set_result(None)
@@ -0,0 +1,227 @@
+"""In-process latency histograms and counters, flushed to the log directory.
+
+`Metrics.observe_span` is registered as a tracer listener and
+`Metrics.observe_write` as a `DumpWriter` listener. Both only bump a few
+numbers under a lock; formatting and file I/O happen in a background thread
+that rewrites `metrics.prom` (Prometheus text format, for the node exporter
+textfile collector) and `metrics.json` every `interval` seconds.
+"""
+import json
+import os
+import threading
+
+# Log-linear buckets as in HdrHistogram: every power of two is split into
+# 2**SUB_BUCKET_BITS linear sub-buckets, so a bucket is at most ~6% wide.
+SUB_BUCKET_BITS = 4
+_SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _bucket_index(value):
+    if value < _SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * _SUB_BUCKETS + (value >> shift) - _SUB_BUCKETS
+
+
+def _bucket_bounds(index):
+    if index < _SUB_BUCKETS:
+        return index, index + 1
+    shift = index // _SUB_BUCKETS - 1
+    mantissa = index % _SUB_BUCKETS + _SUB_BUCKETS
+    return mantissa << shift, (mantissa + 1) << shift
+
+
+class LatencyHistogram:
+    """Histogram of non-negative integer durations (nanoseconds)."""
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        index = _bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Approximate `q`-quantile: the middle of the bucket holding it."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                low, high = _bucket_bounds(index)
+                return min(max((low + high - 1) // 2, self.min), self.max)
+        return self.max
+
+    def copy(self):
+        other = LatencyHistogram()
+        other.counts = dict(self.counts)
+        other.count, other.total, other.min, other.max = self.count, self.total, self.min, self.max
+        return other
+
+
+# Span kind -> (histogram name, label names).
+_SPAN_HISTOGRAMS = {
+    "agent": ("adk_agent_latency_seconds", ("agent",)),
+    "model": ("adk_model_latency_seconds", ("agent", "model")),
+    "tool": ("adk_tool_latency_seconds", ("agent", "tool")),
+    "dump": ("adk_dump_latency_seconds", ("agent",)),
+}
+
+_HELP = {
+    "adk_agent_latency_seconds": "Duration of agent turns.",
+    "adk_model_latency_seconds": "Duration of model calls.",
+    "adk_tool_latency_seconds": "Duration of tool calls.",
+    "adk_dump_latency_seconds": "Time spent dumping sessions.",
+    "adk_model_calls_total": "Model calls.",
+    "adk_model_errors_total": "Model responses with an error code.",
+    "adk_model_tokens_total": "Prompt and completion tokens reported in usage_metadata.",
+    "adk_tool_calls_total": "Tool calls.",
+    "adk_tool_errors_total": "Tool calls whose response holds an error.",
+    "adk_dump_records_total": "Dump records written.",
+    "adk_dump_bytes_total": "Bytes of dump records written.",
+}
+
+
+class Metrics:
+    """Counters and histograms keyed by (metric name, label values)."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name, labels, value=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe_span(self, span):
+        """Tracer listener: one histogram sample per span plus the model/tool counters."""
+        if span.kind not in _SPAN_HISTOGRAMS:
+            return
+        name, label_names = _SPAN_HISTOGRAMS[span.kind]
+        agent = span.attrs.get("agent", span.name)
+        labels = (("agent", agent),) if len(label_names) == 1 else (("agent", agent), (label_names[1], span.name))
+        with self._lock:
+            key = (name, labels)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+            histogram.record(span.duration_ns)
+            if span.kind == "model":
+                self._count("adk_model_calls_total", labels)
+                if span.attrs.get("error_code"):
+                    self._count("adk_model_errors_total", labels)
+                for kind in ("prompt", "completion"):
+                    tokens = span.attrs.get(f"{kind}_tokens")
+                    if tokens:
+                        self._count("adk_model_tokens_total", (*labels, ("type", kind)), tokens)
+            elif span.kind == "tool":
+                self._count("adk_tool_calls_total", labels)
+                if span.attrs.get("error"):
+                    self._count("adk_tool_errors_total", labels)
+
+    def observe_write(self, stream, path, offset, size):
+        """DumpWriter listener: records and bytes written per stream."""
+        labels = (("stream", stream),)
+        with self._lock:
+            self._count("adk_dump_records_total", labels)
+            self._count("adk_dump_bytes_total", labels, size)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters), {k: h.copy() for k, h in self.histograms.items()}
+
+    def to_prometheus(self):
+        counters, histograms = self.snapshot()
+        lines = []
+        for name in sorted({n for n, _ in counters}):
+            lines += [f"# HELP {name} {_HELP.get(name, name)}", f"# TYPE {name} counter"]
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        for name in sorted({n for n, _ in histograms}):
+            lines += [f"# HELP {name} {_HELP.get(name, name)}", f"# TYPE {name} summary"]
+            for (n, labels), histogram in sorted(histograms.items()):
+                if n != name:
+                    continue
+                for q in QUANTILES:
+                    lines.append(f"{name}{_labels((*labels, ('quantile', str(q))))} {histogram.quantile(q) / 1e9:.6f}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.total / 1e9:.6f}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        counters, histograms = self.snapshot()
+        return {
+            "counters": [{"name": n, "labels": dict(labels), "value": v} for (n, labels), v in sorted(counters.items())],
+            "histograms": [
+                {
+                    "name": n,
+                    "labels": dict(labels),
+                    "count": h.count,
+                    "sum_seconds": h.total / 1e9,
+                    "min_seconds": h.min / 1e9,
+                    "max_seconds": h.max / 1e9,
+                    "quantiles": {str(q): h.quantile(q) / 1e9 for q in QUANTILES},
+                }
+                for (n, labels), h in sorted(histograms.items())
+            ],
+        }
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+class MetricsFlusher:
+    """Rewrites `<stem>.prom` and `<stem>.json` from a daemon thread."""
+
+    def __init__(self, metrics, log_dir, stem="metrics", interval=15.0):
+        self.metrics = metrics
+        self.prom_path = os.path.join(log_dir, f"{stem}.prom")
+        self.json_path = os.path.join(log_dir, f"{stem}.json")
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="dump-metrics", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        _write_atomic(self.prom_path, self.metrics.to_prometheus())
+        _write_atomic(self.json_path, json.dumps(self.metrics.to_json(), indent=2))
+
+    def close(self):
+        self._stop.set()
+        self.flush()
@@ -0,0 +1,163 @@
+"""Capture policy of the session dumper.
+
+The policy is read from `AGENT_DUMP_POLICY`, either inline JSON or the path of a
+JSON file:
+
+    {
+      "default": {"sample_rate": 0.1},
+      "agents": {
+        "root_agent": {"mode": "on_error"},
+        "poi_agent": {"enabled": false},
+        "inspiration_agent": {"exclude": {"events": ["content.parts.text"]}}
+      },
+      "ring_buffer_size": 64,
+      "ring_buffer_sessions": 64
+    }
+
+Per-agent settings override `default`:
+
+- `enabled`: whether the agent is dumped at all.
+- `sample_rate`: fraction of sessions that are dumped. The decision is derived
+  from the session id, so a session is either fully captured or not at all,
+  across agents and server workers.
+- `mode`: `always` writes a dump after every turn; `on_error` keeps the last
+  `ring_buffer_size` dumps of each session in memory (for the
+  `ring_buffer_sessions` most recently updated sessions) and only writes them
+  when an invocation of the session fails.
+- `exclude`: dotted field paths to leave out, per stream. `events` paths are
+  relative to an event, `state` paths to the session state.
+"""
+import json
+import os
+import zlib
+from collections import OrderedDict, deque
+
+from agent_logs.encoder import iter_json
+
+MODES = ("always", "on_error")
+
+DEFAULT_SETTINGS = {
+    "enabled": True,
+    "sample_rate": 1.0,
+    "mode": "always",
+    "exclude": {},
+}
+
+
+class CapturePolicy:
+    """Resolved capture settings for each agent."""
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.default = {**DEFAULT_SETTINGS, **config.get("default", {})}
+        self.agents = {
+            name: {**self.default, **settings}
+            for name, settings in config.get("agents", {}).items()
+        }
+        self.ring_buffer_size = int(config.get("ring_buffer_size", 64))
+        self.ring_buffer_sessions = int(config.get("ring_buffer_sessions", 64))
+        for name, settings in [("default", self.default), *self.agents.items()]:
+            if settings["mode"] not in MODES:
+                raise ValueError(f"capture policy for {name}: unknown mode {settings['mode']!r}")
+        self._exclude = {}
+
+    def settings(self, agent_name):
+        return self.agents.get(agent_name, self.default)
+
+    def enabled(self, agent_name):
+        return bool(self.settings(agent_name)["enabled"])
+
+    def on_error(self, agent_name):
+        return self.settings(agent_name)["mode"] == "on_error"
+
+    def sampled(self, agent_name, session_id):
+        """Whether the session is captured for this agent."""
+        settings = self.settings(agent_name)
+        if not settings["enabled"]:
+            return False
+        rate = settings["sample_rate"]
+        if rate >= 1:
+            return True
+        return zlib.crc32(str(session_id).encode("utf-8")) / 0xFFFFFFFF < rate
+
+    def exclude(self, agent_name, stream):
+        """Field paths of `stream` to leave out, relative to the dump record."""
+        key = (agent_name, stream)
+        if key not in self._exclude:
+            paths = self.settings(agent_name)["exclude"].get(stream, [])
+            self._exclude[key] = frozenset(f"{stream}.{p}" for p in paths) or None
+        return self._exclude[key]
+
+
+def load_policy(value=None):
+    """Build the policy from `value`, or from AGENT_DUMP_POLICY when omitted."""
+    if value is None:
+        value = os.environ.get("AGENT_DUMP_POLICY", "")
+    value = value.strip()
+    if not value:
+        return CapturePolicy()
+    if value.startswith("{"):
+        return CapturePolicy(json.loads(value))
+    with open(value) as f:
+        return CapturePolicy(json.load(f))
+
+
+class _SessionDumps:
+    __slots__ = ("entries", "seen")
+
+    def __init__(self, size):
+        self.entries = deque(maxlen=size)
+        # Number of session events already buffered.
+        self.seen = 0
+
+
+class ErrorBuffer:
+    """Ring buffers of encoded dumps per session, written out only when a session fails.
+
+    Records are encoded when they are captured, because the session keeps
+    changing afterwards; they are only parsed back and written on a failure.
+    Each session keeps its last `size` records, and the least recently updated
+    session is dropped once there are more than `max_sessions`, so concurrent
+    sessions do not evict each other's history. Events records only hold the
+    events appended since the previous capture of the session (see
+    `first_event`), since a failure is followed by a full dump of the session;
+    with a `BlobStore`, large payloads are kept on disk instead of in memory.
+    """
+
+    def __init__(self, size, max_sessions=64, blobs=None):
+        self.size = size
+        self.max_sessions = max_sessions
+        self.blobs = blobs
+        self.sessions = OrderedDict()
+
+    def _session(self, session_id):
+        dumps = self.sessions.get(session_id)
+        if dumps is None:
+            dumps = self.sessions[session_id] = _SessionDumps(self.size)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(session_id)
+        return dumps
+
+    def first_event(self, session_id, event_count):
+        """Index of the first session event not captured yet; 0 for a new session object."""
+        dumps = self.sessions.get(session_id)
+        if dumps is None or event_count < dumps.seen:
+            return 0
+        return dumps.seen
+
+    def add(self, session_id, stream, record, exclude=None, event_count=None):
+        """Buffer `record`; `event_count` is the number of session events it covers."""
+        dumps = self._session(session_id)
+        dumps.entries.append((stream, "".join(iter_json(record, self.blobs, exclude))))
+        if event_count is not None:
+            dumps.seen = event_count
+
+    def flush(self, session_id, writer):
+        """Write the buffered dumps of `session_id` with `writer`, oldest first."""
+        dumps = self.sessions.pop(session_id, None)
+        if dumps is None:
+            return
+        for stream, encoded in dumps.entries:
+            writer.write(stream, json.loads(encoded))
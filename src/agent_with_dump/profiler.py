@@ -0,0 +1,199 @@
+"""Opt-in CPU and memory profiling of sampled invocations.
+
+From the before_agent callback of the first agent of a sampled invocation to
+its after_agent callback (after the dump), or to the end of its run if it
+fails before that, the profiler:
+
+- samples the stack of the event loop thread from a background thread, and
+  writes it as folded stacks (`<invocation>.folded`, for flamegraph.pl or
+  speedscope);
+- diffs tracemalloc snapshots taken at both ends (`<invocation>.memory.txt`);
+- counts garbage collections and their pauses per generation.
+
+A summary of all three goes to `<invocation>.json`. Only one invocation is
+profiled at a time, since concurrent invocations share the loop thread.
+"""
+import gc
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import zlib
+
+from agent_with_dump.hooks import chain_callback, wrap_run_async
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def fold_stack(frame):
+    """`outer;...;inner` labels of `frame` and its callers."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class _Profile:
+    def __init__(self, invocation_id, agent_name, interval, trace_memory):
+        self.invocation_id = invocation_id
+        self.agent_name = agent_name
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.started = time.time()
+        self.start_perf = time.perf_counter()
+        self.stacks = {}
+        self.samples = 0
+        self.gc = {generation: {"collections": 0, "pause_seconds": 0.0, "collected": 0} for generation in range(3)}
+        self._gc_start = None
+        self._stop = threading.Event()
+        # Set when the run ended without reaching after_agent.
+        self.incomplete = False
+        self._owns_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start(10)
+        self.snapshot = tracemalloc.take_snapshot() if trace_memory else None
+        gc.callbacks.append(self._on_gc)
+        self._sampler = threading.Thread(target=self._sample, name="invocation-profiler", daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = fold_stack(frame)
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            stats = self.gc[info["generation"]]
+            stats["collections"] += 1
+            stats["pause_seconds"] += time.perf_counter() - self._gc_start
+            stats["collected"] += info.get("collected", 0)
+            self._gc_start = None
+
+    def join(self):
+        self._sampler.join()
+
+    def stop(self):
+        """Stop sampling; returns the end snapshot and peak traced memory."""
+        self.duration = time.perf_counter() - self.start_perf
+        self._stop.set()
+        gc.callbacks.remove(self._on_gc)
+        snapshot, peak = None, None
+        if self.snapshot is not None:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+        return snapshot, peak
+
+
+class InvocationProfiler:
+    """
+    Args:
+        out_dir: Directory of the profile files (`<log_dir>/profiles`).
+        sample_rate: Fraction of invocations to profile, chosen by a hash of
+            the invocation id.
+        interval: Stack sampling period in seconds.
+        trace_memory: Whether to take tracemalloc snapshots. Tracing slows
+            every allocation down while the invocation runs.
+        top: Number of allocation sites kept in the memory diff.
+        max_duration: A profile still open after this many seconds (its
+            end was never seen) is closed by the next one.
+    """
+
+    def __init__(self, out_dir, sample_rate, interval=0.005, trace_memory=True, top=25, max_duration=600):
+        self.out_dir = out_dir
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.top = top
+        self.max_duration = max_duration
+        self.active = None
+        os.makedirs(out_dir, exist_ok=True)
+
+    def sampled(self, invocation_id):
+        return zlib.crc32(str(invocation_id).encode()) / 0xFFFFFFFF < self.sample_rate
+
+    def start(self, invocation_id, agent_name):
+        if self.active is not None:
+            if time.perf_counter() - self.active.start_perf < self.max_duration:
+                return
+            self.finish(self.active)
+        if invocation_id is None or not self.sampled(invocation_id):
+            return
+        self.active = _Profile(invocation_id, agent_name, self.interval, self.trace_memory)
+
+    def end(self, invocation_id, agent_name, incomplete=False):
+        profile = self.active
+        if profile is not None and (profile.invocation_id, profile.agent_name) == (invocation_id, agent_name):
+            profile.incomplete = incomplete
+            self.finish(profile)
+
+    def finish(self, profile):
+        self.active = None
+        snapshot, peak = profile.stop()
+        # Comparing snapshots and writing the files is slow; keep it off the loop.
+        threading.Thread(target=self._write, args=(profile, snapshot, peak), daemon=True).start()
+
+    def _write(self, profile, snapshot, peak):
+        profile.join()
+        stem = os.path.join(self.out_dir, str(profile.invocation_id))
+        with open(f"{stem}.folded", "w") as f:
+            for stack, count in sorted(profile.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+        top_allocations = []
+        if snapshot is not None:
+            stats = snapshot.compare_to(profile.snapshot, "lineno")[:self.top]
+            with open(f"{stem}.memory.txt", "w") as f:
+                for stat in stats:
+                    f.write(f"{stat}\n")
+            top_allocations = [
+                {"where": str(stat.traceback), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in stats
+            ]
+
+        summary = {
+            "invocation_id": profile.invocation_id,
+            "agent": profile.agent_name,
+            "started": profile.started,
+            "duration_seconds": profile.duration,
+            "incomplete": profile.incomplete,
+            "samples": profile.samples,
+            "sample_interval_seconds": profile.interval,
+            "gc": profile.gc,
+            "peak_traced_bytes": peak,
+            "top_allocations": top_allocations,
+        }
+        # Written last and renamed into place: its presence means the profile is complete.
+        with open(f"{stem}.json.tmp", "w") as f:
+            json.dump(summary, f, indent=2)
+        os.replace(f"{stem}.json.tmp", f"{stem}.json")
+
+    def instrument(self, agent_obj, agent_name):
+        """Start profiles before the agent runs and end them after its dump, or
+        when its run is over without reaching after_agent (it raised)."""
+
+        def before_agent(callback_context):
+            self.start(getattr(callback_context, "invocation_id", None), agent_name)
+
+        def after_agent(callback_context):
+            self.end(getattr(callback_context, "invocation_id", None), agent_name)
+
+        def run_exit(parent_context):
+            self.end(getattr(parent_context, "invocation_id", None), agent_name, incomplete=True)
+
+        chain_callback(agent_obj, "before_agent_callback", before_agent)
+        chain_callback(agent_obj, "after_agent_callback", after_agent, last=True)
+        wrap_run_async(agent_obj, on_exit=run_exit)
@@ -0,0 +1,339 @@
+"""Load generator replaying the user turns of dumped sessions through `root_agent`.
+
+The user messages of every session dumped by the root agent under a logs
+directory are replayed, turn by turn, through an ADK `Runner` with an
+in-memory session service, many sessions at a time:
+
+    PROJECT_DIR=/path/to/project python -m agent_with_dump.replay logs \\
+        --sessions 200 --concurrency 16 --rate 4 --stub --stub-latency 0.3
+
+The agents are the ones patched by `agent_with_dump`, so the dumps, tracing
+and other hooks configured through the environment are part of what is
+measured, and the replayed sessions are dumped like any other (paths are
+relative to PROJECT_DIR, where the bootstrap changes directory).
+
+`--rate` starts sessions as a Poisson process of that many sessions per
+second, held back while `--concurrency` sessions are running. `--stub`
+replaces the model of every agent by `StubLlm`, which answers each request
+with a short text after `--stub-latency` seconds, without network access;
+agents then answer every turn directly, so the run measures the runner,
+callback and dump overhead rather than the model. With `--stub-recorded` the
+stub answers with the responses recorded in the dumps instead: the texts,
+function calls and transfers of each agent, step by step within each user
+turn, so the tools and sub-agents run as they did (see `extract_script`).
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from agent_logs.merge import dump_files, iter_events, log_dirs
+from agent_with_dump.metrics import QUANTILES, LatencyHistogram
+from agent_with_dump.tree import iter_agents
+
+
+def _user_text(event):
+    if event.get("author") != "user":
+        return None
+    parts = (event.get("content") or {}).get("parts") or []
+    texts = [part["text"] for part in parts if part.get("text")]
+    return "\n".join(texts) if texts else None
+
+
+def extract_sessions(root, agent="root_agent"):
+    """The user messages of each session dumped by `agent` under `root`, in order.
+
+    Returns:
+        list[list[str]]: One list of messages per session.
+    """
+    sessions = {}
+    for log_dir in log_dirs(root):
+        for stream, path in dump_files(log_dir):
+            if stream != "events":
+                continue
+            # Older records have no session id; every record of a session
+            # starts with the same first event.
+            first_events = {}
+            seen = set()
+            for record_offset, record, _, _, event in iter_events(path):
+                if record.get("agent") != agent:
+                    continue
+                first = first_events.setdefault(record_offset, event.get("id"))
+                key = (log_dir, record.get("session_id") or first)
+                text = _user_text(event)
+                if text is None or (key, event.get("id")) in seen:
+                    continue
+                seen.add((key, event.get("id")))
+                sessions.setdefault(key, []).append(text)
+    return list(sessions.values())
+
+
+def _response_parts(event):
+    """Text and function call parts of a dumped model response, without call ids."""
+    content = event.get("content") or {}
+    if content.get("role") not in (None, "model"):
+        return []
+    parts = []
+    for part in content.get("parts") or []:
+        call = part.get("function_call")
+        if call:
+            parts.append({"function_call": {"name": call.get("name"), "args": call.get("args") or {}}})
+        elif part.get("text") and not part.get("thought"):
+            parts.append({"text": part["text"]})
+    return parts
+
+
+def extract_script(root, agent="root_agent"):
+    """The model responses of each agent in the sessions dumped by `agent`, per user message.
+
+    Returns:
+        dict: {agent name: {user message: [parts of each response, in order]}},
+        with the parts as dicts (`text` or `function_call`); a transfer is the
+        `transfer_to_agent` function call. When several turns send the same
+        message, the responses of the first one are kept.
+    """
+    sessions = {}
+    for log_dir in log_dirs(root):
+        for stream, path in dump_files(log_dir):
+            if stream != "events":
+                continue
+            first_events = {}
+            seen = set()
+            for record_offset, record, _, _, event in iter_events(path):
+                if record.get("agent") != agent:
+                    continue
+                first = first_events.setdefault(record_offset, event.get("id"))
+                key = (log_dir, record.get("session_id") or first)
+                if (key, event.get("id")) in seen:
+                    continue
+                seen.add((key, event.get("id")))
+                # [(user message, {agent name: [parts of each response]}), ...]
+                turns = sessions.setdefault(key, [])
+                text = _user_text(event)
+                parts = _response_parts(event)
+                if text is not None:
+                    turns.append((text, {}))
+                elif turns and parts:
+                    turns[-1][1].setdefault(event.get("author"), []).append(parts)
+    script = {}
+    for turns in sessions.values():
+        for text, responses in turns:
+            for author, author_responses in responses.items():
+                script.setdefault(author, {}).setdefault(text, author_responses)
+    return script
+
+
+class StubLlm(BaseLlm):
+    """Answers every request after `latency` seconds, without calling a model.
+
+    With a `script` (the responses of this agent per user message, see
+    `extract_script`), the n-th request of a turn gets the n-th recorded
+    response of that turn, which may call tools or transfer. Other requests
+    are answered with a short text, which ends the turn.
+    """
+
+    model: str = "stub"
+    latency: float = 0.0
+    script: dict = {}
+
+    @classmethod
+    def supported_models(cls):
+        return [r"stub.*"]
+
+    async def generate_content_async(self, llm_request, stream=False):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        contents = llm_request.contents or []
+        parts = self._scripted(contents)
+        if parts is None:
+            last = ""
+            for content in reversed(contents):
+                texts = [part.text for part in content.parts or [] if part.text]
+                if texts:
+                    last = texts[-1]
+                    break
+            parts = [types.Part(text=f"(stub) {last[:200]}")]
+        yield LlmResponse(content=types.Content(role="model", parts=parts))
+
+    def _scripted(self, contents):
+        """Parts of the recorded response to `contents`, or None."""
+        # Responses of this agent since the user message; those of other agents
+        # reach it as user contents.
+        step = 0
+        for content in reversed(contents):
+            if content.role == "model":
+                step += 1
+                continue
+            texts = [part.text for part in content.parts or [] if part.text]
+            responses = self.script.get("\n".join(texts)) if texts else None
+            if responses is not None:
+                if step >= len(responses):
+                    return None
+                return [types.Part(function_call=types.FunctionCall(**part["function_call"]))
+                        if "function_call" in part else types.Part(text=part["text"])
+                        for part in responses[step]]
+        return None
+
+
+def use_stub_model(root_agent, latency=0.0, script=None):
+    """Replace the model of every agent reachable from `root_agent` by a `StubLlm`.
+
+    Args:
+        script: Optional recorded responses, see `extract_script`.
+    """
+    for agent in iter_agents(root_agent):
+        if "model" in getattr(type(agent), "model_fields", {}):
+            agent.model = StubLlm(latency=latency, script=(script or {}).get(agent.name, {}))
+
+
+class LoadReport:
+    """Per-turn latencies and errors of a replay run."""
+
+    def __init__(self):
+        self.turn_latency = LatencyHistogram()
+        self.first_event_latency = LatencyHistogram()
+        self.turns = 0
+        self.sessions = 0
+        self.failed_sessions = 0
+        self.errors = {}
+        self.started = time.perf_counter()
+        self.wall = None
+
+    def error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def to_json(self):
+        wall = self.wall if self.wall is not None else time.perf_counter() - self.started
+
+        def latency(histogram):
+            if not histogram.count:
+                return None
+            stats = {f"p{int(q * 100)}": histogram.quantile(q) / 1e9 for q in QUANTILES}
+            stats.update(mean=histogram.total / histogram.count / 1e9, max=histogram.max / 1e9)
+            return stats
+
+        return {
+            "sessions": self.sessions,
+            "failed_sessions": self.failed_sessions,
+            "turns": self.turns,
+            "errors": self.errors,
+            "wall_seconds": wall,
+            "turns_per_second": self.turns / wall if wall else None,
+            "turn_latency_seconds": latency(self.turn_latency),
+            "first_event_latency_seconds": latency(self.first_event_latency),
+        }
+
+
+async def _replay_session(runner, messages, report, think_time, rng):
+    session = await runner.session_service.create_session(app_name=runner.app_name, user_id="replay")
+    report.sessions += 1
+    for text in messages:
+        message = types.Content(role="user", parts=[types.Part(text=text)])
+        start = time.perf_counter_ns()
+        first = None
+        try:
+            async for event in runner.run_async(user_id="replay", session_id=session.id, new_message=message):
+                if first is None:
+                    first = time.perf_counter_ns() - start
+                if getattr(event, "error_code", None):
+                    report.error(f"model:{event.error_code}")
+        except Exception as exc:
+            report.error(type(exc).__name__)
+            report.failed_sessions += 1
+            return
+        report.turns += 1
+        report.turn_latency.record(time.perf_counter_ns() - start)
+        if first is not None:
+            report.first_event_latency.record(first)
+        if think_time:
+            await asyncio.sleep(rng.expovariate(1 / think_time))
+
+
+async def run_load(root_agent, sessions, count=None, concurrency=8, rate=0.0, think_time=0.0, seed=None):
+    """Replay `count` sessions (cycling through `sessions`) through `root_agent`.
+
+    Args:
+        sessions: Lists of user messages, see `extract_sessions`.
+        concurrency: Maximum number of sessions running at once.
+        rate: Mean session arrivals per second (Poisson); 0 starts them as
+            soon as `concurrency` allows.
+        think_time: Mean pause between the turns of a session, in seconds.
+    """
+    if not sessions:
+        raise ValueError("no user messages to replay")
+    rng = random.Random(seed)
+    runner = Runner(app_name=f"replay-{uuid.uuid4().hex[:8]}", agent=root_agent,
+                    session_service=InMemorySessionService())
+    report = LoadReport()
+    slots = asyncio.Semaphore(concurrency)
+    tasks = []
+
+    async def run(messages):
+        try:
+            await _replay_session(runner, messages, report, think_time, rng)
+        finally:
+            slots.release()
+
+    for i in range(count or len(sessions)):
+        if rate:
+            await asyncio.sleep(rng.expovariate(rate))
+        await slots.acquire()
+        tasks.append(asyncio.ensure_future(run(sessions[i % len(sessions)])))
+    await asyncio.gather(*tasks)
+    report.wall = time.perf_counter() - report.started
+    return report
+
+
+def _print_report(report):
+    data = report.to_json()
+    print(f"sessions {data['sessions']} ({data['failed_sessions']} failed), turns {data['turns']}, "
+          f"{data['wall_seconds']:.2f}s, {data['turns_per_second'] or 0:.2f} turns/s")
+    for name in ("turn_latency_seconds", "first_event_latency_seconds"):
+        stats = data[name]
+        if stats:
+            print(f"{name.replace('_seconds', '').replace('_', ' '):<20} "
+                  + "  ".join(f"{key} {value:.3f}s" for key, value in stats.items()))
+    for kind, count in sorted(data["errors"].items(), key=lambda item: -item[1]):
+        print(f"error {kind}: {count}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay dumped user turns through root_agent under load.")
+    parser.add_argument("root", help="The logs directory, or one logs/<timestamp> directory.")
+    parser.add_argument("--agent", default="root_agent", help="Agent whose dumped sessions are replayed.")
+    parser.add_argument("--sessions", type=int, help="Sessions to run, cycling through the dumped ones.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0.0, help="Session arrivals per second; 0 for closed loop.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds between turns.")
+    parser.add_argument("--stub", action="store_true", help="Answer model requests locally with StubLlm.")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Seconds StubLlm waits per request.")
+    parser.add_argument("--stub-recorded", action="store_true",
+                        help="With --stub, answer with the recorded responses, tool calls and transfers.")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON.")
+    args = parser.parse_args(argv)
+
+    from agent_with_dump import agent as root_agent
+
+    if args.stub:
+        use_stub_model(root_agent, args.stub_latency,
+                       extract_script(args.root, args.agent) if args.stub_recorded else None)
+    sessions = extract_sessions(args.root, args.agent)
+    report = asyncio.run(run_load(root_agent, sessions, args.sessions, args.concurrency, args.rate,
+                                  args.think_time, args.seed))
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report.to_json(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""Invocation tracing from the agent, model and tool callbacks.
+
+Every patched agent gets before/after hooks that open and close spans:
+
+- `agent`: one agent turn, from before_agent to after_agent.
+- `model`: one LLM call, from before_model to after_model, with token usage.
+- `tool`: one tool call (including `AgentTool` sub-calls), keyed by its
+  function call id.
+- `dump`: the time spent by the dumper itself.
+
+Model and tool spans are children of the agent span of the same invocation.
+Agent spans are children of whatever span was open when they started, so the
+agent behind an `AgentTool` hangs under the tool call that ran it.
+
+Spans whose after-callback never ran (the agent or a tool raised, or an
+earlier after-callback returned a value) are ended when the run of their agent
+is over, with `error` and `exception` set when it raised, `incomplete` else.
+
+Finished spans are written with an exporter (`AGENT_DUMP_TRACE=chrome` or
+`otlp`) and handed to listeners registered with `Tracer.add_listener`.
+"""
+import atexit
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from agent_with_dump.hooks import chain_callback, wrap_run_async
+
+_current = contextvars.ContextVar("agent_with_dump_span", default=None)
+
+
+class Span:
+    __slots__ = ("kind", "name", "span_id", "parent", "trace_id", "invocation_id",
+                 "start_ns", "start_perf", "duration_ns", "attrs")
+
+    def __init__(self, kind, name, parent, invocation_id, attrs):
+        self.kind = kind
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else f"{random.getrandbits(128):032x}"
+        self.invocation_id = invocation_id
+        self.start_ns = time.time_ns()
+        self.start_perf = time.perf_counter_ns()
+        self.duration_ns = None
+        self.attrs = attrs
+
+    @property
+    def parent_id(self):
+        return self.parent.span_id if self.parent is not None else None
+
+
+class Tracer:
+    """Keeps the open spans and dispatches finished ones."""
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+        self.listeners = []
+        self._open = {}
+
+    @property
+    def active(self):
+        """True when finished spans go somewhere, i.e. agents need instrumenting."""
+        return self.exporter is not None or bool(self.listeners)
+
+    def add_listener(self, listener):
+        """Call `listener(span)` for every finished span."""
+        self.listeners.append(listener)
+
+    def start(self, kind, name, key, invocation_id=None, parent_key=None, **attrs):
+        """Open a span under `key`.
+
+        The parent is the open span under `parent_key` if given and open, else
+        the span current in this context.
+        """
+        parent = self._open.get(parent_key) if parent_key is not None else None
+        if parent is None:
+            parent = _current.get()
+        span = Span(kind, name, parent, invocation_id, attrs)
+        self._open[key] = span
+        return span
+
+    def end(self, key, **attrs):
+        span = self._open.pop(key, None)
+        if span is None:
+            return None
+        span.duration_ns = time.perf_counter_ns() - span.start_perf
+        span.attrs.update(attrs)
+        if self.exporter is not None:
+            self.exporter.export(span)
+        for listener in self.listeners:
+            listener(span)
+        return span
+
+    def end_where(self, predicate, **attrs):
+        """End the open spans for which `predicate(span)` is true, innermost first.
+
+        The span current in this context is moved out of the ended spans.
+        """
+        keys = sorted((key for key, span in self._open.items() if predicate(span)),
+                      key=lambda key: self._open[key].start_perf, reverse=True)
+        ended = {id(self.end(key, **attrs)) for key in keys}
+        current = _current.get()
+        while current is not None and id(current) in ended:
+            current = current.parent
+        if ended:
+            _current.set(current)
+        return len(ended)
+
+    @staticmethod
+    def enter(span):
+        """Make `span` the parent of spans started later in this context."""
+        _current.set(span)
+
+    @staticmethod
+    def leave(span):
+        if span is not None:
+            _current.set(span.parent)
+
+    @contextmanager
+    def span(self, kind, name, invocation_id=None, **attrs):
+        key = object()
+        span = self.start(kind, name, key, invocation_id, **attrs)
+        self.enter(span)
+        try:
+            yield span
+        finally:
+            self.leave(span)
+            self.end(key)
+
+
+class _BufferedExporter:
+    """Buffers finished spans and writes them in batches from the callback thread."""
+
+    BATCH = 64
+
+    def __init__(self, path):
+        self.path = path
+        self._pending = []
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def export(self, span):
+        self._pending.append(self.encode(span))
+        # Flush at the end of every top-level span so complete turns are on disk.
+        if span.parent is None or len(self._pending) >= self.BATCH:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                pending, self._pending = self._pending, []
+                self.write(pending)
+
+
+class ChromeTraceExporter(_BufferedExporter):
+    """Writes Chrome trace-event JSON, viewable in Perfetto or chrome://tracing.
+
+    The file is kept a valid JSON array after every flush: the closing bracket
+    is written after each batch and overwritten by the next one.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._tracks = {}
+        self._file = open(path, "w")
+        self._file.write("[\n")
+        self._first = True
+
+    def _track(self, trace_id):
+        # One track per top-level invocation, so nested spans stack up in the viewer.
+        if trace_id not in self._tracks:
+            self._tracks[trace_id] = len(self._tracks) + 1
+        return self._tracks[trace_id]
+
+    def encode(self, span):
+        args = {"span_id": span.span_id, "parent_id": span.parent_id,
+                "invocation_id": span.invocation_id, **span.attrs}
+        return json.dumps({
+            "name": f"{span.kind}:{span.name}",
+            "cat": span.kind,
+            "ph": "X",
+            "ts": span.start_ns / 1000,
+            "dur": span.duration_ns / 1000,
+            "pid": os.getpid(),
+            "tid": self._track(span.trace_id),
+            "args": {k: v for k, v in args.items() if v is not None},
+        }, default=str)
+
+    def write(self, pending):
+        prefix = "" if self._first else ",\n"
+        self._first = False
+        self._file.write(prefix + ",\n".join(pending) + "\n]")
+        self._file.flush()
+        self._file.seek(self._file.tell() - 2)
+
+
+class OtlpFileExporter(_BufferedExporter):
+    """Writes spans as OTLP/JSON `TracesData`, one batch per line.
+
+    This is the format of the OpenTelemetry collector file exporter, which the
+    collector's `otlpjsonfile` receiver and most trace backends can import.
+    """
+
+    def encode(self, span):
+        attributes = [{"key": "agent_with_dump.kind", "value": {"stringValue": span.kind}}]
+        if span.invocation_id is not None:
+            attributes.append({"key": "adk.invocation_id", "value": {"stringValue": span.invocation_id}})
+        for key, value in span.attrs.items():
+            if value is None:
+                continue
+            if isinstance(value, bool):
+                attributes.append({"key": key, "value": {"boolValue": value}})
+            elif isinstance(value, int):
+                attributes.append({"key": key, "value": {"intValue": str(value)}})
+            else:
+                attributes.append({"key": key, "value": {"stringValue": str(value)}})
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": f"{span.kind}:{span.name}",
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.start_ns + span.duration_ns),
+            "attributes": attributes,
+        }
+        if span.parent_id is not None:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded
+
+    def write(self, pending):
+        data = {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": "adk-web"}},
+                {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "agent_with_dump"}, "spans": pending}],
+        }]}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(data) + "\n")
+
+
+EXPORTERS = {"chrome": (".json", ChromeTraceExporter), "otlp": (".otlp.jsonl", OtlpFileExporter)}
+
+
+def make_exporter(kind, log_dir, file_stem=None):
+    """Build the exporter selected by AGENT_DUMP_TRACE, or None when tracing is off.
+
+    Args:
+        file_stem: Maps `trace` to the file name without extension, e.g.
+            `DumpWriter.file_stem` so per-process workers get their own file.
+    """
+    if not kind:
+        return None
+    if kind not in EXPORTERS:
+        raise ValueError(f"unknown trace exporter {kind!r}, expected one of {sorted(EXPORTERS)}")
+    extension, exporter = EXPORTERS[kind]
+    stem = file_stem("trace") if file_stem is not None else "trace"
+    return exporter(os.path.join(log_dir, stem + extension))
+
+
+def _invocation_id(context):
+    return getattr(context, "invocation_id", None)
+
+
+def instrument_agent(tracer, agent_obj, agent_name):
+    """Attach span hooks for the agent, its model calls and its tool calls."""
+    def agent_key(context):
+        return ("agent", _invocation_id(context), agent_name)
+
+    def before_agent(callback_context):
+        span = tracer.start("agent", agent_name, agent_key(callback_context), _invocation_id(callback_context))
+        tracer.enter(span)
+
+    def after_agent(callback_context):
+        span = tracer.end(agent_key(callback_context))
+        tracer.leave(span)
+
+    def before_model(callback_context, llm_request):
+        tracer.start("model", getattr(llm_request, "model", None) or "llm",
+                     ("model", _invocation_id(callback_context), agent_name),
+                     _invocation_id(callback_context), parent_key=agent_key(callback_context),
+                     agent=agent_name)
+
+    def after_model(callback_context, llm_response):
+        usage = getattr(llm_response, "usage_metadata", None)
+        tracer.end(("model", _invocation_id(callback_context), agent_name),
+                   prompt_tokens=getattr(usage, "prompt_token_count", None),
+                   completion_tokens=getattr(usage, "candidates_token_count", None),
+                   error_code=getattr(llm_response, "error_code", None))
+
+    def before_tool(tool, args, tool_context):
+        span = tracer.start("tool", getattr(tool, "name", str(tool)),
+                            ("tool", getattr(tool_context, "function_call_id", None)),
+                            _invocation_id(tool_context), parent_key=agent_key(tool_context),
+                            agent=agent_name)
+        tracer.enter(span)
+
+    def after_tool(tool, args, tool_context, tool_response):
+        error = isinstance(tool_response, dict) and "error" in tool_response
+        span = tracer.end(("tool", getattr(tool_context, "function_call_id", None)), error=error)
+        tracer.leave(span)
+
+    def owned(invocation_id):
+        # Spans of this agent in the invocation; transferred-to agents share it.
+        def predicate(span):
+            if span.invocation_id != invocation_id:
+                return False
+            return span.name == agent_name if span.kind == "agent" else span.attrs.get("agent") == agent_name
+        return predicate
+
+    def run_error(parent_context, exc):
+        tracer.end_where(owned(_invocation_id(parent_context)), error=True, exception=type(exc).__name__)
+
+    def run_exit(parent_context):
+        tracer.end_where(owned(_invocation_id(parent_context)), incomplete=True)
+
+    chain_callback(agent_obj, "before_agent_callback", before_agent)
+    chain_callback(agent_obj, "before_model_callback", before_model)
+    chain_callback(agent_obj, "after_model_callback", after_model)
+    chain_callback(agent_obj, "before_tool_callback", before_tool)
+    chain_callback(agent_obj, "after_tool_callback", after_tool)
+    # The after_agent hook goes last so the dump is part of the agent span.
+    chain_callback(agent_obj, "after_agent_callback", after_agent, last=True)
+    wrap_run_async(agent_obj, run_error, run_exit)
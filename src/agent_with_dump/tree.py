@@ -0,0 +1,56 @@
+"""Discovery of the live agent graph, as an alternative to scanning the sources."""
+import importlib
+import logging
+import os
+
+from google.adk.agents import BaseAgent
+
+
+def iter_agents(root):
+    """Yield every agent reachable from `root` exactly once, parents first.
+
+    Follows `sub_agents` and the `agent` of `AgentTool`s in `tools`. Agents are
+    tracked by identity, so an agent shared by several parents (or a cycle) is
+    only visited once.
+    """
+    seen = set()
+    stack = [root]
+    while stack:
+        agent = stack.pop()
+        if id(agent) in seen:
+            continue
+        seen.add(id(agent))
+        yield agent
+
+        children = list(getattr(agent, "sub_agents", None) or [])
+        for tool in getattr(agent, "tools", None) or []:
+            inner = getattr(tool, "agent", None)
+            if isinstance(inner, BaseAgent):
+                children.append(inner)
+        stack.extend(reversed(children))
+
+
+def find_root_agent(project_dir, module_name=None):
+    """Import the module defining `root_agent` and return it.
+
+    Args:
+        project_dir: Directory holding the ADK app packages.
+        module_name: Module to import, e.g. `travel_concierge.agent`. When
+            omitted, `<package>/agent.py` is tried for every package directly
+            under `project_dir`, which is the layout `adk web` expects.
+    """
+    if module_name:
+        candidates = [module_name]
+    else:
+        candidates = [
+            f"{name}.agent"
+            for name in sorted(os.listdir(project_dir))
+            if os.path.isfile(os.path.join(project_dir, name, "agent.py"))
+        ]
+    for candidate in candidates:
+        module = importlib.import_module(candidate)
+        root = getattr(module, "root_agent", None)
+        if root is not None:
+            logging.info(f"Found root_agent in {candidate}")
+            return root
+    raise LookupError(f"No root_agent found in {candidates or project_dir}")
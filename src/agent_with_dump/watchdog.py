@@ -0,0 +1,116 @@
+"""Detection of calls that block the asyncio event loop of the ADK server.
+
+A heartbeat task on the loop stamps the time every few milliseconds and a
+monitor thread watches the stamp. When it is older than the threshold, the loop
+is stuck in synchronous code: the monitor grabs the loop thread's current stack
+with `sys._current_frames()` and logs it with the agent, invocation and
+callback that were running, then logs the total stall once the loop is back.
+
+The heartbeat is started lazily from the first agent callback, since the
+server's loop does not exist yet when `agent_with_dump` is imported.
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from agent_with_dump.hooks import chain_callback
+
+
+class LoopWatchdog:
+    """
+    Args:
+        log_path: File the stalls are appended to.
+        threshold: Lag in seconds above which the loop is considered blocked.
+        interval: Heartbeat period in seconds; defaults to a quarter of the
+            threshold, capped at 10 ms.
+    """
+
+    def __init__(self, log_path, threshold=0.1, interval=None):
+        self.log_path = log_path
+        self.threshold = threshold
+        self.interval = interval or min(threshold / 4, 0.01)
+        # (agent, invocation_id, what) of the last callback seen on the loop thread.
+        self.current = (None, None, None)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._loop = None
+        self._loop_thread = None
+        self._last_beat = time.monotonic()
+        self._monitor = None
+
+    def ensure_started(self):
+        """Start watching the running loop; cheap no-op once started."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        loop.create_task(self._heartbeat(loop))
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._monitor.start()
+
+    async def _heartbeat(self, loop):
+        while loop is self._loop:
+            now = time.monotonic()
+            lag = now - self._last_beat - self.interval
+            if lag > self.max_lag:
+                self.max_lag = lag
+            self._last_beat = now
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        poll = min(self.threshold / 2, 0.05)
+        stalled_at = None
+        while True:
+            time.sleep(poll)
+            beat = self._last_beat
+            lag = time.monotonic() - beat
+            if stalled_at is None and lag > self.threshold:
+                stalled_at = beat
+                self.stalls += 1
+                self._report(lag)
+            elif stalled_at is not None and beat != stalled_at:
+                self._log(f"event loop unblocked after {(beat - stalled_at) * 1000:.0f} ms\n")
+                stalled_at = None
+
+    def _report(self, lag):
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "  <no frame>\n"
+        agent, invocation_id, what = self.current
+        self._log(
+            f"event loop blocked for {lag * 1000:.0f} ms "
+            f"(agent={agent} invocation={invocation_id} in {what})\n{stack}"
+        )
+
+    def _log(self, message):
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        with open(self.log_path, "a") as f:
+            f.write(f"[{timestamp}] {message}")
+
+    def instrument(self, agent_obj, agent_name):
+        """Track the running agent/callback on `agent_obj` and start the heartbeat."""
+
+        def enter(context, what):
+            self.ensure_started()
+            self.current = (agent_name, getattr(context, "invocation_id", None), what)
+
+        chain_callback(agent_obj, "before_agent_callback",
+                       lambda callback_context: enter(callback_context, "agent"))
+        chain_callback(agent_obj, "before_model_callback",
+                       lambda callback_context, llm_request: enter(callback_context, "model"))
+        chain_callback(agent_obj, "after_model_callback",
+                       lambda callback_context, llm_response: enter(callback_context, "agent"))
+        chain_callback(agent_obj, "before_tool_callback",
+                       lambda tool, args, tool_context: enter(tool_context, f"tool:{getattr(tool, 'name', tool)}"))
+        chain_callback(agent_obj, "after_tool_callback",
+                       lambda tool, args, tool_context, tool_response: enter(tool_context, "agent"))
+        chain_callback(agent_obj, "after_agent_callback",
+                       lambda callback_context: enter(callback_context, "after_agent"))
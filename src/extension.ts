@@ -14,6 +14,84 @@ let currentSelectedFile: string | null = null;  // NEW: Track currently viewed f
 
 let adkProcess: (ChildProcess | vscode.Terminal) | null = null;
 
+// Long-lived `gemini_utils.py --worker` process answering the log analysis requests as newline-delimited
+// JSON, so the model is configured once rather than in a new Python process per request.
+let analysisWorker: ChildProcess | null = null;
+let analysisWorkerEnv = '';
+let analysisRequestId = 0;
+const analysisRequests: Map<number, { worker: ChildProcess; onProgress: (stage: string) => void; resolve: (result: string) => void; reject: (err: Error) => void }> = new Map();
+
+function getAnalysisWorker(extensionPath: string, env: NodeJS.ProcessEnv, envKey: string, outputChannel: vscode.OutputChannel): ChildProcess {
+    if (analysisWorker && analysisWorker.exitCode === null) {
+        if (analysisWorkerEnv === envKey) {
+            return analysisWorker;
+        }
+        // The .env file changed: let the running requests finish in the old worker.
+        analysisWorker.stdin!.end();
+    }
+    const worker = spawn('python3', ['src/gemini_utils.py', '--worker'], { cwd: extensionPath, stdio: ['pipe', 'pipe', 'pipe'], env });
+    let buffered = '';
+    worker.stdout!.on('data', (data) => {
+        buffered += data.toString();
+        const lines = buffered.split('\n');
+        buffered = lines.pop() ?? '';
+        for (const line of lines) {
+            if (!line.trim()) {
+                continue;
+            }
+            let message: any;
+            try {
+                message = JSON.parse(line);
+            } catch {
+                outputChannel.appendLine(`Analysis worker: ${line}`);
+                continue;
+            }
+            if (message.type === 'ready') {
+                outputChannel.appendLine(`Analysis worker ready (pid ${message.pid})${message.warm ? '' : `, model not configured: ${message.error}`}`);
+                continue;
+            }
+            const request = analysisRequests.get(message.id);
+            if (!request) {
+                continue;
+            }
+            if (message.type === 'progress') {
+                request.onProgress(message.stage + (message.attempt ? ` (attempt ${message.attempt})` : '') + (message.error ? `: ${message.error}` : ''));
+            } else if (message.type === 'result') {
+                outputChannel.appendLine(`Analysis ${message.id} answered in ${message.seconds.toFixed(2)}s${message.cached ? ' from the cache' : ''}`);
+                analysisRequests.delete(message.id);
+                request.resolve(message.result);
+            } else if (message.type === 'error') {
+                analysisRequests.delete(message.id);
+                request.reject(new Error(message.error));
+            }
+        }
+    });
+    worker.stderr!.on('data', (data) => {
+        outputChannel.appendLine(`Python stderr: ${data.toString().trim()}`);
+    });
+    worker.on('close', (code) => {
+        outputChannel.appendLine(`Analysis worker exited with code: ${code}`);
+        if (analysisWorker === worker) {
+            analysisWorker = null;
+        }
+        for (const [id, request] of analysisRequests) {
+            if (request.worker === worker) {
+                analysisRequests.delete(id);
+                request.reject(new Error(`the analysis worker exited with code ${code}`));
+            }
+        }
+    });
+    worker.on('error', (err) => {
+        outputChannel.appendLine(`Error spawning python: ${err.message}`);
+    });
+    worker.stdin!.on('error', (err) => {
+        outputChannel.appendLine(`Analysis worker stdin: ${err.message}`);
+    });
+    analysisWorker = worker;
+    analysisWorkerEnv = envKey;
+    return worker;
+}
+
 // Function to get webview content
 function getWebviewContent() {
     return `<!DOCTYPE html>
@@ -540,7 +618,8 @@ ${agentToolName} = Agent(
             env: terminalEnv
         });
 
-        const fullCommand = `export PATH="/Library/Frameworks/Python.framework/Versions/3.12/bin:\$PATH"; export PROJECT_DIR="${rootPath}"; adk web --port 5000 --log_level DEBUG 1> >(python3 "${pythonScriptPath}" --source stdout > "${logFileName}") 2> >(python3 "${pythonScriptPath}" --source stderr >> "${logFileName}")`;
+        // process_log.py runs adk web and logs both of its output streams in one process.
+        const fullCommand = `export PATH="/Library/Frameworks/Python.framework/Versions/3.12/bin:\$PATH"; export PROJECT_DIR="${rootPath}"; python3 "${pythonScriptPath}" --output "${logFileName}" -- adk web --port 5000 --log_level DEBUG`;
 
         terminal.sendText(fullCommand);
         terminal.show();
@@ -716,33 +795,25 @@ ${agentToolName} = Agent(
                             for (const [key, value] of Object.entries(envConfig)) {
                                 spawnEnv[key] = value;
                             }
-                            const pythonPath = 'python3';
-                            const scriptPath = 'src/gemini_utils.py';
                             const fullFilePath = path.join(rootPath, filePath);
-                            outputChannel.appendLine(`Spawning: ${pythonPath} ${scriptPath} "${prompt}" "${fullFilePath}"`);
-                            const child = spawn(pythonPath, [scriptPath, prompt, fullFilePath], { cwd: context.extensionPath, stdio: ['pipe', 'pipe', 'pipe'], env: spawnEnv });
-                            let result = '';
-                            let errorOutput = '';
-                            child.stdout.on('data', (data) => {
-                                const chunk = data.toString();
-                                result += chunk;
-                                outputChannel.appendLine(`Python stdout: ${chunk.trim()}`);
-                            });
-                            child.stderr.on('data', (data) => {
-                                const chunk = data.toString();
-                                errorOutput += chunk;
-                                outputChannel.appendLine(`Python stderr: ${chunk.trim()}`);
-                            });
-                            child.on('close', (code) => {
-                                outputChannel.appendLine(`Python process exited with code: ${code}`);
-                                if (code === 0) {
-                                    logsPanel?.webview.postMessage({ command: 'analysisResult', result: result.trim() });
-                                    outputChannel.appendLine('Analysis completed successfully.');
-                                } else {
-                                    console.error('Python error:', errorOutput);
-                                    logsPanel?.webview.postMessage({ command: 'error', text: `Analysis failed: ${errorOutput.trim()}` });
-                                    outputChannel.appendLine(`Analysis failed with error: ${errorOutput.trim()}`);
-                                }
+                            const worker = getAnalysisWorker(context.extensionPath, spawnEnv, JSON.stringify(envConfig), outputChannel);
+                            const id = ++analysisRequestId;
+                            outputChannel.appendLine(`Sending analysis request ${id} to the analysis worker (pid ${worker.pid})`);
+                            new Promise<string>((resolve, reject) => {
+                                analysisRequests.set(id, {
+                                    worker,
+                                    onProgress: (stage) => outputChannel.appendLine(`Analysis ${id}: ${stage}`),
+                                    resolve,
+                                    reject,
+                                });
+                                worker.stdin!.write(JSON.stringify({ id, prompt, file: fullFilePath }) + '\n');
+                            }).then((result) => {
+                                logsPanel?.webview.postMessage({ command: 'analysisResult', result: result.trim() });
+                                outputChannel.appendLine('Analysis completed successfully.');
+                            }, (err: Error) => {
+                                console.error('Python error:', err.message);
+                                logsPanel?.webview.postMessage({ command: 'error', text: `Analysis failed: ${err.message}` });
+                                outputChannel.appendLine(`Analysis failed with error: ${err.message}`);
                             });
                         } catch (err) {
                             console.error('Error spawning python:', err);
@@ -764,4 +835,6 @@ ${agentToolName} = Agent(
 
 
 // This method is called when your extension is deactivated
-export function deactivate() { }
+export function deactivate() {
+    analysisWorker?.stdin?.end();
+}
@@ -1,57 +1,392 @@
-import google.generativeai as genai
+import atexit
+import hashlib
+import json
 import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
-def query_gemini(prompt: str, filename: str) -> str:
+from agent_logs.locking import lock_exclusive
+
+MODEL_NAME = 'gemini-2.5-flash'
+# Response cache settings, see ResponseCache. GEMINI_CACHE=0 disables it.
+CACHE_DIR = os.getenv('GEMINI_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'agent-inspector', 'gemini'))
+CACHE_TTL = float(os.getenv('GEMINI_CACHE_TTL', 7 * 24 * 3600))
+CACHE_MAX_ENTRIES = int(os.getenv('GEMINI_CACHE_MAX_ENTRIES', 500))
+STAT_FIELDS = ("hits", "misses", "coalesced", "expired", "evicted")
+# Seconds between two writes of the counts of a process to stats.json.
+STATS_INTERVAL = 5.0
+
+_models = {}
+_models_lock = threading.Lock()
+_default_cache = None
+
+
+class ResponseCache:
     """
-    Takes a string prompt and a filename, reads the file content, appends it to the prompt, and generates a response from
-    the Gemini 2.5 Pro model using the combined prompt as input.
-    
+    Content-addressed cache of model responses on local disk.
+
+    Entries are keyed by the model, the SHA-256 of the prompt and the SHA-256 of the file content, one
+    `<key>.json` file each. The modification time of an entry is its last use: once there are more than
+    `max_entries`, the least recently used ones are removed. Entries older than `ttl` seconds are not served.
+
+    Identical requests are computed once at a time: requests of the same process wait for the one in flight,
+    and other processes wait on the lock file of the key, then read the stored response. Hit and miss counts
+    are kept in `stats.json` across processes; each process adds its counts every `STATS_INTERVAL` seconds
+    and at exit.
+
     Args:
-        prompt (str): The input instructions or prompt for the model.
-        filename (str): The path to the file to attach to the prompt.
-    
-    Returns:
-        str: The generated response from the model.
+        path (str): The cache directory.
+        ttl (float): Seconds an entry is served after it was stored.
+        max_entries (int): Entries kept.
     """
-    api_key = os.getenv('GOOGLE_API_KEY')
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY environment variable is not set.")
-    
-    #print("Configuring Gemini API...")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    #print("Reading file...")
-    try:
-        with open(filename, 'r') as f:
-            file_content = f.read()
-        #print("File read successfully.")
-    except Exception as read_error:
-        #print(f"Read failed: {str(read_error)}")
-        raise
-    #print("Generating content...")
+
+    def __init__(self, path=CACHE_DIR, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._inflight = {}
+        self._lock = threading.Lock()
+        # Counts not yet added to stats.json.
+        self._counts = {}
+        self._counted = time.monotonic()
+        os.makedirs(path, exist_ok=True)
+        atexit.register(self.flush_stats)
+
+    @staticmethod
+    def key(model_name, prompt, content):
+        """The key of a request; `content` is the file content as bytes."""
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        content_hash = hashlib.sha256(content).hexdigest()
+        return hashlib.sha256(f"{model_name}\0{prompt_hash}\0{content_hash}".encode()).hexdigest()
+
+    def _file(self, key, suffix='.json'):
+        return os.path.join(self.path, key + suffix)
+
+    def get(self, key):
+        """The stored response of `key`, or None if there is none, it expired or it cannot be read."""
+        try:
+            with open(self._file(key)) as f:
+                entry = json.load(f)
+            created, response = float(entry['created']), entry['response']
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return None
+        if time.time() - created > self.ttl:
+            self._remove(key)
+            self._count('expired')
+            return None
+        try:
+            os.utime(self._file(key))
+        except FileNotFoundError:
+            pass
+        return response
+
+    def put(self, key, response, **meta):
+        entry = {'key': key, 'created': time.time(), **meta, 'response': response}
+        tmp = f"{self._file(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._file(key))
+        self._evict()
+
+    def _remove(self, key):
+        for suffix in ('.json', '.lock'):
+            try:
+                os.remove(self._file(key, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _entries(self):
+        """(last use, key, size) of the stored entries."""
+        entries = []
+        for item in os.scandir(self.path):
+            if item.name.endswith('.json') and item.name != 'stats.json':
+                try:
+                    stat = item.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, item.name[:-len('.json')], stat.st_size))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, key, _ in entries[:len(entries) - self.max_entries]:
+            self._remove(key)
+            self._count('evicted')
+
+    def fetch(self, key, compute, **meta):
+        """
+        Returns the response of `key`, calling `compute()` and storing its result on a miss.
+
+        Only one `compute()` per key runs at a time, across threads and processes.
+        """
+        response = self.get(key)
+        if response is not None:
+            self._count('hits')
+            return response
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            self._count('coalesced')
+            return future.result()
+        try:
+            with open(self._file(key, '.lock'), 'a') as lock:
+                lock_exclusive(lock.fileno())
+                # Another process may have stored it while we waited.
+                response = self.get(key)
+                if response is not None:
+                    self._count('coalesced')
+                else:
+                    self._count('misses')
+                    response = compute()
+                    self.put(key, response, **meta)
+            future.set_result(response)
+            return response
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _count(self, field):
+        with self._lock:
+            self._counts[field] = self._counts.get(field, 0) + 1
+            due = time.monotonic() - self._counted >= STATS_INTERVAL
+        if due:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """Add the counts of this process since the last call to `stats.json`."""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            self._counted = time.monotonic()
+        if not counts:
+            return
+        with open(os.path.join(self.path, 'stats.lock'), 'a') as lock:
+            lock_exclusive(lock.fileno())
+            stats = self._read_stats()
+            for field, count in counts.items():
+                stats[field] = stats.get(field, 0) + count
+            tmp = os.path.join(self.path, f'stats.json.{os.getpid()}.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(stats, f)
+            os.replace(tmp, os.path.join(self.path, 'stats.json'))
+
+    def _read_stats(self):
+        try:
+            with open(os.path.join(self.path, 'stats.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def stats(self):
+        """Hit, miss, coalesced, expired and evicted counts, with the entries and bytes stored."""
+        self.flush_stats()
+        stats = {field: 0 for field in STAT_FIELDS}
+        stats.update(self._read_stats())
+        entries = self._entries()
+        lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+        stats.update(entries=len(entries), bytes=sum(size for _, _, size in entries),
+                     hit_rate=(stats['hits'] + stats['coalesced']) / lookups if lookups else None)
+        return stats
+
+    def clear(self):
+        for _, key, _ in self._entries():
+            self._remove(key)
+
+
+def default_cache():
+    """The cache configured by the environment, or None if GEMINI_CACHE=0."""
+    global _default_cache
+    if os.getenv('GEMINI_CACHE', '1') == '0':
+        return None
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
+
+
+def get_model(model_name=MODEL_NAME):
+    """The configured model, created once per process."""
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            api_key = os.getenv('GOOGLE_API_KEY')
+            if not api_key:
+                raise ValueError("GOOGLE_API_KEY environment variable is not set.")
+            # Imported here: cached answers do not pay for it.
+            import google.generativeai as genai
+
+            genai.configure(api_key=api_key)
+            model = _models[model_name] = genai.GenerativeModel(model_name)
+        return model
+
+
+def generate(full_prompt: str, model_name: str = MODEL_NAME, progress=None) -> str:
+    """
+    Generates a response to `full_prompt`, retrying failed attempts with exponential backoff.
+
+    `progress(stage, **details)` is called with `generating` and, before each retry, `retry`.
+    """
+    model = get_model(model_name)
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            full_prompt = prompt + "\n\nFile content:\n" + file_content
+            if progress:
+                progress('generating', attempt=attempt + 1)
             response = model.generate_content(full_prompt)
-            #print("Response received.")
             return response.text
         except Exception as gen_error:
-            print(f"Generation attempt {attempt + 1} failed: {str(gen_error)}")
+            # On stderr: stdout carries the answer.
+            print(f"Generation attempt {attempt + 1} failed: {str(gen_error)}", file=sys.stderr)
             if attempt == max_retries - 1:
                 raise
-            import time
+            if progress:
+                progress('retry', attempt=attempt + 1, error=str(gen_error))
             time.sleep(2 ** attempt)  # Exponential backoff
+
+
+def query_gemini(prompt: str, filename: str, model_name: str = MODEL_NAME, cache=None, progress=None) -> str:
+    """
+    Takes a string prompt and a filename, reads the file content, appends it to the prompt, and generates a response from
+    the Gemini model using the combined prompt as input.
+
+    Responses are served from `cache` (the `default_cache()` if None) when the same model was already asked the same
+    prompt about the same file content.
+
+    Args:
+        prompt (str): The input instructions or prompt for the model.
+        filename (str): The path to the file to attach to the prompt.
+        model_name (str): The Gemini model to use.
+        cache (ResponseCache): The response cache; False to bypass it.
+        progress (callable): Called as `progress(stage, **details)` when the model is called, see `generate`.
+
+    Returns:
+        str: The generated response from the model.
+    """
+    with open(filename, 'rb') as f:
+        content = f.read()
+    full_prompt = prompt + "\n\nFile content:\n" + content.decode('utf-8', 'replace')
+    if cache is None:
+        cache = default_cache()
+    if not cache:
+        return generate(full_prompt, model_name, progress)
+    key = cache.key(model_name, prompt, content)
+    return cache.fetch(key, lambda: generate(full_prompt, model_name, progress), model=model_name,
+                       file=os.path.abspath(filename))
+
+
+def _request_error(request):
+    """Why a worker request cannot be run, or None."""
+    if not isinstance(request, dict):
+        return "Invalid request: expected a JSON object"
+    for field in ('prompt', 'file'):
+        if field not in request:
+            return f"Missing request field '{field}'"
+        if not isinstance(request[field], str):
+            return f"Request field '{field}' must be a string"
+    if request.get('model') is not None and not isinstance(request['model'], str):
+        return "Request field 'model' must be a string"
+    return None
+
+
+def serve_worker(concurrency=4, model_name=MODEL_NAME, stdin=None, stdout=None):
+    """
+    Answers newline-delimited JSON requests read from stdin on stdout, until stdin is closed.
+
+    The model is configured once, in the background at start, and up to `concurrency` requests run at once.
+    A request is `{"id": ..., "prompt": ..., "file": ...}`, optionally with `"model"` and `"cache": false`.
+    Every output line carries the `id` of its request and a `type`:
+
+    - `progress`: `stage` is `queued`, `started`, `generating` (with `attempt`) or `retry` (with `error`);
+    - `result`: `result` is the answer, `cached` tells whether it came from the cache, `seconds` the time taken;
+    - `error`: `error` is the message.
+
+    A `{"type": "ready"}` line is written once the model is configured (`warm` is false if that failed).
+    """
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    write_lock = threading.Lock()
+
+    def send(message):
+        with write_lock:
+            stdout.write(json.dumps(message) + "\n")
+            stdout.flush()
+
+    def warm_up():
+        try:
+            get_model(model_name)
+            send({'type': 'ready', 'pid': os.getpid(), 'warm': True})
+        except Exception as exc:
+            send({'type': 'ready', 'pid': os.getpid(), 'warm': False, 'error': str(exc)})
+
+    def run(request):
+        request_id = request.get('id')
+        start = time.perf_counter()
+        called = []
+
+        def progress(stage, **details):
+            called.append(stage)
+            send({'id': request_id, 'type': 'progress', 'stage': stage, **details})
+
+        try:
+            send({'id': request_id, 'type': 'progress', 'stage': 'started'})
+            result = query_gemini(request['prompt'], request['file'], request.get('model') or model_name,
+                                  cache=None if request.get('cache', True) else False, progress=progress)
+            send({'id': request_id, 'type': 'result', 'result': result, 'cached': 'generating' not in called,
+                  'seconds': time.perf_counter() - start})
+        except Exception as exc:
+            send({'id': request_id, 'type': 'error', 'error': str(exc)})
+
+    threading.Thread(target=warm_up, daemon=True).start()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for line in stdin:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as exc:
+                send({'id': None, 'type': 'error', 'error': f"Invalid request: {exc}"})
+                continue
+            error = _request_error(request)
+            if error is not None:
+                send({'id': request.get('id') if isinstance(request, dict) else None, 'type': 'error',
+                      'error': error})
+                continue
+            send({'id': request.get('id'), 'type': 'progress', 'stage': 'queued'})
+            pool.submit(run, request)
+
+
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 3:
-        print("Usage: python gemini_utils.py &lt;prompt&gt; &lt;filename&gt;", file=sys.stderr)
+    args = sys.argv[1:]
+    if args[:1] == ['--worker']:
+        serve_worker(int(args[1]) if len(args) > 1 else int(os.getenv('GEMINI_WORKER_CONCURRENCY', 4)))
+        sys.exit(0)
+    if args in (['--cache-stats'], ['--clear-cache']):
+        cache = ResponseCache()
+        if args == ['--clear-cache']:
+            cache.clear()
+        print(json.dumps(cache.stats(), indent=2))
+        sys.exit(0)
+    use_cache = args[:1] != ['--no-cache']
+    if not use_cache:
+        args = args[1:]
+    if len(args) != 2:
+        print("Usage: python gemini_utils.py [--no-cache] <prompt> <filename>\n"
+              "       python gemini_utils.py --worker [<concurrency>]\n"
+              "       python gemini_utils.py --cache-stats | --clear-cache", file=sys.stderr)
         sys.exit(1)
-    prompt = sys.argv[1]
-    filename = sys.argv[2]
+    prompt, filename = args
     try:
-        result = query_gemini(prompt, filename)
+        result = query_gemini(prompt, filename, cache=None if use_cache else False)
         print(result)
     except Exception as e:
         print(f"Error: {str(e)}", file=sys.stderr)
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,315 @@
+# log_index.py
+#
+# Sparse sidecar index of the logs written by process_log.py, and a reader that
+# seeks with it.
+#
+# `<log>.idx` next to `logs/agent_events_<timestamp>.log` holds one
+# tab-separated entry `<line number> <byte offset> <timestamp>` for every
+# `every`th line of the log and for the first line of every minute. Entries
+# are appended after the log lines they point to are written, so the index is
+# always a prefix of the log. Reading the lines of a time range or from a line
+# number is then one bisect over the entries, one seek, and a scan of at most
+# one minute or `every` lines before the first line returned.
+#
+#     python3 log_index.py logs/agent_events.log --last 5m
+#     python3 log_index.py logs/agent_events.log --from "2025-09-08 10:12" --to "2025-09-08 10:13"
+#     python3 log_index.py logs/agent_events.log --line 120000 --count 50
+#     python3 log_index.py logs/agent_events.log --last 1m --follow
+#
+# Logs written without an index (by the one-pipe mode or older versions) are
+# indexed on first read. Their two pipes were stamped by separate processes, so
+# stamps can go backwards; the index then holds an `#unordered` line and time
+# ranges are read with a full scan (line numbers still seek).
+import argparse
+import bisect
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+INDEX_SUFFIX = ".idx"
+DEFAULT_EVERY = 1000
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+_TIMESTAMP = re.compile(rb'^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})\]')
+_TAIL_SIZE = 1 << 16
+
+
+def index_path(log_path):
+    return log_path + INDEX_SUFFIX
+
+
+def line_timestamp(line):
+    """The `%Y-%m-%d %H:%M:%S.mmm` stamp of a log line (bytes), or None."""
+    match = _TIMESTAMP.match(line)
+    return match.group(1).decode() if match else None
+
+
+def read_index(path):
+    """The (line, offset, timestamp) entries of an index file ([] if there is none),
+    and whether the stamps of the log are in order."""
+    entries = []
+    ordered = True
+    try:
+        with open(path, encoding="utf-8") as f:
+            for entry in f:
+                if entry.startswith("#unordered"):
+                    ordered = False
+                    continue
+                fields = entry.rstrip("\n").split("\t")
+                if len(fields) == 3:  # a torn last entry is skipped
+                    entries.append((int(fields[0]), int(fields[1]), fields[2]))
+    except FileNotFoundError:
+        pass
+    return entries, ordered
+
+
+class SparseIndex:
+    """Writer side: notes each line written to the log and appends the index entries.
+
+    Opening resumes the index of an existing log, indexing the lines written
+    after its last entry (or the whole log when there is no index yet).
+    """
+
+    def __init__(self, log_path, every=DEFAULT_EVERY):
+        self.path = index_path(log_path)
+        self.every = every
+        self.pending = []
+        entries, self.ordered = read_index(self.path)
+        size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        if entries and entries[-1][1] > size:
+            entries = []  # the log was truncated or replaced
+            self.ordered = True
+        mode = "a" if entries else "w"
+        if entries:
+            # Cut a torn last entry, so the next one starts on its own line.
+            with open(self.path, "r+b") as f:
+                f.truncate(f.read().rfind(b"\n") + 1)
+        self.line, self.offset, last = entries[-1] if entries else (0, 0, None)
+        self.minute = last[:16] if last else None
+        self.latest = last or ""
+        if self.offset < size:
+            with open(log_path, "rb") as log:
+                log.seek(self.offset)
+                for line in log:
+                    if not line.endswith(b"\n"):
+                        break
+                    if entries and self.offset == entries[-1][1]:
+                        # the line of the last entry, already indexed
+                        self.line += 1
+                        self.offset += len(line)
+                        continue
+                    last = line_timestamp(line) or last or ""
+                    self.note(last, len(line))
+        self.file = open(self.path, mode, encoding="utf-8")
+        self.flush()
+
+    def note(self, timestamp, size):
+        """Account for one line of `size` bytes stamped `timestamp`, about to be written."""
+        if timestamp < self.latest and self.ordered:
+            self.pending.append("#unordered\n")
+            self.ordered = False
+        if self.line % self.every == 0 or timestamp[:16] != self.minute:
+            self.pending.append(f"{self.line}\t{self.offset}\t{timestamp}\n")
+            self.minute = timestamp[:16]
+        if timestamp > self.latest:
+            self.latest = timestamp
+        self.line += 1
+        self.offset += size
+
+    def flush(self):
+        """Append the pending entries; call once the lines they point to are written."""
+        if self.pending:
+            self.file.write("".join(self.pending))
+            self.file.flush()
+            self.pending.clear()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def build_index(log_path, every=DEFAULT_EVERY):
+    """(Re)index an existing log, returning its entries and whether it is in order."""
+    try:
+        os.remove(index_path(log_path))
+    except FileNotFoundError:
+        pass
+    SparseIndex(log_path, every).close()
+    return read_index(index_path(log_path))
+
+
+class LogReader:
+    """Reads the lines of a log by time range or line number through its index.
+
+    Lines are returned as str without the trailing newline.
+    """
+
+    def __init__(self, log_path, every=DEFAULT_EVERY):
+        self.log_path = log_path
+        self.entries, self.ordered = read_index(index_path(log_path))
+        if not self.entries and os.path.getsize(log_path):
+            try:
+                self.entries, self.ordered = build_index(log_path, every)
+            except OSError:  # read-only directory: index in memory
+                self.entries, self.ordered = self._scan_entries(every)
+        self._timestamps = [entry[2] for entry in self.entries]
+        self._lines = [entry[0] for entry in self.entries]
+        # Offset after the last complete line read, where `follow` goes on.
+        self.position = 0
+
+    def _scan_entries(self, every):
+        entries, line, offset, minute, latest, ordered = [], 0, 0, None, "", True
+        with open(self.log_path, "rb") as log:
+            for text in log:
+                timestamp = line_timestamp(text) or latest
+                if line % every == 0 or timestamp[:16] != minute:
+                    entries.append((line, offset, timestamp))
+                    minute = timestamp[:16]
+                if timestamp < latest:
+                    ordered = False
+                latest = max(latest, timestamp)
+                line += 1
+                offset += len(text)
+        return entries, ordered
+
+    def _start(self, position, keys):
+        # Last entry strictly before `position`: several lines share a timestamp.
+        i = bisect.bisect_left(keys, position) - 1
+        return self.entries[i] if i >= 0 else (0, 0, "")
+
+    def _read(self, offset, line_number):
+        """Yield (line number, timestamp, line) of the complete lines from `offset`."""
+        with open(self.log_path, "rb") as log:
+            log.seek(offset)
+            for raw in log:
+                if not raw.endswith(b"\n"):
+                    return
+                self.position = offset = offset + len(raw)
+                yield line_number, line_timestamp(raw), raw[:-1].decode("utf-8", "replace")
+                line_number += 1
+
+    def range(self, start=None, end=None):
+        """The lines stamped in [start, end); timestamps are `%Y-%m-%d %H:%M:%S.mmm` prefixes."""
+        if start and self.ordered:
+            line_number, offset, _ = self._start(start, self._timestamps)
+        else:
+            line_number, offset = 0, 0
+        for _, timestamp, line in self._read(offset, line_number):
+            if timestamp is None or (start and timestamp < start):
+                continue
+            if end and timestamp >= end:
+                if self.ordered:
+                    return
+                continue
+            yield line
+
+    def lines(self, first, count=None):
+        """`count` lines (all if None) from line number `first` (0-based)."""
+        line_number, offset, _ = self._start(first, self._lines)
+        for number, _, line in self._read(offset, line_number):
+            if number < first:
+                continue
+            if count is not None and number >= first + count:
+                return
+            yield line
+
+    def last_timestamp(self):
+        size = os.path.getsize(self.log_path)
+        with open(self.log_path, "rb") as log:
+            log.seek(max(size - _TAIL_SIZE, 0))
+            for raw in reversed(log.read().split(b"\n")):
+                timestamp = line_timestamp(raw)
+                if timestamp:
+                    return timestamp
+        return None
+
+    def last(self, seconds):
+        """The lines of the last `seconds` seconds of the log."""
+        end = self.last_timestamp()
+        if end is None:
+            return iter(())
+        start = datetime.strptime(end, TIMESTAMP_FORMAT) - timedelta(seconds=seconds)
+        return self.range(start.strftime(TIMESTAMP_FORMAT)[:23])
+
+    def follow(self, offset=None, poll=0.5):
+        """Yield each line appended to the log from `offset` (the end by default), forever.
+
+        A partially written last line is held back until its newline arrives;
+        a truncated or replaced log is read again from its start.
+        """
+        log = open(self.log_path, "rb")
+        try:
+            log.seek(0, os.SEEK_END) if offset is None else log.seek(offset)
+            partial = b""
+            while True:
+                data = log.read(_TAIL_SIZE)
+                if data:
+                    lines = (partial + data).split(b"\n")
+                    partial = lines.pop()
+                    for raw in lines:
+                        yield raw.decode("utf-8", "replace")
+                    continue
+                try:
+                    stat = os.stat(self.log_path)
+                except FileNotFoundError:
+                    stat = None
+                if stat is not None and (stat.st_ino != os.fstat(log.fileno()).st_ino or stat.st_size < log.tell()):
+                    log.close()
+                    log = open(self.log_path, "rb")
+                    partial = b""
+                    continue
+                time.sleep(poll)
+        finally:
+            log.close()
+
+
+def _seconds(duration):
+    """Seconds of `90`, `90s`, `5m`, `2h` or `1d`."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if duration[-1:] in units:
+        return float(duration[:-1]) * units[duration[-1]]
+    return float(duration)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Read a process_log.py log through its sparse index.')
+    parser.add_argument('log')
+    parser.add_argument('--from', dest='start', help='First timestamp, e.g. "2025-09-08 10:12" (prefixes work).')
+    parser.add_argument('--to', dest='end', help='Timestamp before which to stop.')
+    parser.add_argument('--last', help='Duration before the last line, e.g. 5m.')
+    parser.add_argument('--line', type=int, help='First line number (0-based).')
+    parser.add_argument('--count', type=int, help='Lines to print from --line.')
+    parser.add_argument('--follow', action='store_true', help='Then print new lines as they are written.')
+    parser.add_argument('--build', action='store_true', help='Rebuild the index and exit.')
+    parser.add_argument('--every', type=int, default=DEFAULT_EVERY, help='Lines between index entries.')
+    args = parser.parse_args(argv)
+
+    if args.build:
+        entries, ordered = build_index(args.log, args.every)
+        print(f"{len(entries)} entries in {index_path(args.log)}" + ("" if ordered else " (stamps out of order)"))
+        return
+    reader = LogReader(args.log, args.every)
+    if args.line is not None:
+        lines = reader.lines(args.line, args.count)
+    elif args.last:
+        lines = reader.last(_seconds(args.last))
+    elif args.start or args.end:
+        lines = reader.range(args.start, args.end)
+    else:
+        lines = iter(())
+    out = sys.stdout
+    for line in lines:
+        out.write(line + "\n")
+    if args.follow:
+        out.flush()
+        try:
+            for line in reader.follow(reader.position if args.line is None and not args.end else None):
+                out.write(line + "\n")
+                out.flush()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
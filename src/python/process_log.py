@@ -1,36 +1,390 @@
 # process_log.py
-import sys
+#
+# Timestamps the output of `adk web` into logs/agent_events_<timestamp>.log.
+#
+# Multiplexer mode runs the server itself and reads its stdout and stderr in
+# this one process:
+#
+#     python3 process_log.py --output logs/agent_events.log -- adk web --port 5000
+#
+# Both pipes are drained as soon as data arrives, so the server never blocks
+# on its logging. Lines are stamped in arrival order with a timestamp cached
+# per millisecond and written in batches, flushed once `--flush-lines` lines
+# are pending or when no output came for `--flush-interval` seconds.
+#
+# With `--source stdout|stderr`, lines are read from stdin instead (the former
+# one-process-per-pipe setup).
+#
+# With `--output`, the multiplexer also keeps the sparse sidecar index
+# `<output>.idx` of log_index.py (an entry every `--index-every` lines and at
+# every minute), which log_index.LogReader uses to seek by time or line number.
+#
+# `--jsonl FILE` also writes one JSON record per log entry, parsed with the
+# matchers of `StructuredWriter` (uvicorn access lines, Python/ADK log lines
+# with their continuation lines, LLM request/response markers, events), with
+# `latency_ms` on the records that end a model call or an outbound HTTP
+# request. `--from-log` converts an existing text log the same way.
 import argparse
-from datetime import datetime
-
-# Set up argument parsing
-parser = argparse.ArgumentParser(description="Process log lines.")
-parser.add_argument('--source', required=True, choices=['stdout', 'stderr'],
-                    help='The source stream of the log lines.')
-args = parser.parse_args()
-
-# Your script now knows the origin of its input
-source_stream = args.source
-
-for line in sys.stdin:
-    original_line = line.strip()
-    
-    # --- YOUR CUSTOM LOGIC GOES HERE ---
-    
-    # Add timestamp
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-    
-    # Now you can differentiate
-    if source_stream == 'stderr':
-        processed_line = f"[{timestamp}][E] {original_line}"
-    else: # from stdout
-        if "DEBUG" in original_line:
-             processed_line = f"[{timestamp}][P] {original_line}"
-        else:
-             processed_line = f"[{timestamp}] {original_line}"
-    
-    # --- END OF CUSTOM LOGIC ---
-
-    print(processed_line, flush=True)
-
-    
+import json
+import os
+import re
+import selectors
+import signal
+import subprocess
+import sys
+import time
+from collections import OrderedDict, deque
+
+from log_index import DEFAULT_EVERY, SparseIndex
+
+READ_SIZE = 1 << 16
+
+
+class Clock:
+    """`%Y-%m-%d %H:%M:%S.mmm` of the current time, formatted once per millisecond."""
+
+    def __init__(self):
+        self._second = None
+        self._second_text = ""
+        self._ms = None
+        self._text = ""
+
+    def now(self):
+        now = time.time()
+        ms = int(now * 1000)
+        if ms != self._ms:
+            second = ms // 1000
+            if second != self._second:
+                self._second = second
+                self._second_text = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+            self._ms = ms
+            self._text = f"{self._second_text}.{ms % 1000:03d}"
+        return self._text
+
+
+def format_line(timestamp, source, line):
+    """The log line of one line of output, as written by the one-pipe mode."""
+    line = line.strip()
+    if source == 'stderr':
+        return f"[{timestamp}][E] {line}"
+    if "DEBUG" in line:
+        return f"[{timestamp}][P] {line}"
+    return f"[{timestamp}] {line}"
+
+
+class BatchWriter:
+    """Appends lines to a file descriptor in batches, noting them in `index` if given."""
+
+    def __init__(self, fd, flush_lines=256, index=None):
+        self.fd = fd
+        self.flush_lines = flush_lines
+        self.index = index
+        self.pending = []
+
+    def add(self, timestamp, source, line):
+        text = format_line(timestamp, source, line) + "\n"
+        self.pending.append(text)
+        if self.index is not None:
+            self.index.note(timestamp, len(text) if text.isascii() else len(text.encode("utf-8")))
+        if len(self.pending) >= self.flush_lines:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        data = "".join(self.pending).encode("utf-8")
+        self.pending.clear()
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+        if self.index is not None:
+            self.index.flush()
+
+
+# uvicorn access line: `INFO:     127.0.0.1:49834 - "GET /list-apps HTTP/1.1" 200 OK`
+_ACCESS = re.compile(r'^(?P<level>[A-Z]+):\s+(?P<client>\S+):(?P<port>\d+) - '
+                     r'"(?P<method>[A-Z]+) (?P<path>\S+) HTTP/[\d.]+" (?P<status>\d{3})(?: (?P<reason>.*))?$')
+# Other uvicorn lines: `INFO:     Started server process [4242]`
+_SERVER = re.compile(r'^(?P<level>DEBUG|INFO|WARNING|ERROR|CRITICAL):\s+(?P<message>.*)$')
+# Python logging as configured by `adk web`: `<asctime> - <level> - <file>:<line> - <message>`
+_PYLOG = re.compile(r'^(?P<logged_at>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - (?P<level>[A-Z]+) - '
+                    r'(?P<logger>[\w.]+:\d+) - ?(?P<message>.*)$')
+# A line of a text log written by this script.
+_TEXT_LOG = re.compile(r'^\[(?P<timestamp>[\d-]+ [\d:.]+)\](?P<tag>\[[EP]\])? ?(?P<line>.*)$')
+
+# (event, regex) matched against the message of Python log records, in order.
+_ADK_MESSAGES = [
+    ("llm_request_start", re.compile(r'^Sending out request, model: (?P<model>[^,]+), backend: (?P<backend>[^,]+), '
+                                     r'stream: (?P<stream>\w+)')),
+    ("llm_response_received", re.compile(r'^Response received from the model')),
+    ("agent_event", re.compile(r'^Generated event in agent run streaming: (?P<json>\{.*)$')),
+    ("http_client", re.compile(r'^HTTP Request: (?P<method>[A-Z]+) (?P<url>(?P<scheme>https?)://(?P<host>[^/:\s]+)\S*) '
+                               r'"HTTP/[\d.]+ (?P<status>\d{3})')),
+    ("http_connect", re.compile(r'^Starting new HTTPS? connection \(\d+\): (?P<host>[^:\s]+)')),
+    # httpcore, whose requests httpx logs as `HTTP Request:` above.
+    ("http_connect", re.compile(r"^connect_tcp\.started host='(?P<host>[^']+)'")),
+    ("http_client", re.compile(r'^(?P<scheme>https?)://(?P<host>[^:\s]+):\d+ "(?P<method>[A-Z]+) (?P<path>\S+) '
+                               r'HTTP/[\d.]+" (?P<status>\d{3})')),
+]
+# First line of the body of a multi-line record -> event.
+_BODIES = {"LLM Request:": "llm_request", "LLM Response:": "llm_response"}
+_AGENT_NAME = re.compile(r'Your internal name is "(?P<agent>[^"]+)"')
+# start event -> (end event, key fields): the end record gets the latency since
+# the oldest unmatched start with the same key.
+_PAIRS = {
+    "llm_request_start": ("llm_response_received", ()),
+    "http_connect": ("http_client", ("host",)),
+}
+# Unmatched starts kept per key, and keys kept (least recently started dropped).
+_MAX_PENDING = 256
+# Unmatched starts older than this are dropped: their end was never logged.
+_PAIR_TIMEOUT_MS = 10 * 60 * 1000
+
+# Epoch seconds of the `%Y-%m-%d %H:%M:%S` prefixes seen last.
+_SECONDS = {}
+
+
+def _epoch_ms(timestamp):
+    """Milliseconds since the epoch of a `%Y-%m-%d %H:%M:%S.mmm` local timestamp."""
+    second = _SECONDS.get(timestamp[:19])
+    if second is None:
+        if len(_SECONDS) > 4096:
+            _SECONDS.clear()
+        second = _SECONDS[timestamp[:19]] = int(time.mktime(time.strptime(timestamp[:19], '%Y-%m-%d %H:%M:%S')))
+    return second * 1000 + int(timestamp[20:23] or 0)
+
+
+class StructuredWriter(BatchWriter):
+    """Appends one JSON record per log entry; continuation lines join their entry."""
+
+    def __init__(self, fd, flush_lines=256):
+        super().__init__(fd, flush_lines)
+        # Last record of each source, still open to continuation lines.
+        self.open = {}
+        # Pairing key -> epoch ms of its unmatched starts, oldest first.
+        self.starts = OrderedDict()
+
+    def add(self, timestamp, source, line):
+        line = line.rstrip("\r\n")
+        record = self.parse(timestamp, source, line)
+        if record is None:
+            current = self.open.get(source)
+            if current is not None:
+                current.setdefault("body", []).append(line)
+            elif line.strip():
+                self._emit({"ts": timestamp, "source": source, "kind": "text", "message": line.strip()})
+            return
+        self._close(source)
+        self.open[source] = record
+
+    def parse(self, timestamp, source, line):
+        """The record started by `line`, or None for a continuation line."""
+        match = _PYLOG.match(line)
+        if match:
+            record = {"ts": timestamp, "source": source, "kind": "log", **match.groupdict()}
+            message = record["message"]
+            for event, pattern in _ADK_MESSAGES:
+                event_match = pattern.match(message)
+                if event_match:
+                    record["event"] = event
+                    record.update({k: v for k, v in event_match.groupdict().items() if v is not None})
+                    if "status" in record:
+                        record["status"] = int(record["status"])
+                    break
+            return record
+        match = _ACCESS.match(line)
+        if match:
+            record = {"ts": timestamp, "source": source, "kind": "access", **match.groupdict()}
+            record["status"] = int(record["status"])
+            return record
+        match = _SERVER.match(line)
+        if match:
+            return {"ts": timestamp, "source": source, "kind": "server", **match.groupdict()}
+        return None
+
+    def _close(self, source):
+        record = self.open.pop(source, None)
+        if record is None:
+            return
+        body = record.pop("body", None)
+        if body:
+            while body and not body[-1].strip():
+                body.pop()
+            event = _BODIES.get(body[0].strip()) if body else None
+            if event and "event" not in record:
+                record["event"] = event
+                agent = _AGENT_NAME.search("\n".join(body))
+                if agent:
+                    record["agent"] = agent.group("agent")
+            record["body"] = "\n".join(body)
+        if record.get("event") == "agent_event":
+            self._event_fields(record)
+        self._pair(record)
+        self._emit(record)
+
+    @staticmethod
+    def _event_fields(record):
+        try:
+            event = json.loads(record.pop("json"))
+        except ValueError:
+            return
+        parts = (event.get("content") or {}).get("parts") or []
+        record.update(
+            agent=event.get("author"),
+            invocation_id=event.get("invocationId"),
+            event_id=event.get("id"),
+            function_calls=[p["functionCall"].get("name") for p in parts if p.get("functionCall")],
+            function_responses=[p["functionResponse"].get("name") for p in parts if p.get("functionResponse")],
+            transfer_to_agent=(event.get("actions") or {}).get("transferToAgent"),
+            usage=event.get("usageMetadata"),
+        )
+
+    def _pair(self, record):
+        event = record.get("event")
+        if event in _PAIRS:
+            end, fields = _PAIRS[event]
+            key = (end,) + tuple(record.get(field) for field in fields)
+            pending = self.starts.get(key)
+            if pending is None:
+                pending = self.starts[key] = deque(maxlen=_MAX_PENDING)
+                if len(self.starts) > _MAX_PENDING:
+                    self.starts.popitem(last=False)
+            else:
+                self.starts.move_to_end(key)
+            pending.append(_epoch_ms(record["ts"]))
+            return
+        for start, (end, fields) in _PAIRS.items():
+            if event != end:
+                continue
+            pending = self.starts.get((end,) + tuple(record.get(field) for field in fields))
+            now = _epoch_ms(record["ts"])
+            while pending and now - pending[0] > _PAIR_TIMEOUT_MS:
+                pending.popleft()
+            if pending:
+                record["latency_ms"] = now - pending.popleft()
+
+    def _emit(self, record):
+        self.pending.append(json.dumps(record, ensure_ascii=False) + "\n")
+        if len(self.pending) >= self.flush_lines:
+            super().flush()
+
+    def flush(self):
+        for source in list(self.open):
+            self._close(source)
+        super().flush()
+
+
+def convert_log(path, writer):
+    """Write the records of an existing text log."""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            match = _TEXT_LOG.match(line.rstrip("\n"))
+            if match is None:
+                continue
+            source = 'stderr' if match.group("tag") == "[E]" else 'stdout'
+            writer.add(match.group("timestamp"), source, match.group("line"))
+    writer.flush()
+
+
+def multiplex(command, writers, flush_interval=0.1):
+    """Run `command` and log its stdout and stderr until it exits.
+
+    Returns:
+        int: The exit code of the command.
+    """
+    child = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+    # Ctrl+C reaches the whole process group; keep logging until the server is done.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: child.terminate())
+
+    clock = Clock()
+    selector = selectors.DefaultSelector()
+    partial = {}
+    for stream, source in ((child.stdout, 'stdout'), (child.stderr, 'stderr')):
+        os.set_blocking(stream.fileno(), False)
+        selector.register(stream.fileno(), selectors.EVENT_READ, source)
+        partial[source] = b""
+
+    open_streams = 2
+    while open_streams:
+        busy = any(writer.pending or getattr(writer, "open", None) for writer in writers)
+        ready = selector.select(flush_interval if busy else None)
+        if not ready:
+            for writer in writers:
+                writer.flush()  # idle
+            continue
+        for key, _ in ready:
+            source = key.data
+            try:
+                data = os.read(key.fd, READ_SIZE)
+            except BlockingIOError:
+                continue
+            timestamp = clock.now()
+            if not data:
+                selector.unregister(key.fd)
+                open_streams -= 1
+                if partial[source]:
+                    for writer in writers:
+                        writer.add(timestamp, source, partial[source].decode("utf-8", "replace"))
+                continue
+            lines = (partial[source] + data).split(b"\n")
+            partial[source] = lines.pop()
+            for line in lines:
+                text = line.decode("utf-8", "replace")
+                for writer in writers:
+                    writer.add(timestamp, source, text)
+    for writer in writers:
+        writer.flush()
+    return child.wait()
+
+
+def process_stdin(source, writers):
+    clock = Clock()
+    for line in sys.stdin:
+        timestamp = clock.now()
+        for writer in writers:
+            writer.add(timestamp, source, line)
+            # Written line by line; an open structured record waits for its continuation lines.
+            BatchWriter.flush(writer)
+    for writer in writers:
+        writer.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process log lines.")
+    parser.add_argument('--source', choices=['stdout', 'stderr'],
+                        help='The source stream of the log lines read from stdin.')
+    parser.add_argument('--output', help='Log file to append to (default: stdout).')
+    parser.add_argument('--index-every', type=int, default=DEFAULT_EVERY,
+                        help='Lines between entries of the <output>.idx index; 0 disables it.')
+    parser.add_argument('--jsonl', help='Also append structured records to this file.')
+    parser.add_argument('--from-log', metavar='LOG', help='Convert an existing text log to --jsonl records and exit.')
+    parser.add_argument('--flush-lines', type=int, default=256,
+                        help='Write once this many lines are pending.')
+    parser.add_argument('--flush-interval', type=float, default=0.1,
+                        help='Write pending lines after this many idle seconds.')
+    parser.add_argument('command', nargs=argparse.REMAINDER,
+                        help='Command to run and log, after `--` (multiplexer mode).')
+    args = parser.parse_args(argv)
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if args.from_log:
+        fd = os.open(args.jsonl, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644) if args.jsonl else sys.stdout.fileno()
+        convert_log(args.from_log, StructuredWriter(fd, args.flush_lines))
+        return
+    if not command and args.source is None:
+        parser.error('either --source or a command to run is required')
+
+    fd = os.open(args.output, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644) if args.output else sys.stdout.fileno()
+    # Only the multiplexer knows the offsets: in the one-pipe mode two processes append.
+    index = SparseIndex(args.output, args.index_every) if args.output and command and args.index_every > 0 else None
+    writers = [BatchWriter(fd, args.flush_lines, index)]
+    if args.jsonl:
+        jsonl_fd = os.open(args.jsonl, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        writers.append(StructuredWriter(jsonl_fd, args.flush_lines))
+    if command:
+        sys.exit(multiplex(command, writers, args.flush_interval))
+    process_stdin(args.source, writers)
+
+
+if __name__ == '__main__':
+    main()
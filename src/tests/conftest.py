@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The packages are imported from `src` (`python -m agent_logs.X`), the log
+# scripts from `src/python`.
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SRC, os.path.join(SRC, "python")]
@@ -0,0 +1,79 @@
+import os
+import struct
+
+import pytest
+
+from agent_logs import binlog
+from agent_logs.binlog import (
+    HEADER_SIZE, _FLUSH_SIZE, append_binary_record, iter_frames, iter_records, read_frame)
+
+RECORD = {
+    "agent": "poi_agent",
+    "timestamp": "2025-09-08_10-13-02-117",
+    "session_id": None,
+    "events": [
+        {"author": "user", "text": "héllo", "turn": 1, "score": -2.5, "final": True, "partial": False},
+        {"author": "poi_agent", "text": "x" * 500, "turn": -300, "data": b"\x00\xff"},
+    ],
+}
+# Null fields are not written.
+DECODED = {
+    "agent": "poi_agent",
+    "timestamp": "2025-09-08_10-13-02-117",
+    "events": [
+        {"author": "user", "text": "héllo", "turn": 1, "score": -2.5, "final": True, "partial": False},
+        {"author": "poi_agent", "text": "x" * 500, "turn": -300, "data": {"__bytes__": "AP8="}},
+    ],
+}
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib"])
+def test_round_trip(tmp_path, compression):
+    path = str(tmp_path / "events.adkb")
+    offsets = [append_binary_record(path, dict(RECORD, n=i), compression)[0] for i in range(3)]
+    assert offsets[0] == HEADER_SIZE
+    assert list(iter_records(path)) == [dict(DECODED, n=i) for i in range(3)]
+    assert [offset for offset, _ in iter_frames(path)] == offsets
+    assert list(iter_frames(path, offsets[2])) == [(offsets[2], dict(DECODED, n=2))]
+    with open(path, "rb") as f:
+        assert read_frame(f, offsets[1]) == dict(DECODED, n=1)
+
+
+def test_codec_of_the_header_is_kept(tmp_path):
+    path = str(tmp_path / "events.adkb")
+    append_binary_record(path, {"n": 0}, "zlib")
+    append_binary_record(path, {"n": 1}, "none")
+    assert list(iter_records(path)) == [{"n": 0}, {"n": 1}]
+
+
+def _failing_events():
+    # Enough data for the encoder to flush part of the frame to the file first.
+    for _ in range(4):
+        yield {"text": "y" * _FLUSH_SIZE}
+    raise RuntimeError("session went away")
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib"])
+def test_failed_append_keeps_later_records_readable(tmp_path, compression):
+    path = str(tmp_path / "events.adkb")
+    append_binary_record(path, {"n": 1}, compression)
+    size = os.path.getsize(path)
+    with pytest.raises(RuntimeError):
+        append_binary_record(path, {"events": _failing_events()}, compression)
+    assert os.path.getsize(path) == size
+    append_binary_record(path, {"n": 2}, compression)
+    assert list(iter_records(path)) == [{"n": 1}, {"n": 2}]
+
+
+@pytest.mark.parametrize("forget", [False, True])
+def test_frame_of_a_killed_writer_is_cut_off(tmp_path, forget):
+    path = str(tmp_path / "events.adkb")
+    append_binary_record(path, {"n": 1})
+    # What a writer killed in the middle of a frame leaves behind.
+    with open(path, "ab") as f:
+        f.write(struct.pack("<I", 0xFFFFFFFF) + b"\x09\x05partial")
+    if forget:  # as seen by another process
+        binlog._checked_ends.clear()
+    append_binary_record(path, {"n": 2})
+    append_binary_record(path, {"n": 3})
+    assert list(iter_records(path)) == [{"n": 1}, {"n": 2}, {"n": 3}]
@@ -0,0 +1,51 @@
+import json
+import os
+
+from agent_logs import blobs
+from agent_logs.blobs import BlobStore, resolve_blobs
+from agent_logs.encoder import append_json_record
+
+
+def _files(root):
+    return sorted(name for _, _, names in os.walk(root) for name in names)
+
+
+def test_equal_payloads_are_stored_once(tmp_path):
+    store = BlobStore(str(tmp_path), threshold=8)
+    first = store.put(b"x" * 100)
+    second = store.put(bytes(b"x" * 100))
+    assert first == second == {"__blob__": first["__blob__"], "length": 100, "type": "bytes"}
+    assert store.put("x" * 100)["type"] == "text"
+    assert _files(tmp_path) == [first["__blob__"]]
+    with open(store.path_for(first["__blob__"]), "rb") as f:
+        assert f.read() == b"x" * 100
+
+
+def test_seen_cache_is_bounded_by_payload_bytes(tmp_path, monkeypatch):
+    monkeypatch.setattr(blobs, "_SEEN_CACHE_BYTES", 250)
+    store = BlobStore(str(tmp_path), threshold=8)
+    payloads = [bytes([i]) * 100 for i in range(5)]
+    for payload in payloads:
+        store.put(payload)
+    assert store._seen_bytes == 200
+    assert [entry[0] for entry in store._seen.values()] == payloads[3:]
+    # A payload dropped from the cache is hashed again but not written again.
+    assert store.put(payloads[0])["length"] == 100
+    assert len(_files(tmp_path)) == 5
+
+
+def test_dump_with_blobs_reads_back_inline(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"), threshold=64)
+    record = {"small": b"\x00\x01", "image": b"\x89PNG" + bytes(200), "prompt": "long " * 40}
+    path = tmp_path / "events.json"
+    append_json_record(str(path), record, blobs=store)
+
+    with open(path) as f:
+        [dumped] = json.load(f)
+    assert dumped["small"] == {"__bytes__": "AAE="}
+    assert dumped["image"]["__blob__"] and dumped["prompt"]["type"] == "text"
+
+    inline = tmp_path / "inline.json"
+    append_json_record(str(inline), record)
+    with open(inline) as f:
+        assert resolve_blobs(dumped, store.root) == json.load(f)[0]
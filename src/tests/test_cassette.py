@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("google.adk.models")
+from google.adk.models.llm_request import LlmRequest  # noqa: E402
+from google.adk.models.llm_response import LlmResponse  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from agent_with_dump.cassette import Cassette, CassetteLlm, CassetteMiss  # noqa: E402
+
+
+class _Model:
+    """Answers with the number of calls so far."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.calls += 1
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=f"answer {self.calls}")]))
+
+
+def _request(text):
+    return LlmRequest(model="gemini-2.0-flash", contents=[types.Content(role="user", parts=[types.Part(text=text)])])
+
+
+def _texts(path, mode, texts, model=None):
+    llm = CassetteLlm(cassette=Cassette(str(path), mode=mode), inner=model or _Model(), agent_name="root_agent")
+
+    async def run():
+        return [[response.content.parts[0].text async for response in llm.generate_content_async(_request(text))]
+                for text in texts]
+
+    return [texts[0] for texts in asyncio.run(run())]
+
+
+def test_record_then_replay(tmp_path):
+    assert _texts(tmp_path, "record", ["hi", "hi", "bye"]) == ["answer 1", "answer 2", "answer 3"]
+    model = _Model()
+    # Identical requests recorded in one run are replayed in turn.
+    assert _texts(tmp_path, "replay", ["hi", "hi", "bye", "hi"], model) == [
+        "answer 1", "answer 2", "answer 3", "answer 1"]
+    assert model.calls == 0
+
+
+def test_record_replaces_earlier_runs_and_append_adds_to_them(tmp_path):
+    _texts(tmp_path, "record", ["hi"])
+    model = _Model()
+    model.calls = 10
+    _texts(tmp_path, "record", ["hi"], model)
+    assert _texts(tmp_path, "replay", ["hi", "hi"]) == ["answer 11", "answer 11"]
+    _texts(tmp_path, "append", ["hi"], model)
+    assert _texts(tmp_path, "replay", ["hi", "hi"]) == ["answer 11", "answer 12"]
+
+
+def test_replay_miss_raises_without_calling_the_model(tmp_path):
+    _texts(tmp_path, "record", ["hi"])
+    model = _Model()
+    with pytest.raises(CassetteMiss):
+        _texts(tmp_path, "replay", ["bye"], model)
+    assert model.calls == 0
+    # `auto` records the miss instead.
+    assert _texts(tmp_path, "auto", ["bye", "hi"], model) == ["answer 1", "answer 1"]
+    assert model.calls == 1
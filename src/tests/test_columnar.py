@@ -0,0 +1,36 @@
+from agent_logs.columnar import build_tables
+from agent_logs.writer import DumpWriter
+
+
+def _event(event_id, author="user"):
+    return {"id": event_id, "author": author, "timestamp": 1757325600, "content": {"parts": [{"text": "hi"}]}}
+
+
+def test_sessions_without_id_are_keyed_by_first_event(tmp_path):
+    writer = DumpWriter(str(tmp_path))
+    writer.write("events", {"timestamp": "2025-09-08_10-00-00-000", "events": [_event("a1")]})
+    writer.write("events", {"timestamp": "2025-09-08_10-00-01-000", "events": [_event("a1"), _event("a2", "root_agent")]})
+    writer.write("events", {"timestamp": "2025-09-08_10-00-02-000", "events": [_event("b1")]})
+    writer.write("events", {"timestamp": "2025-09-08_10-00-03-000", "session_id": "s", "events": [_event("c1")]})
+    writer.close()
+
+    events = build_tables(str(tmp_path))["events"]
+    sessions = events.vocab["session_id"]
+    assert sorted(sessions) == ["a1", "b1", "s"]
+    assert list(events.data["session_id"]) == [sessions["a1"], sessions["a1"], sessions["b1"], sessions["s"]]
+
+
+def test_state_snapshots_without_id_share_the_key_of_their_events(tmp_path):
+    writer = DumpWriter(str(tmp_path))
+    for timestamp, events in (("2025-09-08_10-00-00-000", [_event("a1")]),
+                              ("2025-09-08_10-00-01-000", [_event("a1"), _event("a2", "root_agent")]),
+                              ("2025-09-08_10-00-02-000", [_event("b1")])):
+        writer.write("state", {"agent": "root_agent", "timestamp": timestamp, "state": {"city": "x"}})
+        writer.write("events", {"agent": "root_agent", "timestamp": timestamp, "events": events})
+    writer.write("state", {"agent": "root_agent", "timestamp": "2025-09-08_10-00-03-000", "session_id": "s",
+                           "state": {"city": "y"}})
+    writer.close()
+
+    state = build_tables(str(tmp_path))["state"]
+    sessions = {code: value for value, code in state.vocab["session_id"].items()}
+    assert [sessions[code] for code in state.data["session_id"]] == ["a1", "a1", "b1", "s"]
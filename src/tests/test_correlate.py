@@ -0,0 +1,84 @@
+import json
+
+from agent_logs.correlate import correlate, load_logs, match_requests
+from agent_logs.latency import load_invocations
+from agent_logs.writer import DumpWriter
+
+T0 = 1757325600.0  # 2025-09-08 10:00:00 UTC
+A, B = "e-aaaaaaaa-0000-4000-8000-000000000001", "e-bbbbbbbb-0000-4000-8000-000000000002"
+S1, S2 = "11111111-0000-4000-8000-000000000001", "22222222-0000-4000-8000-000000000002"
+
+
+def _dump(log_dir):
+    writer = DumpWriter(str(log_dir))
+    for invocation_id, session_id, start, answer, dumped in ((A, S1, 0, 2, "03"), (B, S2, 1, 5, "06")):
+        events = [{"id": f"{invocation_id}-u", "author": "user", "invocation_id": invocation_id,
+                   "timestamp": T0 + start, "content": {"parts": [{"text": "hi"}]}},
+                  {"id": f"{invocation_id}-m", "author": "root_agent", "invocation_id": invocation_id,
+                   "timestamp": T0 + answer, "content": {"parts": [{"text": "hello"}]}}]
+        writer.write("events", {"agent": "root_agent", "timestamp": f"2025-09-08_10-00-{dumped}-000",
+                                "session_id": session_id, "invocation_id": invocation_id, "events": events})
+    writer.close()
+
+
+def _access(method, path):
+    return f'INFO:     127.0.0.1:49834 - "{method} {path} HTTP/1.1" 200 OK'
+
+
+def _log(tmp_path, lines):
+    path = tmp_path / "agent_events_2025-09-08_10-00-00.log"
+    path.write_text("".join(f"[2025-09-08 10:00:{stamp}] {text}\n" for stamp, text in lines))
+    return str(path)
+
+
+def test_requests_and_lines_are_attached_to_their_invocation(tmp_path):
+    (tmp_path / "2025-09-08_10-00-00").mkdir()
+    _dump(tmp_path / "2025-09-08_10-00-00")
+    path = _log(tmp_path, [
+        ("00.500", _access("POST", "/run_sse")),
+        ("01.200", _access("POST", "/run_sse")),
+        ("02.000", f"2025-09-08 10:00:02,000 - INFO - runners.py:10 - Running {B}"),
+        ("02.500", _access("GET", f"/apps/app/users/u/sessions/{S1}")),
+        ("02.700", "2025-09-08 10:00:02,700 - DEBUG - google_llm.py:90 - LLM Request:"),
+        ("02.701", "System Instruction: ..."),
+        ("04.500", "2025-09-08 10:00:04,500 - INFO - tools.py:3 - tool done"),
+        ("06.100", _access("POST", "/run")),
+        ("09.000", "2025-09-08 10:00:09,000 - INFO - main.py:1 - idle"),
+    ])
+    invocations = load_invocations(str(tmp_path))
+    lines, offset = load_logs([path], utc_offset=0)
+    assert offset == 0
+
+    requests = match_requests(lines, invocations)
+    # /run_sse is logged when the run starts; each invocation serves one request.
+    # /run is logged at the end: none is left for it.
+    assert [(line["request"]["path"], invocation and invocation.invocation_id) for line, invocation in requests] == [
+        ("/run_sse", A), ("/run_sse", B), ("/run", None)]
+
+    correlate([line for line in lines if line.get("how") != "request"], invocations)
+    attached = {line["text"][-20:]: (line.get("invocation_id"), line.get("how"), line.get("ambiguous", False))
+                for line in lines[2:]}
+    assert list(attached.values()) == [
+        (B, "id", False),
+        (A, "session", False),
+        # Both run; the latest started one is taken, and the line is flagged.
+        (B, "window", True),
+        (B, "window", True),  # continuation line of the record above
+        (B, "window", False),  # A has ended
+        (B, "window", False),  # an unmatched request falls back to the window
+        (None, None, False),  # nothing runs
+    ]
+    assert lines[2]["turn_agent"] == "root_agent"
+    assert lines[3]["session_id"] == S1
+
+
+def test_utc_offset_is_recovered_from_streamed_events(tmp_path):
+    # Logged two hours east of UTC.
+    event = {"id": "x", "author": "root_agent", "timestamp": T0 + 1.25}
+    path = tmp_path / "agent_events_2025-09-08_12-00-00.log"
+    path.write_text(f"[2025-09-08 12:00:01.250] 2025-09-08 12:00:01,250 - DEBUG - runners.py:5 - "
+                    f"Generated event in agent run streaming: {json.dumps(event)}\n")
+    lines, offset = load_logs([str(path)])
+    assert offset == 7200
+    assert lines[0]["time"] == T0 + 1.25
+    assert lines[0]["agent"] == "root_agent"
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from agent_logs.encoder import append_json_record
+
+
+def _records(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_append_keeps_a_valid_array(tmp_path):
+    path = tmp_path / "events.json"
+    for i in range(3):
+        offset, size = append_json_record(str(path), {"i": i, "data": b"\x00\x01"})
+        assert json.loads(path.read_bytes()[offset:offset + size])["i"] == i
+    assert [r["i"] for r in _records(path)] == [0, 1, 2]
+    assert _records(path)[0]["data"] == {"__bytes__": "AAE="}
+
+
+def _failing_events():
+    yield {"author": "user"}
+    raise RuntimeError("session went away")
+
+
+def test_failed_append_leaves_the_file_as_it_was(tmp_path):
+    path = tmp_path / "events.json"
+    append_json_record(str(path), {"i": 0})
+    before = path.read_bytes()
+    with pytest.raises(RuntimeError):
+        append_json_record(str(path), {"i": 1, "events": _failing_events()})
+    assert path.read_bytes() == before
+    append_json_record(str(path), {"i": 2})
+    assert [r["i"] for r in _records(path)] == [0, 2]
+    assert [p.name for p in tmp_path.iterdir()] == ["events.json"]
+
+
+def test_failed_first_append_leaves_an_empty_file(tmp_path):
+    path = tmp_path / "events.json"
+    with pytest.raises(RuntimeError):
+        append_json_record(str(path), {"events": _failing_events()})
+    append_json_record(str(path), {"i": 0})
+    assert _records(path) == [{"i": 0}]
@@ -0,0 +1,132 @@
+import io
+import json
+import os
+import threading
+import time
+
+import gemini_utils
+from gemini_utils import ResponseCache
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    cache.put("k", "old answer")
+    assert cache.get("k") == "old answer"
+    entry = json.loads((tmp_path / "k.json").read_text())
+    entry["created"] -= 61
+    (tmp_path / "k.json").write_text(json.dumps(entry))
+
+    assert cache.fetch("k", lambda: "new answer") == "new answer"
+    assert cache.get("k") == "new answer"
+    assert {field: cache.stats()[field] for field in ("expired", "misses", "hits")} == {
+        "expired": 1, "misses": 1, "hits": 0}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_entries=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    # Used last; mtimes are set explicitly, as they may not tick between two writes.
+    os.utime(tmp_path / "a.json", (time.time() - 10, time.time() - 10))
+    os.utime(tmp_path / "b.json", (time.time() - 20, time.time() - 20))
+    cache.put("c", "C")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("A", None, "C")
+    stats = cache.stats()
+    assert (stats["entries"], stats["evicted"]) == (2, 1)
+
+
+def test_bad_entries_are_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    for key, data in (("torn", '{"key": "torn", "crea'), ("list", "[]"), ("fields", '{"created": "yesterday"}')):
+        (tmp_path / f"{key}.json").write_text(data)
+        assert cache.get(key) is None
+        assert cache.fetch(key, lambda: "answer") == "answer"
+        assert cache.get(key) == "answer"
+
+
+def test_identical_requests_are_computed_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(gemini_utils, "STATS_INTERVAL", 3600)
+    cache = ResponseCache(str(tmp_path))
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.fetch("k", compute))) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while cache._counts.get("coalesced", 0) < 3:
+        time.sleep(0.01)  # the other requests wait for the first one
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["answer"] * 4 and len(calls) == 1
+    assert (cache.stats()["misses"], cache.stats()["coalesced"]) == (1, 3)
+
+
+def test_counts_are_written_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(gemini_utils, "STATS_INTERVAL", 3600)
+    cache = ResponseCache(str(tmp_path))
+    cache.put("k", "answer")
+    for _ in range(100):
+        cache.fetch("k", lambda: "other")
+    assert not (tmp_path / "stats.json").exists()
+    # Another process adds its counts to the same file.
+    other = ResponseCache(str(tmp_path))
+    other._count("hits")
+    other.flush_stats()
+    assert json.loads((tmp_path / "stats.json").read_text()) == {"hits": 1}
+    assert cache.stats()["hits"] == 101
+    assert json.loads((tmp_path / "stats.json").read_text()) == {"hits": 101}
+
+
+def test_worker_protocol(tmp_path, monkeypatch):
+    monkeypatch.delenv("GEMINI_CACHE", raising=False)
+    monkeypatch.setattr(gemini_utils, "_default_cache", ResponseCache(str(tmp_path / "cache")))
+    monkeypatch.setattr(gemini_utils, "get_model", lambda model_name: object())
+
+    def generate(full_prompt, model_name, progress=None):
+        progress("generating", attempt=1)
+        return f"{model_name}: {full_prompt.splitlines()[-1]}"
+
+    monkeypatch.setattr(gemini_utils, "generate", generate)
+    attached = tmp_path / "agent.py"
+    attached.write_text("root_agent = None")
+    requests = [
+        {"id": 1, "prompt": "explain", "file": str(attached)},
+        {"id": 2, "prompt": "explain", "file": str(attached)},
+        {"id": 3, "prompt": "explain", "file": str(attached), "cache": False, "model": "gemini-pro"},
+        {"id": 4, "prompt": "explain"},
+        {"id": 5, "prompt": ["explain"], "file": str(attached)},
+        {"id": 6, "prompt": "explain", "file": str(tmp_path / "missing.py")},
+    ]
+    stdin = io.StringIO("".join(json.dumps(request) + "\n" for request in requests) + "\n{not json\n[1, 2]\n")
+    stdout = io.StringIO()
+    gemini_utils.serve_worker(concurrency=1, stdin=stdin, stdout=stdout)
+    deadline = time.monotonic() + 5
+    while '"ready"' not in stdout.getvalue() and time.monotonic() < deadline:
+        time.sleep(0.01)  # the warm-up runs in the background
+
+    messages = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert [m for m in messages if m["type"] == "ready"][0]["warm"] is True
+
+    def of(request_id):
+        return [m for m in messages if m.get("id") == request_id and m["type"] != "ready"]
+
+    assert [m.get("stage", m["type"]) for m in of(1)] == ["queued", "started", "generating", "result"]
+    assert (of(1)[-1]["result"], of(1)[-1]["cached"]) == ("gemini-2.5-flash: root_agent = None", False)
+    assert [m.get("stage", m["type"]) for m in of(2)] == ["queued", "started", "result"]
+    assert of(2)[-1]["cached"] is True
+    assert (of(3)[-1]["result"], of(3)[-1]["cached"]) == ("gemini-pro: root_agent = None", False)
+    # Invalid requests are refused before they are queued.
+    assert of(4) == [{"id": 4, "type": "error", "error": "Missing request field 'file'"}]
+    assert of(5) == [{"id": 5, "type": "error", "error": "Request field 'prompt' must be a string"}]
+    assert [m.get("stage", m["type"]) for m in of(6)] == ["queued", "started", "error"]
+    assert [m["error"].split(":")[0] for m in of(None)] == ["Invalid request"] * 2
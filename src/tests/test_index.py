@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+
+from agent_logs.index import INDEX, IndexWriter, LogIndex, load_entries, main, rebuild_index
+from agent_logs.writer import DumpWriter, process_tag
+
+
+def _record(i, session_id, agent="poi_agent"):
+    return {"agent": agent, "timestamp": f"2025-09-08_10-00-{i:02d}-000", "session_id": session_id,
+            "invocation_id": f"e-{i // 2}", "n": i}
+
+
+def _dump(log_dir, count=10, **options):
+    writer = DumpWriter(str(log_dir), index=True, **options)
+    for i in range(count):
+        writer.write("events", _record(i, f"s{i % 2}", "poi_agent" if i < 5 else "root_agent"))
+    writer.close()
+
+
+def _numbers(index, **criteria):
+    return [record["n"] for record in index.records(**criteria)]
+
+
+def test_query_by_session_agent_and_time(tmp_path):
+    _dump(tmp_path)
+    index = LogIndex(str(tmp_path))
+    assert _numbers(index, session_id="s1") == [1, 3, 5, 7, 9]
+    assert _numbers(index, agent="root_agent", session_id="s0") == [6, 8]
+    assert _numbers(index, invocation_id="e-2") == [4, 5]
+    assert _numbers(index, start="2025-09-08_10-00-03-000", end="2025-09-08_10-00-05-000") == [3, 4, 5]
+    assert _numbers(index, session_id="s0", start="2025-09-08_10-00-05") == [6, 8]
+    assert _numbers(index, stream="state") == []
+    index.close()
+
+
+def test_end_bound_covers_its_whole_second(tmp_path):
+    _dump(tmp_path)
+    index = LogIndex(str(tmp_path))
+    assert _numbers(index, end="2025-09-08_10-00-02") == [0, 1, 2]
+    assert [entry["n"] for entry in map(index.read, index.scan(end="2025-09-08_10-00-02"))] == [0, 1, 2]
+    index.close()
+
+
+def test_scan_matches_query(tmp_path, capsys):
+    _dump(tmp_path, count=12, max_bytes=300)
+    index = LogIndex(str(tmp_path))
+    for criteria in ({}, {"session_id": "s0"}, {"agent": "root_agent", "start": "2025-09-08_10-00-07"}):
+        assert list(index.scan(**criteria)) == list(index.query(**criteria))
+    index.close()
+    main(["query", str(tmp_path), "--session", "s1", "--end", "2025-09-08_10-00-05"])
+    assert [json.loads(line)["n"] for line in capsys.readouterr().out.splitlines()] == [1, 3, 5]
+
+
+def test_read_records_back(tmp_path):
+    _dump(tmp_path, fmt="json")
+    binary = tmp_path / "binary"
+    binary.mkdir()
+    _dump(binary, fmt="binary", compression="zlib")
+    for log_dir in (tmp_path, binary):
+        index = LogIndex(str(log_dir))
+        entry = next(index.query(session_id="s1", agent="poi_agent"))
+        assert index.read(entry) == _record(1, "s1")
+        index.close()
+
+
+def test_read_after_rotation(tmp_path):
+    _dump(tmp_path, count=12, max_bytes=300)
+    names = os.listdir(str(tmp_path))
+    assert any(name.endswith(".json.gz") for name in names)
+    # Compressed segments are found through their `.gz` suffix.
+    entries = load_entries(os.path.join(str(tmp_path), INDEX))
+    assert {entry["file"] for entry in entries} == {
+        name[:-len(".gz")] if name.endswith(".gz") else name for name in names if name.startswith("events.")}
+    index = LogIndex(str(tmp_path))
+    assert _numbers(index) == list(range(12))
+    assert _numbers(index, session_id="s0", start="2025-09-08_10-00-05") == [6, 8, 10]
+    index.close()
+
+
+def test_rename_lines_only_move_earlier_entries(tmp_path):
+    writer = IndexWriter(str(tmp_path))
+    writer.add("events", "events.json", 2, 10, _record(0, "s0"))
+    writer.rename("events.json", "events.000001.json")
+    writer.add("events", "events.json", 2, 10, _record(1, "s0"))
+    writer.rename("events.json", "events.000002.json")
+    writer.add("events", "events.json", 2, 10, _record(2, "s0"))
+    entries = load_entries(os.path.join(str(tmp_path), INDEX))
+    assert [entry["file"] for entry in entries] == ["events.000001.json", "events.000002.json", "events.json"]
+
+
+def test_rebuild_after_truncation(tmp_path):
+    _dump(tmp_path)
+    path = os.path.join(str(tmp_path), INDEX)
+    with open(path, "r+") as f:
+        f.truncate(len(f.readline()))
+    assert len(load_entries(path)) == 1
+
+    assert rebuild_index(str(tmp_path)) == 10
+    index = LogIndex(str(tmp_path))
+    assert _numbers(index, session_id="s1") == [1, 3, 5, 7, 9]
+    assert index.read(next(index.query(agent="root_agent"))) == _record(5, "s1", "root_agent")
+    index.close()
+    with open(path) as f:
+        assert all(json.loads(line)["file"] == "events.json" for line in f)
+
+
+def test_rebuild_after_rotation(tmp_path):
+    _dump(tmp_path, count=12, max_bytes=300)
+    os.remove(os.path.join(str(tmp_path), INDEX))
+    assert rebuild_index(str(tmp_path)) == 12
+    index = LogIndex(str(tmp_path))
+    assert _numbers(index) == list(range(12))
+    index.close()
+
+
+def test_rebuild_only_replaces_its_own_index(tmp_path):
+    _dump(tmp_path, count=4)
+    tag = process_tag()
+    tagged = DumpWriter(str(tmp_path), index=True, process_tag=tag)
+    tagged.write("events", _record(4, "s0"))
+    tagged.close()
+    tagged_index = os.path.join(str(tmp_path), f"index.{tag}.jsonl")
+    with open(tagged_index) as f:
+        before = f.read()
+
+    assert rebuild_index(str(tmp_path)) == 4
+    with open(tagged_index) as f:
+        assert f.read() == before
+    assert rebuild_index(str(tmp_path), tag) == 1
+    index = LogIndex(str(tmp_path))
+    assert _numbers(index) == [0, 1, 2, 3, 4]
+    index.close()
+
+
+def test_rebuild_under_a_running_writer(tmp_path):
+    writer = DumpWriter(str(tmp_path), index=True)
+    thread = threading.Thread(target=lambda: [writer.write("events", _record(i, "s0")) for i in range(60)])
+    thread.start()
+    while thread.is_alive():
+        rebuild_index(str(tmp_path))
+    thread.join()
+    writer.close()
+    # Every record is indexed once, whether by the rebuild or by the writer.
+    index = LogIndex(str(tmp_path))
+    assert _numbers(index) == list(range(60))
+    index.close()
+
+
+def test_failed_append_keeps_offsets_valid(tmp_path):
+    def failing_events():
+        yield {"author": "user"}
+        raise RuntimeError("session went away")
+
+    writer = DumpWriter(str(tmp_path), index=True)
+    writer.write("events", _record(0, "s0"))
+    try:
+        writer.write("events", dict(_record(1, "s0"), events=failing_events()))
+    except RuntimeError:
+        pass
+    writer.write("events", _record(2, "s0"))
+    index = LogIndex(str(tmp_path))
+    assert _numbers(index) == [0, 2]
+    index.close()
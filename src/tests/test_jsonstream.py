@@ -0,0 +1,102 @@
+import json
+import threading
+
+from agent_logs.encoder import append_json_record
+from agent_logs.jsonstream import iter_elements, iter_nested
+
+RECORDS = [
+    {"agent": "root_agent", "timestamp": "t0", "events": [{"text": "héllo 🌍", "n": 12345}, {"n": -1.5e3}],
+     "tail": 7},
+    {"agent": "poi_agent", "timestamp": "t1", "events": [], "state": {"k": [1, 2, {"x": None}]}},
+    {"agent": "poi_agent", "timestamp": "t2"},
+    {"agent": "root_agent", "timestamp": "t3", "events": [{"text": "x" * 300}, 42, "s", True, None]},
+]
+
+
+def _dump(path, records=RECORDS):
+    for record in records:
+        append_json_record(str(path), record)
+    return path.read_bytes()
+
+
+def _events(records=RECORDS):
+    return [(record["timestamp"], event) for record in records for event in record.get("events", [])]
+
+
+def test_elements_across_chunk_boundaries(tmp_path):
+    data = _dump(tmp_path / "events.json")
+    for chunk_size in (1, 2, 3, 7, 64, 1 << 16):
+        with open(tmp_path / "events.json", "rb") as f:
+            items = list(iter_elements(f, chunk_size=chunk_size))
+        assert [value for _, _, value in items] == RECORDS
+        assert [json.loads(data[offset:offset + size]) for offset, size, _ in items] == RECORDS
+
+
+def test_nested_across_chunk_boundaries(tmp_path):
+    data = _dump(tmp_path / "events.json")
+    for chunk_size in (1, 3, 7, 1 << 16):
+        with open(tmp_path / "events.json", "rb") as f:
+            items = list(iter_nested(f, chunk_size=chunk_size))
+        assert [(item.record["timestamp"], item.value) for item in items] == _events()
+        assert [json.loads(data[item.offset:item.offset + item.size]) for item in items] == [e for _, e in _events()]
+        # Only the fields before `events` are kept with the record.
+        assert items[0].record == {"agent": "root_agent", "timestamp": "t0"}
+
+
+def test_resume_from_an_offset(tmp_path):
+    _dump(tmp_path / "events.json")
+    with open(tmp_path / "events.json", "rb") as f:
+        items = list(iter_elements(f))
+        offset, size, _ = items[1]
+        assert [value for _, _, value in iter_elements(f, offset=offset, chunk_size=5)] == RECORDS[1:]
+        assert [value for _, _, value in iter_elements(f, offset=offset + size, chunk_size=5)] == RECORDS[2:]
+        nested = list(iter_nested(f, offset=items[3][0], chunk_size=5))
+        assert [(item.record["timestamp"], item.value) for item in nested] == _events(RECORDS[3:])
+
+
+def test_truncated_trailing_record(tmp_path):
+    data = _dump(tmp_path / "events.json")
+    cut = data.rindex(b'"xxx') + 40
+    (tmp_path / "partial.json").write_bytes(data[:cut])
+    with open(tmp_path / "partial.json", "rb") as f:
+        assert [value for _, _, value in iter_elements(f, chunk_size=16)] == RECORDS[:3]
+    with open(tmp_path / "partial.json", "rb") as f:
+        # The events of the truncated record are yielded up to the cut.
+        assert [item.value for item in iter_nested(f, chunk_size=16)] == [e for _, e in _events(RECORDS[:3])]
+
+
+def _follow(path, iterate, count, records):
+    """Read `count` items with follow=True while `records` are appended, one at a time."""
+    seen = []
+    done = threading.Event()
+
+    def reader():
+        with open(path, "rb") as f:
+            for item in iterate(f):
+                seen.append(item)
+                if len(seen) == count:
+                    break
+        done.set()
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    for record in records:
+        append_json_record(str(path), record)
+    assert done.wait(10)
+    return seen
+
+
+def test_follow_elements_while_appending(tmp_path):
+    path = tmp_path / "events.json"
+    _dump(path, RECORDS[:1])
+    more = [{"timestamp": f"t{i}", "events": [{"n": i}]} for i in range(20)]
+    seen = _follow(path, lambda f: iter_elements(f, follow=True, poll=0.005, chunk_size=8), 21, more)
+    assert [value for _, _, value in seen] == RECORDS[:1] + more
+
+
+def test_follow_nested_while_appending(tmp_path):
+    path = tmp_path / "events.json"
+    _dump(path, RECORDS[:1])
+    more = [{"timestamp": f"t{i}", "events": [{"n": i}, {"m": i}]} for i in range(10)]
+    seen = _follow(path, lambda f: iter_nested(f, follow=True, poll=0.005, chunk_size=8), 22, more)
+    assert [item.value for item in seen] == [e for _, e in _events(RECORDS[:1] + more)]
@@ -0,0 +1,21 @@
+from agent_logs.latency import load_invocations
+from agent_logs.writer import DumpWriter
+
+
+def test_tokens_from_dumped_usage_metadata(tmp_path):
+    events = [
+        {"id": "u", "author": "user", "invocation_id": "e-1", "timestamp": 1757325600.0,
+         "content": {"parts": [{"text": "hi"}]}, "usage_metadata": None},
+        {"id": "m", "author": "root_agent", "invocation_id": "e-1", "timestamp": 1757325600.5,
+         "content": {"parts": [{"text": "hello"}]},
+         "usage_metadata": {"prompt_token_count": 12, "candidates_token_count": 3, "total_token_count": 15}},
+    ]
+    writer = DumpWriter(str(tmp_path))
+    writer.write("events", {"agent": "root_agent", "timestamp": "2025-09-08_10-00-01-000", "session_id": "s",
+                            "invocation_id": "e-1", "events": events})
+    writer.close()
+
+    invocation = load_invocations(str(tmp_path))["e-1"]
+    assert invocation.session_id == "s"
+    assert invocation.tokens() == {"root_agent": {"prompt_token_count": 12, "candidates_token_count": 3,
+                                                  "total_token_count": 15}}
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import struct
+from types import SimpleNamespace
+
+from agent_with_dump.live import LiveBuffer
+
+
+def _session(session_id, count):
+    events = [SimpleNamespace(id=f"{session_id}{i}", author="user", actions=None) for i in range(count)]
+    return SimpleNamespace(id=session_id, events=events)
+
+
+async def _started():
+    buffer = LiveBuffer(lambda event: {"id": event.id}, port=0)
+    buffer.ensure_started()
+    while buffer._server is None:
+        await asyncio.sleep(0.01)
+    return buffer, buffer._server.sockets[0].getsockname()[1]
+
+
+async def _request(port, target, headers=""):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n{headers}\r\n".encode())
+    return reader, writer
+
+
+async def _response(port, target, headers=""):
+    reader, writer = await _request(port, target, headers)
+    data = await reader.read()
+    writer.close()
+    head, _, body = data.partition(b"\r\n\r\n")
+    return int(head.split()[1]), body
+
+
+def test_events_wait_for_the_requested_session():
+    async def run():
+        buffer, port = await _started()
+
+        async def publish():
+            await asyncio.sleep(0.1)
+            buffer.sync(_session("a", 1), "root_agent")
+            await asyncio.sleep(0.1)
+            buffer.sync(_session("b", 1), "root_agent")
+
+        publisher = asyncio.create_task(publish())
+        status, body = await _response(port, "/events?session=b&wait=5")
+        await publisher
+        assert status == 200
+        assert [item["event"]["id"] for item in json.loads(body)["items"]] == ["b0"]
+        buffer._server.close()
+
+    asyncio.run(run())
+
+
+def test_websocket_origins_and_frame_size():
+    async def run():
+        buffer, port = await _started()
+        upgrade = "Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+        status, _ = await _response(port, "/stream", upgrade + "Origin: http://example.com\r\n")
+        assert status == 403
+
+        reader, writer = await _request(port, "/stream", upgrade + "Origin: vscode-webview://abc\r\n")
+        assert b" 101 " in await reader.readuntil(b"\r\n\r\n")
+        # A 2^40-byte frame is refused with a close frame rather than read.
+        writer.write(struct.pack("!BBQ", 0x82, 0xFF, 1 << 40) + b"mask")
+        first, second = await asyncio.wait_for(reader.readexactly(2), 5)
+        assert first & 0x0F == 0x8
+        assert struct.unpack("!H", await reader.readexactly(second & 0x7F)) == (1009,)
+        writer.close()
+        buffer._server.close()
+
+    asyncio.run(run())
+
+
+def test_rebound_host_is_refused():
+    async def run():
+        buffer, port = await _started()
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /sessions HTTP/1.1\r\nHost: attacker.example:8000\r\n\r\n")
+        assert (await reader.read()).split()[1] == b"403"
+        writer.close()
+        buffer._server.close()
+
+    asyncio.run(run())
+
+
+def test_state_delta_is_published_as_it_was():
+    buffer = LiveBuffer(lambda event: {"id": event.id})
+    places = ["medina"]
+    event = SimpleNamespace(id="e0", author="root_agent", invocation_id="i",
+                            actions=SimpleNamespace(state_delta={"places": places}))
+    buffer.sync(SimpleNamespace(id="s", events=[event]), "root_agent")
+    # The agent keeps working on the same state objects.
+    places.append("souks")
+    items, _ = buffer.since(0, "s")
+    assert [json.loads(item.json())["type"] for item in items] == ["event", "state_delta"]
+    assert json.loads(items[1].json())["delta"] == {"places": ["medina"]}
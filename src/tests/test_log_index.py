@@ -0,0 +1,93 @@
+import shutil
+
+from log_index import LogReader, SparseIndex, build_index, index_path, read_index
+
+
+def _stamp(i):
+    return f"2025-09-08 10:{12 + i // 8:02d}:{i % 8:02d}.000"
+
+
+def _line(i, stamp=None):
+    return f"[{stamp or _stamp(i)}] line {i}\n".encode()
+
+
+def _write(index, log, numbers):
+    """Append lines to `log` as process_log.py does: noted, written, then indexed."""
+    with open(log, "ab") as f:
+        for i in numbers:
+            line = _line(i)
+            index.note(_stamp(i), len(line))
+            f.write(line)
+    index.flush()
+
+
+def _rebuilt(tmp_path, log, every):
+    """The entries of a fresh index of a copy of `log`."""
+    copy = str(tmp_path / "copy.log")
+    shutil.copy(log, copy)
+    return build_index(copy, every)
+
+
+def test_resume_indexes_the_lines_written_after_the_last_entry(tmp_path):
+    log = str(tmp_path / "agent_events.log")
+    index = SparseIndex(log, every=3)
+    _write(index, log, range(10))
+    index.close()
+    # Lines written while no index was kept, and a torn entry of a killed writer.
+    with open(log, "ab") as f:
+        f.write(b"".join(_line(i) for i in range(10, 20)))
+    with open(index_path(log), "a") as f:
+        f.write("12\t3")
+
+    for _ in range(2):  # resuming twice adds nothing the second time
+        index = SparseIndex(log, every=3)
+        index.close()
+        assert read_index(index_path(log)) == _rebuilt(tmp_path, log, 3)
+    index = SparseIndex(log, every=3)
+    _write(index, log, range(20, 24))
+    index.close()
+    assert read_index(index_path(log)) == _rebuilt(tmp_path, log, 3)
+    assert list(LogReader(log).lines(21, 2)) == [_line(21).decode().rstrip("\n"), _line(22).decode().rstrip("\n")]
+
+
+def test_resume_after_the_log_was_truncated(tmp_path):
+    log = str(tmp_path / "agent_events.log")
+    index = SparseIndex(log, every=3)
+    _write(index, log, range(20))
+    index.close()
+    with open(log, "wb") as f:
+        f.write(b"".join(_line(i) for i in range(4)))
+
+    SparseIndex(log, every=3).close()
+    entries, ordered = read_index(index_path(log))
+    assert (entries, ordered) == _rebuilt(tmp_path, log, 3)
+    assert entries[-1][0] == 3
+
+
+def test_unordered_stamps_fall_back_to_a_scan(tmp_path):
+    log = str(tmp_path / "agent_events.log")
+    # The two pipes of the one-pipe mode were stamped by separate processes.
+    stamps = ["2025-09-08 10:12:01.000", "2025-09-08 10:12:03.000", "2025-09-08 10:12:02.000",
+              "2025-09-08 10:13:04.000", "2025-09-08 10:12:02.500"]
+    with open(log, "wb") as f:
+        f.write(b"".join(_line(i, stamp) for i, stamp in enumerate(stamps)))
+
+    reader = LogReader(log, every=2)
+    assert not reader.ordered
+    with open(index_path(log)) as f:
+        assert f.read().count("#unordered") == 1
+    assert [line.split()[-1] for line in reader.range("2025-09-08 10:12:02", "2025-09-08 10:12:03")] == ["2", "4"]
+    assert [line.split()[-1] for line in reader.lines(3, 2)] == ["3", "4"]
+
+
+def test_writer_marks_the_index_unordered_once(tmp_path):
+    log = str(tmp_path / "agent_events.log")
+    index = SparseIndex(log, every=100)
+    for stamp in ("2025-09-08 10:12:02.000", "2025-09-08 10:12:01.000", "2025-09-08 10:12:00.000"):
+        index.note(stamp, 10)
+    index.close()
+    with open(index_path(log)) as f:
+        assert f.read().count("#unordered") == 1
+    assert read_index(index_path(log))[1] is False
+    # A resumed index stays unordered.
+    assert SparseIndex(log, every=100).ordered is False
@@ -0,0 +1,54 @@
+import json
+import os
+
+from agent_logs.manifest import MANIFEST, load_manifest, save_manifest, select_segments
+from agent_logs.merge import iter_stream
+from agent_logs.writer import DumpWriter
+
+
+def _record(i, session_id="s1"):
+    return {"timestamp": f"2025-09-08_10-00-{i:02d}-000", "session_id": session_id, "n": i}
+
+
+def _write(log_dir, records, **options):
+    writer = DumpWriter(str(log_dir), max_bytes=120, segment_compression="none", **options)
+    for record in records:
+        writer.write("events", record)
+    writer.close()
+
+
+def test_segments_of_the_manifest_are_selected(tmp_path):
+    _write(tmp_path, [_record(i, f"s{i % 2}") for i in range(6)])
+    manifest = load_manifest(str(tmp_path))
+    assert len(manifest["segments"]) > 1
+    assert [r["n"] for r in iter_stream(str(tmp_path), "events")] == list(range(6))
+    assert [r["n"] for r in iter_stream(str(tmp_path), "events", session_id="s1")] == [1, 3, 5]
+    assert [r["n"] for r in iter_stream(str(tmp_path), "events", start=_record(4)["timestamp"])] == [4, 5]
+
+
+def test_segments_missing_from_the_manifest_are_read(tmp_path):
+    _write(tmp_path, [_record(i) for i in range(6)])
+    manifest = load_manifest(str(tmp_path))
+    lost = manifest["segments"].pop(0)
+    save_manifest(str(tmp_path), manifest)
+
+    assert [r["n"] for r in iter_stream(str(tmp_path), "events")] == list(range(6))
+    assert [r["n"] for r in iter_stream(str(tmp_path), "events", session_id="s1")] == list(range(6))
+    # The shared live file is not in the manifest and is always selected.
+    live = os.path.join(str(tmp_path), "events.json")
+    selected = select_segments(str(tmp_path), "events", end=_record(0)["timestamp"])
+    assert selected == [os.path.join(str(tmp_path), lost["file"]), live]
+    assert select_segments(str(tmp_path), "events", session_id="s2") == [live]
+
+
+def test_compressed_segment_is_listed_once(tmp_path):
+    writer = DumpWriter(str(tmp_path), max_bytes=120)
+    for i in range(6):
+        writer.write("events", _record(i))
+    writer.close()
+    os.remove(os.path.join(str(tmp_path), MANIFEST))
+    names = [os.path.basename(p) for p in select_segments(str(tmp_path), "events")]
+    assert all(name.endswith(".json.gz") for name in names[:-1]) and names[-1] == "events.json"
+    assert [r["n"] for r in iter_stream(str(tmp_path), "events")] == list(range(6))
+    with open(os.path.join(str(tmp_path), "events.json")) as f:
+        assert json.load(f)
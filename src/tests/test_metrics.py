@@ -0,0 +1,59 @@
+import json
+from types import SimpleNamespace
+
+from agent_with_dump.metrics import (
+    LatencyHistogram, Metrics, MetricsFlusher, _bucket_bounds, _bucket_index)
+
+
+def test_buckets_cover_values_within_their_bounds():
+    previous_high = 0
+    for index in range(_bucket_index(1 << 40) + 1):
+        low, high = _bucket_bounds(index)
+        assert low == previous_high and high > low
+        # At most 1/16 of the low bound wide, past the exact buckets.
+        assert high - low <= max(1, low // 16)
+        previous_high = high
+    for value in (0, 15, 16, 17, 1000, 123456789, (1 << 40) - 1):
+        low, high = _bucket_bounds(_bucket_index(value))
+        assert low <= value < high
+
+
+def test_quantiles_are_within_a_bucket():
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.record(value * 1000)
+    assert (histogram.count, histogram.min, histogram.max) == (1000, 1000, 1000000)
+    for q in (0.5, 0.9, 0.99):
+        assert abs(histogram.quantile(q) - q * 1000000) <= q * 1000000 / 16
+    assert LatencyHistogram().quantile(0.5) is None
+
+
+def _span(kind, name, ms, **attrs):
+    return SimpleNamespace(kind=kind, name=name, duration_ns=ms * 1000000, attrs=attrs)
+
+
+def test_flusher_writes_prometheus_and_json(tmp_path):
+    metrics = Metrics()
+    metrics.observe_span(_span("model", "gemini-2.0-flash", 300, agent="root_agent", prompt_tokens=120,
+                               completion_tokens=30))
+    metrics.observe_span(_span("model", "gemini-2.0-flash", 500, agent="root_agent", error_code="429"))
+    metrics.observe_span(_span("tool", "search", 20, agent="poi_agent", error="boom"))
+    metrics.observe_span(_span("invocation", "ignored", 1))
+    metrics.observe_write("events", "events.json", 0, 2048)
+
+    flusher = MetricsFlusher(metrics, str(tmp_path), "metrics.p1", interval=3600).start()
+    flusher.close()
+    prom = (tmp_path / "metrics.p1.prom").read_text()
+    labels = 'agent="root_agent",model="gemini-2.0-flash"'
+    assert f"adk_model_calls_total{{{labels}}} 2" in prom
+    assert f"adk_model_errors_total{{{labels}}} 1" in prom
+    assert f'adk_model_tokens_total{{{labels},type="prompt"}} 120' in prom
+    assert 'adk_tool_errors_total{agent="poi_agent",tool="search"} 1' in prom
+    assert 'adk_dump_bytes_total{stream="events"} 2048' in prom
+    assert f"adk_model_latency_seconds_count{{{labels}}} 2" in prom
+    assert f"adk_model_latency_seconds_sum{{{labels}}} 0.800000" in prom
+
+    data = json.loads((tmp_path / "metrics.p1.json").read_text())
+    [model] = [h for h in data["histograms"] if h["name"] == "adk_model_latency_seconds"]
+    assert (model["count"], model["min_seconds"], model["max_seconds"]) == (2, 0.3, 0.5)
+    assert {h["name"] for h in data["histograms"]} == {"adk_model_latency_seconds", "adk_tool_latency_seconds"}
@@ -0,0 +1,64 @@
+from agent_logs.blobs import BlobStore
+from agent_with_dump.policy import ErrorBuffer, load_policy
+
+
+class _Writer:
+    def __init__(self):
+        self.written = []
+
+    def write(self, stream, record):
+        self.written.append((stream, record))
+
+
+def _capture(buffer, session_id, events, turn):
+    first = buffer.first_event(session_id, len(events))
+    buffer.add(session_id, "events", {"turn": turn, "first_event": first, "events": events[first:]},
+               event_count=len(events))
+    buffer.add(session_id, "state", {"turn": turn})
+
+
+def test_sessions_do_not_evict_each_other():
+    buffer = ErrorBuffer(size=4)
+    events = {"a": [], "b": []}
+    for turn in range(10):
+        for session_id in ("a", "b"):
+            events[session_id].append({"id": f"{session_id}{turn}"})
+            _capture(buffer, session_id, events[session_id], turn)
+    writer = _Writer()
+    buffer.flush("a", writer)
+    assert [(stream, record["turn"]) for stream, record in writer.written] == [
+        ("events", 8), ("state", 8), ("events", 9), ("state", 9)]
+    # Only the events appended since the previous capture are buffered.
+    assert writer.written[2][1]["events"] == [{"id": "a9"}]
+    assert writer.written[2][1]["first_event"] == 9
+    assert "a" not in buffer.sessions and "b" in buffer.sessions
+
+
+def test_least_recently_updated_session_is_dropped():
+    buffer = ErrorBuffer(size=4, max_sessions=2)
+    for session_id in ("a", "b", "a", "c"):
+        _capture(buffer, session_id, [{"id": 1}], 0)
+    assert list(buffer.sessions) == ["a", "c"]
+    writer = _Writer()
+    buffer.flush("b", writer)
+    assert writer.written == []
+
+
+def test_new_session_object_starts_over():
+    buffer = ErrorBuffer(size=4)
+    _capture(buffer, "a", [{"id": 1}, {"id": 2}], 0)
+    assert buffer.first_event("a", 3) == 2
+    assert buffer.first_event("a", 1) == 0
+
+
+def test_large_payloads_go_to_the_blob_store(tmp_path):
+    buffer = ErrorBuffer(size=4, blobs=BlobStore(str(tmp_path), threshold=100))
+    buffer.add("a", "events", {"events": [{"text": "x" * 1000}]})
+    encoded = buffer.sessions["a"].entries[0][1]
+    assert len(encoded) < 200 and "__blob__" in encoded
+
+
+def test_policy_ring_buffer_settings():
+    policy = load_policy('{"ring_buffer_size": 8, "ring_buffer_sessions": 2, "agents": {"a": {"mode": "on_error"}}}')
+    assert (policy.ring_buffer_size, policy.ring_buffer_sessions) == (8, 2)
+    assert policy.on_error("a") and not policy.on_error("b")
@@ -0,0 +1,124 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from log_index import SparseIndex, read_index
+from process_log import BatchWriter, StructuredWriter, multiplex
+
+
+def _write(tmp_path, lines):
+    """The writer after `lines`, and the records it wrote."""
+    path = tmp_path / "log.jsonl"
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+    writer = StructuredWriter(fd)
+    for timestamp, line in lines:
+        writer.add(timestamp, "stderr", line)
+    writer.flush()
+    os.close(fd)
+    return writer, [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def _log(message, logger="httpx:1025"):
+    return f"2025-09-08 10:12:15,000 - DEBUG - {logger} - {message}"
+
+
+def test_http_requests_pair_with_their_connection(tmp_path):
+    _, records = _write(tmp_path, [
+        ("2025-09-08 10:12:15.100", _log("connect_tcp.started host='generativelanguage.googleapis.com' port=443",
+                                         "_trace.py:47")),
+        ("2025-09-08 10:12:15.400", _log("Starting new HTTPS connection (1): oauth2.googleapis.com:443",
+                                         "connectionpool.py:1049")),
+        ("2025-09-08 10:12:15.550", _log('https://oauth2.googleapis.com:443 "POST /token HTTP/1.1" 200 None',
+                                         "connectionpool.py:544")),
+        ("2025-09-08 10:12:16.350", _log('HTTP Request: POST https://generativelanguage.googleapis.com/v1beta/'
+                                         'models/gemini-2.0-flash:generateContent "HTTP/1.1 200 OK"')),
+        ("2025-09-08 10:12:17.000", _log('HTTP Request: POST https://generativelanguage.googleapis.com/v1beta/'
+                                         'models/gemini-2.0-flash:generateContent "HTTP/1.1 200 OK"')),
+    ])
+    requests = [r for r in records if r.get("event") == "http_client"]
+    assert [(r["host"], r.get("latency_ms")) for r in requests] == [
+        ("oauth2.googleapis.com", 150), ("generativelanguage.googleapis.com", 1250),
+        ("generativelanguage.googleapis.com", None)]
+
+
+def test_unmatched_starts_are_bounded(tmp_path):
+    lines = [(f"2025-09-08 10:12:15.{i:03d}",
+              _log(f"Starting new HTTPS connection (1): host{i}.example:443", "connectionpool.py:1049"))
+             for i in range(1000)]
+    writer, records = _write(tmp_path, lines)
+    assert len(records) == 1000
+    assert len(writer.starts) == 256
+
+
+@pytest.fixture
+def _signals():
+    # multiplex() ignores Ctrl+C and forwards SIGTERM to the child.
+    saved = {signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)}
+    yield
+    for signum, handler in saved.items():
+        signal.signal(signum, handler)
+
+
+_CHILD = """
+import sys
+for i in range(3000):
+    print(f"out {i}")
+    sys.stderr.write(f"err {i}\\n")
+print("DEBUG - debug line")
+sys.stdout.write("no newline")
+sys.exit(3)
+"""
+
+
+def test_multiplex_logs_and_indexes_both_pipes(tmp_path, _signals):
+    log, jsonl = str(tmp_path / "agent_events.log"), str(tmp_path / "agent_events.jsonl")
+    fd = os.open(log, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    jsonl_fd = os.open(jsonl, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    index = SparseIndex(log, every=100)
+    writers = [BatchWriter(fd, 64, index), StructuredWriter(jsonl_fd, 64)]
+    assert multiplex([sys.executable, "-c", _CHILD], writers, flush_interval=0.01) == 3
+    index.close()
+    os.close(fd)
+    os.close(jsonl_fd)
+
+    with open(log, "rb") as f:
+        data = f.read()
+    lines = data.decode().splitlines()
+    assert len(lines) == 6002
+    # Each pipe keeps its order; the last line is logged without its newline.
+    assert [line.split("] ", 1)[1] for line in lines if "][" not in line] == [f"out {i}" for i in range(3000)] + [
+        "no newline"]
+    assert [line.split("] ", 1)[1] for line in lines if "][E]" in line] == [f"err {i}" for i in range(3000)]
+    assert [line for line in lines if "][P]" in line][0].endswith("] DEBUG - debug line")
+
+    entries, ordered = read_index(log + ".idx")
+    assert ordered and entries[0][:2] == (0, 0) and len(entries) >= 60
+    for line_number, offset, timestamp in entries:
+        assert data[offset:].startswith(f"[{timestamp}]".encode())
+        assert data[:offset].count(b"\n") == line_number
+
+    with open(jsonl) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 6002
+    assert {record["kind"] for record in records} == {"text"}
+
+
+def test_stdin_mode_writes_every_record_at_eof(tmp_path):
+    log, jsonl = tmp_path / "agent_events.log", tmp_path / "agent_events.jsonl"
+    lines = ['INFO:     127.0.0.1:49834 - "GET /list-apps HTTP/1.1" 200 OK',
+             _log("Response received from the model.", "google_llm.py:120"),
+             "LLM Response:",
+             "-----------------------------------------------------------"]
+    script = os.path.join(os.path.dirname(__file__), os.pardir, "python", "process_log.py")
+    subprocess.run([sys.executable, script, "--source", "stderr", "--output", str(log), "--jsonl", str(jsonl)],
+                   input="\n".join(lines) + "\n", text=True, check=True)
+
+    assert [line.split("][E] ", 1)[1] for line in log.read_text().splitlines()] == lines
+    records = [json.loads(line) for line in jsonl.read_text().splitlines()]
+    assert [record["kind"] for record in records] == ["access", "log"]
+    # The last record is still open to continuation lines when stdin ends.
+    assert records[1]["body"] == "\n".join(lines[2:])
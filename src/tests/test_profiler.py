@@ -0,0 +1,66 @@
+import asyncio
+import json
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import pytest
+
+from agent_with_dump.profiler import InvocationProfiler
+
+
+class _Agent:
+    """Stand-in for an ADK agent: callback fields and a run_async that calls them."""
+
+    def __init__(self, fail=None):
+        self.before_agent_callback = None
+        self.after_agent_callback = None
+        self.fail = fail
+
+    async def run_async(self, parent_context):
+        context = SimpleNamespace(invocation_id=parent_context.invocation_id)
+        for callback in self.before_agent_callback:
+            callback(context)
+        time.sleep(0.05)
+        if self.fail:
+            raise self.fail
+        yield "event"
+        for callback in self.after_agent_callback:
+            callback(context)
+
+
+def _run(agent, invocation_id="e-1"):
+    async def consume():
+        return [event async for event in agent.run_async(SimpleNamespace(invocation_id=invocation_id))]
+    return asyncio.run(consume())
+
+
+def _summary(tmp_path, invocation_id="e-1"):
+    path = tmp_path / f"{invocation_id}.json"
+    for _ in range(100):
+        if path.exists():
+            return json.loads(path.read_text())
+        time.sleep(0.02)
+    raise AssertionError(f"{path} was not written")
+
+
+def test_profile_of_a_successful_run(tmp_path):
+    profiler = InvocationProfiler(str(tmp_path), sample_rate=1.0, interval=0.002)
+    agent = _Agent()
+    profiler.instrument(agent, "root_agent")
+    assert _run(agent) == ["event"]
+    summary = _summary(tmp_path)
+    assert summary["incomplete"] is False and summary["samples"] > 0
+    assert (tmp_path / "e-1.folded").read_text()
+    assert not tracemalloc.is_tracing()
+
+
+def test_profile_of_a_failed_run_is_ended(tmp_path):
+    profiler = InvocationProfiler(str(tmp_path), sample_rate=1.0, interval=0.002)
+    agent = _Agent(fail=RuntimeError("model unavailable"))
+    profiler.instrument(agent, "root_agent")
+    with pytest.raises(RuntimeError):
+        _run(agent)
+    assert profiler.active is None
+    assert not tracemalloc.is_tracing()
+    assert _summary(tmp_path)["incomplete"] is True
@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("google.adk.runners")
+from google.adk.models.llm_request import LlmRequest  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from agent_logs.writer import DumpWriter  # noqa: E402
+from agent_with_dump.replay import StubLlm, extract_script, extract_sessions, use_stub_model  # noqa: E402
+
+
+def _event(event_id, author, part, role="model"):
+    return {"id": event_id, "author": author, "content": {"role": role, "parts": [part]}}
+
+
+_TRANSFER = {"function_call": {"id": "adk-1", "name": "transfer_to_agent", "args": {"agent_name": "poi_agent"}}}
+
+
+def _dump(log_dir):
+    events = [
+        _event("e1", "user", {"text": "hi"}, role="user"),
+        _event("e2", "root_agent", _TRANSFER),
+        _event("e3", "root_agent", {"function_response": {"id": "adk-1", "name": "transfer_to_agent",
+                                                          "response": {}}}, role="user"),
+        _event("e4", "poi_agent", {"function_call": {"id": "adk-2", "name": "search", "args": {"q": "souks"}}}),
+        _event("e5", "poi_agent", {"function_response": {"id": "adk-2", "name": "search",
+                                                         "response": {"result": "x"}}}, role="user"),
+        _event("e6", "poi_agent", {"text": "Visit the souks."}),
+        _event("e7", "user", {"text": "thanks"}, role="user"),
+        _event("e8", "poi_agent", {"text": "Enjoy.", "thought": False}),
+    ]
+    writer = DumpWriter(str(log_dir))
+    # Every record repeats the history of its session.
+    writer.write("events", {"agent": "root_agent", "timestamp": "2025-09-08_10-00-00-000", "session_id": "s",
+                            "events": events[:6]})
+    writer.write("events", {"agent": "root_agent", "timestamp": "2025-09-08_10-00-01-000", "session_id": "s",
+                            "events": events})
+    writer.close()
+
+
+def _generate(llm, contents):
+    async def run():
+        return [response async for response in llm.generate_content_async(LlmRequest(contents=contents))]
+
+    [response] = asyncio.run(run())
+    return response.content.parts
+
+
+def test_script_holds_the_responses_of_each_agent_per_turn(tmp_path):
+    _dump(tmp_path)
+    assert extract_sessions(str(tmp_path)) == [["hi", "thanks"]]
+    assert extract_script(str(tmp_path)) == {
+        "root_agent": {"hi": [[{"function_call": {"name": "transfer_to_agent", "args": {"agent_name": "poi_agent"}}}]]},
+        "poi_agent": {
+            "hi": [[{"function_call": {"name": "search", "args": {"q": "souks"}}}], [{"text": "Visit the souks."}]],
+            "thanks": [[{"text": "Enjoy."}]],
+        },
+    }
+
+
+def test_stub_replays_calls_and_transfers_step_by_step(tmp_path):
+    _dump(tmp_path)
+    script = extract_script(str(tmp_path))
+    root = StubLlm(script=script["root_agent"])
+    poi = StubLlm(script=script["poi_agent"])
+    user = types.Content(role="user", parts=[types.Part(text="hi")])
+
+    [transfer] = _generate(root, [user])
+    assert transfer.function_call.name == "transfer_to_agent"
+    assert transfer.function_call.args == {"agent_name": "poi_agent"}
+
+    # The sub-agent sees the transfer as context, then its own call and the tool response.
+    context = types.Content(role="user", parts=[types.Part(text="For context: [root_agent] called tool ...")])
+    [call] = _generate(poi, [user, context])
+    assert call.function_call.name == "search"
+    response = types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+        name="search", response={"result": "x"}))])
+    [answer] = _generate(poi, [user, context, types.Content(role="model", parts=[call]), response])
+    assert answer.text == "Visit the souks."
+
+    # Past the recording, and for unknown messages, the stub answers with a text.
+    [extra] = _generate(root, [user, types.Content(role="model", parts=[transfer])])
+    assert extra.text.startswith("(stub)")
+    [other] = _generate(poi, [types.Content(role="user", parts=[types.Part(text="bonjour")])])
+    assert other.text == "(stub) bonjour"
+
+
+def test_use_stub_model_gives_each_agent_its_script():
+    class _Agent(SimpleNamespace):
+        model_fields = {"model": None}
+
+    poi = _Agent(name="poi_agent", model="gemini", sub_agents=[], tools=[])
+    root = _Agent(name="root_agent", model="gemini", sub_agents=[poi], tools=[])
+    use_stub_model(root, script={"poi_agent": {"hi": [[{"text": "x"}]]}})
+    assert root.model.script == {}
+    assert poi.model.script == {"hi": [[{"text": "x"}]]}
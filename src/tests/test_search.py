@@ -0,0 +1,72 @@
+import json
+import os
+
+from agent_logs import search
+from agent_logs.search import SearchIndex
+from agent_logs.writer import DumpWriter
+
+
+def _write(writer, i):
+    writer.write("events", {"agent": "root_agent", "timestamp": f"2025-09-08_10-00-{i:02d}-000",
+                            "session_id": "s", "events": [{"id": f"e{i}", "author": "root_agent",
+                                                           "timestamp": 1757325600 + i,
+                                                           "content": {"parts": [{"text": f"word{i}"}]}}]})
+
+
+def test_index_across_rotation(tmp_path):
+    writer = DumpWriter(str(tmp_path), max_bytes=600, segment_compression="none")
+    _write(writer, 0)
+    index = SearchIndex(str(tmp_path))
+    assert index.update() == 1
+    for i in range(1, 8):
+        _write(writer, i)
+    assert any(name.startswith("events.0") for name in os.listdir(tmp_path))
+
+    index = SearchIndex(str(tmp_path))
+    assert index.update() == 7
+    assert sorted(doc["event_id"] for doc in index.docs) == [f"e{i}" for i in range(8)]
+    for i in range(8):
+        [hit] = index.search(f"word{i}")
+        assert index.read(hit)["id"] == f"e{i}"
+
+    _write(writer, 8)
+    writer.close()
+    assert index.update() == 1
+    assert [hit["event_id"] for hit in index.search("word8")] == ["e8"]
+
+
+def test_postings_are_read_per_term_across_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(search, "MAX_SEGMENTS", 2)
+    writer = DumpWriter(str(tmp_path))
+    index = SearchIndex(str(tmp_path))
+    for i in range(4):
+        _write(writer, i)
+        assert index.update() == 1
+    writer.close()
+    names = sorted(os.listdir(tmp_path / "search"))
+    assert [name for name in names if name.startswith("seg-")] == [
+        "seg-000004.json", "seg-000004.postings", "seg-000005.json", "seg-000005.postings"]
+    with open(tmp_path / "search" / "seg-000004.json") as f:
+        assert "postings" not in json.load(f)
+
+    index = SearchIndex(str(tmp_path))
+    assert [hit["event_id"] for hit in index.search("word1 OR word3")] == ["e3", "e1"]
+    assert [hit["event_id"] for hit in index.search("-word1")] == ["e3", "e2", "e0"]
+
+
+def test_segments_of_older_versions_are_read(tmp_path):
+    writer = DumpWriter(str(tmp_path))
+    _write(writer, 0)
+    writer.close()
+    os.makedirs(tmp_path / "search")
+    doc = {"file": "events.json", "file_key": "k", "record_offset": 2, "offset": None, "size": None,
+           "session_id": "s", "event_id": "e0", "invocation_id": None, "author": "root_agent", "timestamp": 1}
+    with open(tmp_path / "search" / "seg-000001.json", "w") as f:
+        json.dump({"docs": [doc], "postings": {"word0": [[0, [0]]]}}, f)
+
+    index = SearchIndex(str(tmp_path))
+    assert [hit["event_id"] for hit in index.search("word0")] == ["e0"]
+    _write(DumpWriter(str(tmp_path)), 1)
+    assert index.update() == 1
+    index.compact()
+    assert [hit["event_id"] for hit in SearchIndex(str(tmp_path)).search("word0 OR word1")] == ["e1", "e0"]
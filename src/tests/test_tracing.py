@@ -0,0 +1,88 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from agent_with_dump.tracing import Tracer, instrument_agent, make_exporter
+
+
+class _Agent:
+    """Stand-in for an ADK agent: callback fields and a run_async that calls them."""
+
+    def __init__(self, fail=None):
+        self.before_agent_callback = None
+        self.after_agent_callback = None
+        self.before_model_callback = None
+        self.after_model_callback = None
+        self.before_tool_callback = None
+        self.after_tool_callback = None
+        self.fail = fail
+
+    async def run_async(self, parent_context):
+        context = SimpleNamespace(invocation_id=parent_context.invocation_id)
+        for callback in self.before_agent_callback:
+            callback(context)
+        for callback in self.before_model_callback:
+            callback(context, SimpleNamespace(model="gemini"))
+        if self.fail:
+            raise self.fail
+        for callback in self.after_model_callback:
+            callback(context, SimpleNamespace(usage_metadata=None, error_code=None))
+        yield "event"
+        for callback in self.after_agent_callback:
+            callback(context)
+
+
+def _run(agent, invocation_id="e-1"):
+    async def consume():
+        return [event async for event in agent.run_async(SimpleNamespace(invocation_id=invocation_id))]
+    return asyncio.run(consume())
+
+
+def _tracer():
+    spans = []
+    tracer = Tracer()
+    tracer.add_listener(spans.append)
+    return tracer, spans
+
+
+def test_spans_of_a_successful_run():
+    tracer, spans = _tracer()
+    agent = _Agent()
+    instrument_agent(tracer, agent, "root_agent")
+    _run(agent)
+    assert [(span.kind, span.attrs.get("incomplete")) for span in spans] == [("model", None), ("agent", None)]
+    assert spans[0].parent is spans[1]
+    assert not tracer._open
+
+
+def test_spans_of_a_failed_run_are_ended():
+    tracer, spans = _tracer()
+    agent = _Agent(fail=RuntimeError("model unavailable"))
+    instrument_agent(tracer, agent, "root_agent")
+    with pytest.raises(RuntimeError):
+        _run(agent)
+    assert [(span.kind, span.attrs["error"], span.attrs["exception"]) for span in spans] == [
+        ("model", True, "RuntimeError"), ("agent", True, "RuntimeError")]
+    assert not tracer._open
+
+
+def test_other_agents_spans_stay_open():
+    tracer, spans = _tracer()
+    parent = tracer.start("agent", "root_agent", ("agent", "e-1", "root_agent"), "e-1")
+    agent = _Agent(fail=RuntimeError())
+    instrument_agent(tracer, agent, "sub_agent")
+    with pytest.raises(RuntimeError):
+        _run(agent)
+    assert [span.name for span in spans] == ["gemini", "sub_agent"]
+    assert list(tracer._open.values()) == [parent]
+
+
+def test_trace_file_per_process(tmp_path):
+    exporter = make_exporter("chrome", str(tmp_path), lambda stream: f"{stream}.p1-20250908101215")
+    tracer = Tracer(exporter)
+    with tracer.span("dump", "root_agent"):
+        pass
+    with open(tmp_path / "trace.p1-20250908101215.json") as f:
+        assert [event["name"] for event in json.load(f)] == ["dump:root_agent"]
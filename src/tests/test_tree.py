@@ -0,0 +1,49 @@
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("google.adk")
+from google.adk.agents import BaseAgent  # noqa: E402
+
+from agent_with_dump.tree import find_root_agent, iter_agents  # noqa: E402
+
+
+class _Inner(BaseAgent):
+    pass
+
+
+def _agent(name, sub_agents=(), tools=()):
+    return SimpleNamespace(name=name, sub_agents=list(sub_agents), tools=list(tools))
+
+
+def test_every_agent_is_visited_once_parents_first():
+    shared = _agent("shared")
+    inner = _Inner(name="inner")
+    left = _agent("left", [shared], [SimpleNamespace(agent=inner), SimpleNamespace(name="search")])
+    right = _agent("right", [shared])
+    root = _agent("root", [left, right])
+    # A cycle back to the root, as a misconfigured graph could have.
+    shared.sub_agents.append(root)
+    assert [agent.name for agent in iter_agents(root)] == ["root", "left", "shared", "inner", "right"]
+
+
+def test_tool_agents_must_be_agents():
+    root = _agent("root", tools=[SimpleNamespace(agent="not an agent")])
+    assert [agent.name for agent in iter_agents(root)] == ["root"]
+
+
+def test_root_agent_is_found_in_the_adk_layout(tmp_path, monkeypatch):
+    package = tmp_path / "tree_test_app"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "agent.py").write_text("root_agent = 'the root'\n")
+    (tmp_path / "not_an_app").mkdir()
+    monkeypatch.syspath_prepend(str(tmp_path))
+    try:
+        assert find_root_agent(str(tmp_path)) == "the root"
+        with pytest.raises(LookupError):
+            find_root_agent(str(tmp_path / "not_an_app"))
+    finally:
+        sys.modules.pop("tree_test_app.agent", None)
+        sys.modules.pop("tree_test_app", None)
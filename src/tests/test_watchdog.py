@@ -0,0 +1,38 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from agent_with_dump.watchdog import LoopWatchdog
+
+
+def _blocking_tool():
+    time.sleep(0.3)
+
+
+class _Agent:
+    before_tool_callback = None
+
+
+def test_blocked_loop_is_reported_with_the_running_callback(tmp_path):
+    log = tmp_path / "loop_lag.log"
+    watchdog = LoopWatchdog(str(log), threshold=0.05)
+    agent = _Agent()
+    watchdog.instrument(agent, "poi_agent")
+
+    async def run():
+        await asyncio.sleep(0.1)
+        for hook in agent.before_tool_callback:
+            hook(SimpleNamespace(name="search"), {}, SimpleNamespace(invocation_id="e-1"))
+        await asyncio.sleep(0.1)
+        assert not log.exists()  # sleeping is not blocking
+        _blocking_tool()
+        await asyncio.sleep(0.2)
+
+    asyncio.run(run())
+    text = log.read_text()
+    assert watchdog.stalls == 1
+    assert "event loop blocked for" in text
+    assert "(agent=poi_agent invocation=e-1 in tool:search)" in text
+    assert "_blocking_tool" in text
+    assert "event loop unblocked after" in text
+    assert watchdog.max_lag >= 0.2
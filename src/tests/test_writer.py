@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+
+from agent_logs.index import LogIndex
+from agent_logs.manifest import load_manifest
+from agent_logs.merge import iter_stream
+from agent_logs.writer import DumpWriter
+
+RECORDS = 40
+
+
+def _dump(log_dir, worker, start):
+    writer = DumpWriter(log_dir, max_bytes=200, index=True)
+    start.wait()
+    for i in range(RECORDS):
+        writer.write("events", {"timestamp": f"2025-09-08_10-00-{i:02d}-{worker:03d}",
+                                "session_id": f"s{worker}", "n": i, "worker": worker})
+    writer.close()
+
+
+def test_concurrent_writers_share_rotated_files(tmp_path):
+    log_dir = str(tmp_path)
+    start = multiprocessing.get_context("fork").Event()
+    workers = [multiprocessing.get_context("fork").Process(target=_dump, args=(log_dir, w, start))
+               for w in range(2)]
+    for worker in workers:
+        worker.start()
+    start.set()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    manifest = load_manifest(log_dir)
+    on_disk = sorted(name for name in os.listdir(log_dir) if name.startswith("events.0"))
+    assert sorted(segment["file"] for segment in manifest["segments"]) == on_disk
+    # Shared segments are summarised from their content.
+    assert sum(segment["records"] for segment in manifest["segments"]) < 2 * RECORDS
+    assert all(set(segment["session_ids"]) <= {"s0", "s1"} for segment in manifest["segments"])
+    assert "live" not in manifest or manifest["live"] == []
+    for w in range(2):
+        records = list(iter_stream(log_dir, "events", session_id=f"s{w}"))
+        assert [r["n"] for r in records] == list(range(RECORDS))
+    timestamps = [r["timestamp"] for r in iter_stream(log_dir, "events")]
+    assert timestamps == sorted(timestamps) and len(timestamps) == 2 * RECORDS
+
+    index = LogIndex(log_dir)
+    assert sorted((r["worker"], r["n"]) for r in index.records()) == [
+        (w, i) for w in range(2) for i in range(RECORDS)]
+    index.close()
+
+
+def test_per_process_layout(tmp_path):
+    writer = DumpWriter(str(tmp_path), max_bytes=200, segment_compression="none", process_tag="p1-20250908101215")
+    for i in range(10):
+        writer.write("events", {"timestamp": f"2025-09-08_10-00-{i:02d}-000", "session_id": "s", "n": i})
+    writer.close()
+    manifest = load_manifest(str(tmp_path), "manifest.p1-20250908101215.json")
+    assert manifest["live"][0]["file"] == "events.p1-20250908101215.json"
+    assert sum(s["records"] for s in manifest["segments"] + manifest["live"]) == 10
+    assert [r["n"] for r in iter_stream(str(tmp_path), "events", session_id="s")] == list(range(10))
+
+
+def test_records_appended_out_of_order_are_read_in_order(tmp_path):
+    # Stamped before the lock: two processes can append in the other order.
+    writer = DumpWriter(str(tmp_path), max_bytes=300, segment_compression="none")
+    for i in (1, 0, 3, 2, 5, 4):
+        writer.write("events", {"timestamp": f"2025-09-08_10-00-{i:02d}-000", "session_id": "s", "n": i})
+    writer.close()
+    assert [r["n"] for r in iter_stream(str(tmp_path), "events")] == list(range(6))